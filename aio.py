@@ -0,0 +1,307 @@
+import asyncio
+import os
+import time
+import logging
+import serial
+from modem.at import (
+    ATResponse,
+    DEFAULT_TIMEOUT,
+    PROMPT,
+    CTRL_Z,
+    chain_commands,
+    chained_line,
+    final_status,
+    response_prefixes,
+    split_chained,
+    split_failed,
+)
+from modem.reader import ANY, is_urc
+from modem.tracing import TRACE
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSerial:
+    """Non-blocking serial port whose fd is registered with the event loop."""
+
+    def __init__(self, port, baudrate=115200):
+        # timeout=0 makes pyserial open the tty with O_NONBLOCK; it is only
+        # used to configure the line, all I/O goes through the raw fd.
+        self.serial_conn = serial.Serial(port=port, baudrate=baudrate, timeout=0)
+        self.fd = self.serial_conn.fileno()
+        self.port = port
+        self._trace = TRACE.channel(port)
+
+    @classmethod
+    def from_interface(cls, modem):
+        return cls(modem.ATCommand, modem.baudrate)
+
+    def read(self, size=4096) -> bytes:
+        """What is available, b"" if nothing; ConnectionError once the
+        device is gone."""
+        try:
+            data = os.read(self.fd, size)
+        except BlockingIOError:
+            return b""
+        if not data:
+            raise ConnectionError(f"{self.port}: end of file")
+        self._trace.rx(data)
+        return data
+
+    async def write(self, data, payload=False):
+        loop = asyncio.get_running_loop()
+        self._trace.tx(data, payload)
+        view = memoryview(data)
+        while view:
+            try:
+                written = os.write(self.fd, view)
+                view = view[written:]
+            except BlockingIOError:
+                ready = loop.create_future()
+                loop.add_writer(self.fd, ready.set_result, None)
+                try:
+                    await ready
+                finally:
+                    loop.remove_writer(self.fd)
+
+    def close(self):
+        if self.serial_conn.is_open:
+            self.serial_conn.close()
+
+
+class AsyncAT:
+    """asyncio counterpart to AT.
+
+    Concurrent callers of command() are served in FIFO order by a single
+    worker task, so any number of coroutines can share one AT port. URCs are
+    dispatched to subscribers as they arrive.
+
+        at = await AsyncAT.open("/dev/ttyUSB2")
+        csq = await at.command("AT+CSQ")
+    """
+
+    def __init__(self, port: AsyncSerial):
+        self.port = port
+        self._buffer = bytearray()
+        self._lines = None
+        self._requests = None
+        self._worker = None
+        self._error = None
+        self._in_flight = False
+        self._own_prefixes = ()
+        self._prompt = False
+        self._subscribers = {}
+
+    @classmethod
+    async def open(cls, port, baudrate=115200):
+        at = cls(AsyncSerial(port, baudrate))
+        await at.start()
+        return at
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._lines = asyncio.Queue()
+        self._requests = asyncio.Queue()
+        self._error = None
+        loop.add_reader(self.port.fd, self._on_readable)
+        self._worker = loop.create_task(self._run())
+        logger.info(f"Async AT client started on {self.port.port}.")
+
+    async def close(self):
+        worker = self._worker
+        if worker is not None:
+            self._stop(f"{self.port.port} closed")
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self.port.close()
+
+    def _stop(self, reason):
+        """Stop reading and the worker; the command in flight and the
+        queued ones fail with ConnectionError(reason)."""
+        self._error = reason
+        self._worker.cancel()
+        self._worker = None
+        asyncio.get_running_loop().remove_reader(self.port.fd)
+        while not self._requests.empty():
+            _, future = self._requests.get_nowait()
+            if not future.done():
+                future.set_exception(ConnectionError(reason))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # --- public API ---------------------------------------------------------
+
+    async def command(self, cmd, timeout=DEFAULT_TIMEOUT, data=None) -> ATResponse:
+        """Queue cmd behind any commands already waiting and return its
+        ATResponse. timeout counts from when the command is written."""
+        return await self._submit(lambda: self._exchange(cmd, timeout, data))
+
+    async def batch(self, commands, timeout=DEFAULT_TIMEOUT) -> list:
+        """Coroutine version of AT.batch(): one ATResponse per command,
+        with chainable commands sharing command lines. The whole batch is
+        one job for the worker, so no other command runs in between."""
+        return await self._submit(lambda: self._batch(commands, timeout))
+
+    async def _submit(self, job):
+        if self._worker is None:
+            raise ConnectionError(self._error or f"{self.port.port} is not open")
+        future = asyncio.get_running_loop().create_future()
+        await self._requests.put((job, future))
+        return await future
+
+    async def send_cmd(self, cmd, wait=DEFAULT_TIMEOUT):
+        return (await self.command(cmd, timeout=wait)).text
+
+    def subscribe(self, prefix, callback):
+        """Call callback(line) for URCs starting with prefix ("*" = all).
+        Coroutine functions are scheduled as tasks."""
+        self._subscribers.setdefault(prefix, []).append(callback)
+        return callback
+
+    def unsubscribe(self, prefix, callback):
+        callbacks = self._subscribers.get(prefix, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    async def wait_for(self, prefix, timeout):
+        """Wait for the next URC starting with prefix; None on timeout."""
+        future = asyncio.get_running_loop().create_future()
+
+        def resolve(line):
+            if not future.done():
+                future.set_result(line)
+
+        self.subscribe(prefix, resolve)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.unsubscribe(prefix, resolve)
+
+    # --- internals ----------------------------------------------------------
+
+    def _on_readable(self):
+        try:
+            data = self.port.read()
+        except OSError as e:
+            # EOF or EIO: the modem reset or was unplugged
+            logger.error(f"Async AT client on {self.port.port} stopped: {e}")
+            self._stop(f"{self.port.port} lost: {e}")
+            return
+        if not data:
+            return
+        self._buffer += data
+        idx = self._buffer.find(b"\n")
+        while idx >= 0:
+            line = self._buffer[:idx].decode(errors="ignore").strip()
+            del self._buffer[: idx + 1]
+            if line:
+                self._dispatch(line)
+            idx = self._buffer.find(b"\n")
+        if self._prompt and self._buffer.strip().startswith(PROMPT.encode()):
+            self._prompt = False
+            self._buffer.clear()
+            self._lines.put_nowait(PROMPT)
+
+    def _dispatch(self, line):
+        if not is_urc(line, self._in_flight, self._own_prefixes):
+            self._lines.put_nowait(line)
+            if final_status(line):
+                self._in_flight = False  # what follows is unsolicited
+            return
+        callbacks = [
+            cb
+            for prefix, cbs in self._subscribers.items()
+            if prefix == ANY or line.startswith(prefix)
+            for cb in cbs
+        ]
+        if not callbacks:
+            logger.debug(f"Unhandled URC: {line}")
+        for callback in callbacks:
+            try:
+                result = callback(line)
+                if asyncio.iscoroutine(result):
+                    asyncio.get_running_loop().create_task(result)
+            except Exception as e:
+                logger.error(f"URC callback failed for {line!r}: {e}")
+
+    async def _run(self):
+        while True:
+            job, future = await self._requests.get()
+            if future.cancelled():
+                continue
+            try:
+                result = await job()
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.set_exception(ConnectionError(self._error or f"{self.port.port} closed"))
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            finally:
+                self._in_flight = False
+                self._own_prefixes = ()
+                self._prompt = False
+            if not future.done():
+                future.set_result(result)
+
+    async def _batch(self, commands, timeout):
+        results = []
+        for group in chain_commands(commands):
+            if len(group) == 1:
+                results.append(await self._exchange(group[0], timeout, None))
+                continue
+            response = await self._exchange(chained_line(group), timeout, None)
+            if response.status == "ERROR":
+                done, resume = split_failed(group, response)
+                results += done + [await self._exchange(cmd, timeout, None) for cmd in group[resume:]]
+            else:
+                results += split_chained(group, response)
+        return results
+
+    async def _exchange(self, cmd, timeout, data):
+        while not self._lines.empty():
+            self._lines.get_nowait()
+        self._in_flight = True
+        self._own_prefixes = response_prefixes(cmd)
+        self._prompt = data is not None
+
+        start = time.monotonic()
+        deadline = start + timeout
+        await self.port.write((cmd + "\r").encode())
+
+        lines = []
+        pending = data
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                line = await asyncio.wait_for(self._lines.get(), remaining)
+            except asyncio.TimeoutError:
+                logger.warning(f"{cmd} timed out after {timeout}s")
+                return ATResponse(cmd, "TIMEOUT", lines, time.monotonic() - start)
+            if line == cmd:
+                continue
+            if line == PROMPT and pending is not None:
+                payload = pending if isinstance(pending, bytes) else pending.encode()
+                await self.port.write(payload + CTRL_Z.encode(), payload=True)
+                pending = None
+                continue
+            status = final_status(line)
+            if status:
+                response = ATResponse(
+                    cmd, status, lines, time.monotonic() - start, final=line
+                )
+                logger.debug(f"{cmd} -> {response.status} in {response.elapsed * 1000:.0f} ms")
+                return response
+            lines.append(line)
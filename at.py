@@ -1,87 +1,582 @@
 import time
+import queue
+import select
 import serial
+import threading
 import logging
 from modem.gps import GPSInfo
+from modem.sms import SMSSender
+from modem.provision import Profile
+from modem.metrics import AT_RESULTS, AT_SECONDS, PORT_BYTES, command_name
+from modem.tracing import TRACE
 
-# Set up logging
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
+
+DEFAULT_TIMEOUT = 5
+
+# Final result codes that terminate an AT command response
+FINAL_OK = ("OK", "SEND OK")
+FINAL_ERROR = (
+    "ERROR",
+    "SEND FAIL",
+    "+CME ERROR:",
+    "+CMS ERROR:",
+    "NO CARRIER",
+    "NO DIALTONE",
+    "NO ANSWER",
+    "BUSY",
+)
+PROMPT = ">"
+CTRL_Z = "\x1a"
+CONNECT = "CONNECT"  # the modem switched to data mode
+WRITE_CHUNK = 65536  # bytes per write() when streaming data-mode payloads
+MAX_LINE = 556  # longest command line the RM520N accepts, "AT" included
+# Extended commands that cannot be chained (see chainable())
+UNCHAINABLE = (
+    "+CMGS",
+    "+CMGW",
+    "+CMGR",
+    "+CMGL",
+    "+CGSN",
+    "+GSN",
+    "+CFUN=",
+    "+QPOWD",
+    "+CPIN=",  # credentials: a retry would cost a SIM attempt
+    "+CLCK=",
+    "+CPWD=",
+    "+QISEND",
+    "+QIOPEN",
+    "+QIRD",
+    "+QFTPGET",
+    "+QFTPPUT",
+    "+QHTTPURL",
+    "+QHTTPGET",
+    "+QHTTPPOST",
+    "+QHTTPREAD",
+)
+
+
+def final_status(line):
+    """Return "OK" or "ERROR" if line is a final result code, else None."""
+    if line in FINAL_OK:
+        return "OK"
+    for code in FINAL_ERROR:
+        if line.startswith(code):
+            return "ERROR"
+    return None
+
+
+def response_prefixes(cmd):
+    """Prefixes a command's own response lines start with.
+
+    "AT+CREG?" answers with "+CREG: ...", so a "+CREG:" line that arrives
+    while AT+CREG? is in flight belongs to the command, not to the URC
+    subscribers. Chained commands ("AT+CSQ;+CREG?") yield one prefix each.
+    """
+    body = cmd.strip()
+    if body[:2].upper() == "AT":
+        body = body[2:]
+    prefixes = []
+    for part in body.split(";"):
+        part = part.strip()
+        if not part.startswith("+"):
+            continue
+        end = len(part)
+        for sep in "=?":
+            idx = part.find(sep)
+            if idx >= 0:
+                end = min(end, idx)
+        prefixes.append(part[:end].upper() + ":")
+    return tuple(prefixes)
+
+
+def chainable(cmd) -> bool:
+    """True if cmd can share a command line with others ("AT+A;+B").
+
+    Only extended commands whose reply lines carry their own prefix can be
+    told apart in a combined response. Commands that prompt for data,
+    switch to data mode, reset the modem or print unprefixed lines (PDUs,
+    IMEI) go on a line of their own.
+    """
+    body = cmd.strip()
+    if body[:2].upper() == "AT":
+        body = body[2:]
+    body = body.upper()
+    return body.startswith("+") and ";" not in body and not body.startswith(UNCHAINABLE)
+
+
+def chain_commands(commands, max_line=MAX_LINE):
+    """Group consecutive chainable commands, in order, into lists whose
+    combined line "AT+A;+B;..." fits max_line; every other command is a
+    group of its own."""
+    groups = []
+    length = 0
+    for cmd in commands:
+        body = cmd.strip()[2:]
+        if not chainable(cmd):
+            groups.append([cmd])
+            length = 0
+            continue
+        if length and length + 1 + len(body) <= max_line:
+            groups[-1].append(cmd)
+            length += 1 + len(body)
+        else:
+            groups.append([cmd])
+            length = 2 + len(body)
+    return groups
+
+
+def chained_line(commands) -> str:
+    return "AT" + ";".join(cmd.strip()[2:] for cmd in commands)
+
+
+def _reply_key(cmd):
+    """'"lte_band' for AT+QNWPREFCFG="lte_band"[,...]: keyed commands echo
+    their key at the start of each reply line ("neighbourcell" answers
+    with "neighbourcell intra", so the closing quote is left off)."""
+    _, sep, args = cmd.partition("=")
+    if sep and args.startswith('"'):
+        return '"' + args[1:].split('"', 1)[0]
+    return None
+
+
+def _owns(line, prefixes, key):
+    if not prefixes or not line.startswith(prefixes):
+        return False
+    if key is None:
+        return True
+    payload = line.split(":", 1)[1].lstrip()
+    # Several commands may share a prefix ("+QNWPREFCFG:"); a keyed reply
+    # only belongs to the command with that key
+    return payload.startswith(key) or not payload.startswith('"')
+
+
+def split_chained(commands, response):
+    """Per-command ATResponses from the response to chained_line(commands).
+
+    Each line goes to the first command, from the current one on, whose
+    response prefix (and key, for keyed commands) it starts with; other
+    lines stay with the current command. Only meaningful when the chain
+    succeeded: on an error the modem stops at the failing command without
+    saying which one it was.
+    """
+    owners = [(response_prefixes(cmd), _reply_key(cmd)) for cmd in commands]
+    lines = [[] for _ in commands]
+    current = 0
+    for line in response.lines:
+        for i in range(current, len(commands)):
+            if _owns(line, *owners[i]):
+                current = i
+                break
+        lines[current].append(line)
+    return [ATResponse(cmd, response.status, own, response.elapsed, response.final) for cmd, own in zip(commands, lines)]
+
+
+def _is_query(cmd) -> bool:
+    """True if cmd prints a reply line when it succeeds: read and test
+    commands, execution commands without arguments (AT+CSQ) and keyed
+    queries with the key alone (AT+QNWPREFCFG="lte_band")."""
+    _, sep, args = cmd.partition("=")
+    if not sep or args.endswith("?"):
+        return True
+    return args.startswith('"') and args.endswith('"') and args.count('"') == 2
+
+
+def split_failed(commands, response):
+    """(responses, resume) for a chained_line(commands) that failed.
+
+    The modem runs a chain in order and stops at the first error, so
+    every command up to the last one that printed a reply completed. If
+    the next command is a query it is the one that failed, as it would
+    have printed a reply. responses covers those commands; the commands
+    from resume on did not run or may have failed, and are to be sent
+    separately. Setters are expected to be idempotent; credential writes
+    are never chained (UNCHAINABLE).
+    """
+    parts = split_chained(commands, response)
+    last = max((i for i, part in enumerate(parts) if part.lines), default=-1)
+    done = [ATResponse(part.command, "OK", part.lines, response.elapsed, "OK") for part in parts[: last + 1]]
+    resume = last + 1
+    if resume < len(commands) and _is_query(commands[resume]):
+        done.append(ATResponse(commands[resume], response.status, [], response.elapsed, response.final))
+        resume += 1
+    return done, resume
+
+
+class ATResponse:
+    """Parsed result of a single AT command."""
+
+    def __init__(self, command, status, lines, elapsed, final=None):
+        self.command = command
+        self.status = status  # "OK", "ERROR" or "TIMEOUT"
+        self.lines = lines  # intermediate lines, without echo and final code
+        self.elapsed = elapsed
+        self.final = final
+        self.transferred = None  # data-mode bytes moved by download()/upload()
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "OK"
+
+    @property
+    def text(self) -> str:
+        """Response as the modem printed it, for callers that scrape text."""
+        lines = list(self.lines)
+        if self.final:
+            lines.append(self.final)
+        return "\n".join(lines)
+
+    def value(self, prefix):
+        """Return the payload of the first line starting with prefix, or None.
+
+        value("+CSQ:") on "+CSQ: 23,99" returns "23,99".
+        """
+        for line in self.lines:
+            if line.startswith(prefix):
+                return line[len(prefix):].strip()
+        return None
+
+    def values(self, prefix):
+        return [
+            line[len(prefix):].strip() for line in self.lines if line.startswith(prefix)
+        ]
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return (
+            f"ATResponse(command={self.command!r}, status={self.status}, "
+            f"lines={self.lines!r}, elapsed={self.elapsed * 1000:.1f}ms)"
+        )
+
+
+class RawData:
+    """Data-mode payload of known length expected after CONNECT.
+
+    feed() hands up to the outstanding number of bytes to sink and returns
+    how many it took; whatever follows is line-oriented again. An exception
+    from sink is kept in error and the rest of the payload is discarded, so
+    the port stays in step with the modem.
+    """
+
+    def __init__(self, length, sink):
+        self.remaining = length
+        self.sink = sink
+        self.active = False
+        self.error = None
+
+    def feed(self, data) -> int:
+        n = min(len(data), self.remaining)
+        if n and self.error is None:
+            try:
+                self.sink(data if n == len(data) else data[:n])
+            except Exception as e:
+                self.error = e
+        self.remaining -= n
+        if not self.remaining:
+            self.active = False
+        return n
 
 
 class AT:
-    def __init__(self, connection):
+    def __init__(self, connection, reader=None):
         self.connection = connection
+        # Optional ATReader owning the port; without one, responses are read
+        # inline right after each command is written.
+        self.reader = reader
+        self._buffer = bytearray()
+        self._lock = threading.RLock()
+        self.sms = SMSSender(self)
+        port = getattr(connection, "port", None) or "unknown"
+        self._bytes_in = PORT_BYTES.labels(port, "in")
+        self._bytes_out = PORT_BYTES.labels(port, "out")
+        self._trace = TRACE.channel(port)
 
-    def send_cmd(self, cmd, wait=1):
-        full_cmd = cmd + "\r"
-        self.connection.write(full_cmd.encode())
-        time.sleep(wait)
-        response = self.connection.read_all().decode(errors="ignore")
-        logger.info(
-            f"--- {cmd} response ---\n{response.strip()}\n----------------------"
-        )
+    def _write(self, data, payload=False):
+        self._trace.tx(data, payload)  # before the write, so it precedes the reply
+        self.connection.write(data)
+        self._bytes_out.inc(len(data))
+
+    def _read(self, size) -> bytes:
+        data = self.connection.read(size)
+        self._bytes_in.inc(len(data))
+        self._trace.rx(data)
+        return data
+
+    def _wait_readable(self, timeout):
+        try:
+            fd = self.connection.fileno()
+        except (AttributeError, OSError, ValueError):
+            time.sleep(min(timeout, 0.01))
+            return
+        select.select([fd], [], [], timeout)
+
+    def _fill(self, deadline) -> bool:
+        """Read whatever is available into the line buffer, waiting at most
+        until deadline. Returns False once the deadline has passed."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        waiting = self.connection.in_waiting
+        if not waiting:
+            self._wait_readable(remaining)
+            waiting = self.connection.in_waiting
+        if waiting:
+            self._buffer += self._read(waiting)
+        return True
+
+    def _readline(self, deadline, prompt=False):
+        """Return the next non-empty line, ">" for an SMS/data prompt when
+        prompt is True, or None when the deadline expires."""
+        while True:
+            idx = self._buffer.find(b"\n")
+            while idx >= 0:
+                line = self._buffer[:idx].decode(errors="ignore").strip()
+                del self._buffer[: idx + 1]
+                if line:
+                    return line
+                idx = self._buffer.find(b"\n")
+            if prompt and self._buffer.strip().startswith(PROMPT.encode()):
+                self._buffer.clear()
+                return PROMPT
+            if not self._fill(deadline):
+                return None
+
+    def _next_line(self, deadline, prompt=False):
+        if self.reader is not None:
+            return self.reader.readline(deadline)
+        return self._readline(deadline, prompt)
+
+    def _drain(self):
+        """Drop stale input left over from earlier commands or URCs."""
+        waiting = self.connection.in_waiting
+        if waiting:
+            self._buffer += self._read(waiting)
+        if self._buffer:
+            stale = self._buffer.decode(errors="ignore").strip()
+            if stale:
+                logger.debug(f"Discarding unsolicited input: {stale!r}")
+            self._buffer.clear()
+
+    def command(self, cmd, timeout=DEFAULT_TIMEOUT, data=None) -> ATResponse:
+        """Send cmd and read until a final result code or the deadline.
+
+        timeout is an upper bound, not a delay: the call returns as soon as
+        OK/ERROR/+CME ERROR/+CMS ERROR arrives. When data is given, the
+        command is expected to answer with a ">" prompt, after which data is
+        written and terminated with Ctrl+Z (AT+CMGS and friends).
+        """
+        return self._run(cmd, timeout, data=data)
+
+    def batch(self, commands, timeout=DEFAULT_TIMEOUT) -> list:
+        """Run independent commands with as few round trips as possible;
+        returns one ATResponse per command, in order.
+
+        Chainable commands are joined into "AT+A;+B;..." lines of at most
+        MAX_LINE characters; the rest are sent one by one. The modem only
+        accepts a new command line once the previous one has finished, so
+        these follow each other straight away while the port lock is held,
+        with no other caller in between. If a chained line fails, the
+        commands after the one that failed are sent separately (see
+        split_failed()). timeout applies to each command line.
+        """
+        results = []
+        with self._lock:
+            for group in chain_commands(commands):
+                if len(group) == 1:
+                    results.append(self._run(group[0], timeout))
+                    continue
+                response = self._run(chained_line(group), timeout)
+                if response.status == "ERROR":
+                    done, resume = split_failed(group, response)
+                    results += done + [self._run(cmd, timeout) for cmd in group[resume:]]
+                else:
+                    results += split_chained(group, response)
+        return results
+
+    def download(self, cmd, sink, length, timeout=DEFAULT_TIMEOUT) -> ATResponse:
+        """Run a command that answers CONNECT followed by exactly length bytes
+        of raw data (AT+QFTPGET to "COM:", AT+QHTTPREAD).
+
+        sink(data) receives the payload piece by piece as it comes off the
+        port, on the reader thread when there is one, so nothing larger than
+        a receive buffer is ever held. response.transferred is the number of
+        bytes passed to sink; an exception raised by sink is re-raised here.
+        """
+        raw = RawData(length, sink)
+        response = self._run(cmd, timeout, raw=raw)
+        response.transferred = length - raw.remaining
+        if raw.error is not None:
+            raise raw.error
+        return response
+
+    def upload(self, cmd, source, length, timeout=DEFAULT_TIMEOUT) -> ATResponse:
+        """Run a command that answers CONNECT and then reads exactly length
+        bytes (AT+QFTPPUT from "COM:", AT+QHTTPURL, AT+QHTTPPOST).
+
+        source is bytes or a binary file positioned at the first byte to
+        send; it is streamed in WRITE_CHUNK pieces. response.transferred is
+        the number of bytes written.
+        """
+        return self._run(cmd, timeout, source=(source, length))
+
+    def _run(self, cmd, timeout, data=None, raw=None, source=None):
+        with self._lock:
+            if self.reader is not None:
+                self.reader.begin(cmd, prompt=data is not None, raw=raw)
+            else:
+                self._drain()
+            try:
+                response = self._exchange(cmd, timeout, data, raw, source)
+            finally:
+                if self.reader is not None:
+                    self.reader.end()
+        name = command_name(cmd)
+        AT_SECONDS.labels(name).observe(response.elapsed)
+        AT_RESULTS.labels(name, response.status).inc()
         return response
 
+    def _write_stream(self, source, length) -> int:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            view = memoryview(source)[:length]
+            for i in range(0, len(view), WRITE_CHUNK):
+                self._write(view[i : i + WRITE_CHUNK], payload=True)
+            return len(view)
+        sent = 0
+        while sent < length:
+            chunk = source.read(min(WRITE_CHUNK, length - sent))
+            if not chunk:
+                break
+            self._write(chunk, payload=True)
+            sent += len(chunk)
+        return sent
+
+    def _read_raw(self, raw, deadline):
+        """Inline counterpart of the reader's data mode: pass the payload to
+        raw straight from the port."""
+        if self._buffer:
+            n = raw.feed(bytes(self._buffer[: raw.remaining]))
+            del self._buffer[:n]
+        while raw.remaining:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            waiting = self.connection.in_waiting
+            if not waiting:
+                self._wait_readable(remaining)
+                continue
+            raw.feed(self._read(min(waiting, raw.remaining)))
+
+    def _exchange(self, cmd, timeout, data=None, raw=None, source=None):
+        start = time.monotonic()
+        deadline = start + timeout
+        self._write((cmd + "\r").encode())
+
+        lines = []
+        pending = data
+        transferred = None
+        while True:
+            line = self._next_line(deadline, prompt=pending is not None)
+            if line is None:
+                response = ATResponse(cmd, "TIMEOUT", lines, time.monotonic() - start)
+                logger.warning(f"{cmd} timed out after {timeout}s")
+                return response
+            if line == cmd:
+                continue  # command echo (ATE1)
+            if line == PROMPT and pending is not None:
+                payload = pending if isinstance(pending, bytes) else pending.encode()
+                self._write(payload + CTRL_Z.encode(), payload=True)
+                pending = None
+                continue
+            if line.startswith(CONNECT) and (raw is not None or source is not None):
+                if source is not None:
+                    transferred = self._write_stream(*source)
+                    source = None
+                elif self.reader is None:
+                    self._read_raw(raw, deadline)
+                continue
+            status = final_status(line)
+            if status:
+                response = ATResponse(
+                    cmd, status, lines, time.monotonic() - start, final=line
+                )
+                response.transferred = transferred
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{cmd} ({response.elapsed * 1000:.0f} ms): {response.text!r}")
+                return response
+            lines.append(line)
+
+    def send_cmd(self, cmd, wait=DEFAULT_TIMEOUT):
+        """Send cmd and return the raw response text. wait is the deadline."""
+        return self.command(cmd, timeout=wait).text
+
     def send_sms(self, phoneNumber, text):
+        """Send text as PDU-mode SMS; returns one SMSResult per part."""
         if not self.connection:
             logger.error("Serial port not available. SMS not sent.")
-            return
+            return None
         try:
-            self.send_cmd("AT")
-            self.send_cmd("AT+CMGF=1")  # Set text mode
-            self.send_cmd('AT+CSCS="GSM"')  # Set character set to GSM
-            self.send_cmd(f'AT+CMGS="{phoneNumber}"')
-            time.sleep(1)
-            self.connection.write((text + "\x1a").encode())  # Send message + Ctrl+Z
-            logger.info("Waiting for modem to send SMS...")
-            time.sleep(5)  # Wait for message to send
-            response = self.connection.read_all().decode(errors="ignore")
-            logger.info(
-                f"--- Final response ---\n{response.strip()}\n----------------------"
-            )
+            results = self.sms.send(phoneNumber, text)
+            if not all(r.ok for r in results):
+                logger.error(f"SMS to {phoneNumber} not fully sent: {results}")
+            return results
         except Exception as e:
             logger.error(f"Error sending SMS: {e}")
+            return None
 
-
-    def restart_ppp(self):
+    def restart_ppp(self, timeout=60):
         try:
-            self.connection.write("AT+CFUN=1,1\r".encode())
-            logger.info("Waiting for modem to reboot...")
-            time.sleep(20)  # Wait for message to send
-            response = self.connection.read_all().decode(errors="ignore")
-            logger.info(
-                f"--- Final response ---\n{response.strip()}\n----------------------"
-            )
+            if self.reader is None:
+                self.connection.write("AT+CFUN=1,1\r".encode())
+                logger.info("Waiting for modem to reboot...")
+                time.sleep(20)
+                return True
+            ready = self.reader.queue("RDY")
+            try:
+                self.command("AT+CFUN=1,1")
+                logger.info("Waiting for modem to reboot...")
+                rebooted = ready.get(timeout=timeout)
+                logger.info(f"Modem reported {rebooted} after reboot.")
+                return True
+            except queue.Empty:
+                logger.warning(f"No RDY from modem within {timeout}s.")
+                return False
+            finally:
+                self.reader.unsubscribe("RDY", ready)
         except Exception as e:
-            logger.error(f"Error sending SMS: {e}")
-            
+            logger.error(f"Error restarting modem: {e}")
+            return False
+
+    def start_gnss(self) -> bool:
+        """Start GNSS with NMEA output on the USB NMEA port and leave it running."""
+        if not self.connection:
+            logger.error("Serial port not available. Cannot start GNSS.")
+            return False
+        Profile(gnss_outport="usbnmea").apply(self)
+        response = self.command("AT+QGPS=1")
+        # +CME ERROR: 504 = session already ongoing
+        if response.ok or (response.final or "").endswith(" 504"):
+            logger.info("GNSS running.")
+            return True
+        logger.error(f"Could not start GNSS: {response.final or response.status}")
+        return False
+
+    def stop_gnss(self):
+        return self.command("AT+QGPSEND").ok
+
     def check_gps_power_status(self):
         if not self.connection:
             logger.error("Serial port not available. Cannot check GPS power status.")
             return None
 
         try:
-            # Check GPS power status first
-            gps_power_on = self.check_gps_power_status()
-
-            if gps_power_on is False:
-                self.send_cmd("AT+CGNSPWR=1")  # Power on GNSS
-                time.sleep(2)
-            elif gps_power_on is None:
-                logger.warning("Could not determine GPS power status; attempting to power on GNSS anyway.")
-                self.send_cmd("AT+CGNSPWR=1")
-                time.sleep(2)
-            else:
-                logger.info("GPS already powered ON.")
-            
-            response = self.send_cmd("AT+CGPSPWR?")
-            logger.info(f"GPS Power Status response: {response.strip()}")
-            # Response format: +CGPSPWR: <status>
+            response = self.command("AT+QGPS?")
+            # Response format: +QGPS: <status>
             # where <status> is 0 or 1
-            if "+CGPSPWR:" in response:
-                # Extract status number after the colon
-                status_line = response.split(":")[1].strip()
-                status = status_line.split()[0]  # Take the first token after colon
+            status = response.value("+QGPS:")
+            if status is not None:
+                status = status.split(",")[0].strip()
                 if status == "1":
                     logger.info("GPS is ON.")
                     return True
@@ -92,48 +587,28 @@ class AT:
             return None
         except Exception as e:
             logger.error(f"Error checking GPS power status: {e}")
-            return None 
-            
+            return None
+
     def get_gps_info(self):
+        """One-shot position query. GNSS is started if needed and left
+        running, so later calls get a hot fix instead of a cold start."""
         if not self.connection:
             logger.error("Serial port not available. Cannot retrieve GPS info.")
             return None
-    
-        gps = GPSInfo(
-            fix_status=None,
-            latitude=None,
-            longitude=None,
-            altitude=None,
-            speed=None,
-            timestamp=None,
-            raw=None
-        )
 
         try:
-            self.send_cmd("AT")
-            self.send_cmd("AT+CGNSPWR=1")  # Power on GNSS
-            time.sleep(2)
-    
-            response = self.send_cmd("AT+CGNSINF")  # Get GNSS info
-            logger.info(f"--- Raw GPS response ---\n{response.strip()}\n----------------------")
-    
-            if "+CGNSINF:" in response:
-                parts = response.split(":")[1].strip().split(",")
-                gps["fix_status"] = parts[1]
-                gps["timestamp"] = parts[2]
-                gps["latitude"] = parts[3]
-                gps["longitude"] = parts[4]
-                gps["altitude"] = parts[5]
-                gps["speed"] = parts[6]
-                gps["raw"] = response.strip()
-            else:
-                logger.warning("GPS data not available or fix not acquired.")
-            
-            # Turn off GNSS after usage
-            self.send_cmd("AT+CGNSPWR=0")
+            response = self.command("AT+QGPSLOC=2")  # Get position, decimal degrees
+            # +CME ERROR: 505 = session not active; asking first would cost
+            # a round trip on every call once GNSS is running
+            if (response.final or "").endswith(" 505") and self.start_gnss():
+                response = self.command("AT+QGPSLOC=2")
+            info = response.value("+QGPSLOC:")
+            if info is not None:
+                return GPSInfo.from_qgpsloc(f"+QGPSLOC: {info}")
+            # +CME ERROR: 516 = no fix yet
+            logger.warning("GPS data not available or fix not acquired.")
+            return GPSInfo(fix_status="0", raw=response.text)
 
-            return gps
-    
         except Exception as e:
             logger.error(f"Error retrieving GPS information: {e}")
             return None
@@ -0,0 +1,175 @@
+import argparse
+import json
+import math
+import tempfile
+import time
+import logging
+from modem.at import AT
+from modem.connection import State
+from modem.nmea import NMEAStream
+from modem.reader import ATReader
+from modem.serial import Serial
+from modem.simulator import SimulatedModem
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class BenchResult:
+    def __init__(self, name, samples, unit="s", **extra):
+        self.name = name
+        self.samples = list(samples)
+        self.unit = unit
+        self.extra = extra
+
+    def summary(self, points=(50, 90, 99)) -> dict:
+        ordered = sorted(self.samples)
+        out = {"name": self.name, "count": len(ordered), "unit": self.unit}
+        if ordered:
+            out["min"] = ordered[0]
+            out["mean"] = sum(ordered) / len(ordered)
+            for p in points:
+                out[f"p{p}"] = percentile(ordered, p)
+            out["max"] = ordered[-1]
+        out.update(self.extra)
+        return out
+
+    def __str__(self):
+        s = self.summary()
+        if not self.samples:
+            return f"{self.name:<20} no samples"
+        scale, unit = (1000, "ms") if self.unit == "s" else (1, self.unit)
+        cols = " ".join(f"{k}={s[k] * scale:8.2f}" for k in ("p50", "p90", "p99", "max"))
+        extra = " ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in self.extra.items())
+        return f"{self.name:<20} n={s['count']:<5} {cols} {unit} {extra}".rstrip()
+
+
+def bench_at(at, count=200, cmd="AT") -> BenchResult:
+    """Round-trip latency of a single AT command."""
+    samples, failures = [], 0
+    for _ in range(count):
+        start = time.perf_counter()
+        ok = at.command(cmd).ok
+        samples.append(time.perf_counter() - start)
+        failures += not ok
+    return BenchResult(f"at {cmd}", samples, failures=failures)
+
+
+def bench_sms(at, count=20, number="+15550100", text="Benchmark message") -> BenchResult:
+    """Per-message send latency and overall throughput of the PDU sender."""
+    samples, failures = [], 0
+    start = time.perf_counter()
+    for i in range(count):
+        t = time.perf_counter()
+        results = at.sms.send(number, f"{text} {i}")
+        samples.append(time.perf_counter() - t)
+        failures += not all(r.ok for r in results)
+    elapsed = time.perf_counter() - start
+    return BenchResult("sms send", samples, failures=failures, per_second=count / elapsed if elapsed else 0.0)
+
+
+def bench_connect(interface, count=5, reset=None, timeout=60, target=State.SESSION_UP) -> BenchResult:
+    """Time from OFFLINE to target. reset() puts the modem back in a
+    disconnected, low-power state before each run."""
+    samples, failures = [], 0
+    for _ in range(count):
+        if reset is not None:
+            reset()
+        interface.state_machine.invalidate(State.OFFLINE)
+        start = time.perf_counter()
+        if interface.state_machine.run(timeout=timeout, target=target):
+            samples.append(time.perf_counter() - start)
+        else:
+            failures += 1
+    return BenchResult(f"connect {target.name}", samples, failures=failures)
+
+
+def bench_gps(at, port, duration=10, baudrate=115200) -> BenchResult:
+    """Interval between fixes on the NMEA stream, time to first fix and fix rate."""
+    stream = NMEAStream(port, baudrate)
+    stream.start()
+    at.start_gnss()
+    start = time.perf_counter()
+    first, last, intervals = None, None, []
+    try:
+        for fix in stream.fixes(timeout=duration):
+            now = time.perf_counter()
+            if now - start > duration:
+                break
+            if not fix.has_fix():
+                continue
+            if first is None:
+                first = now - start
+            elif last is not None:
+                intervals.append(now - last)
+            last = now
+    finally:
+        at.stop_gnss()
+        stream.stop()
+    rate = len(intervals) / sum(intervals) if intervals else 0.0
+    return BenchResult("gps fix interval", intervals, ttff=first if first is not None else float("nan"), fixes_per_second=rate)
+
+
+def run_simulated(count=200, scale=1.0, sms=20, connects=5, gps=10, pin=None):
+    """Run every benchmark against a SimulatedModem; returns BenchResults."""
+    results = []
+    with SimulatedModem(scale=scale, pin=pin, nmea_rate=10, ttff=1.0) as sim:
+        with tempfile.TemporaryDirectory() as tmp:
+            interface = sim.interface(session_file=f"{tmp}/session.json")
+            serial = Serial(interface)
+            reader = ATReader(serial.serial_conn)
+            reader.start()
+            at = AT(serial.serial_conn, reader)
+            try:
+                results.append(bench_at(at, count))
+                results.append(bench_at(at, max(1, count // 4), "AT+CSQ"))
+                if sms:
+                    sim.set_registration(1)
+                    results.append(bench_sms(at, sms))
+                if connects:
+
+                    def reset():
+                        sim.stop_network()
+                        sim.set_mode("low-power")
+
+                    results.append(bench_connect(interface, connects, reset))
+                if gps:
+                    results.append(bench_gps(at, sim.nmea_port, gps))
+            finally:
+                reader.stop()
+                serial.close_serial()
+                interface.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modem latency benchmarks on the simulated RM520N.")
+    parser.add_argument("--count", type=int, default=200, help="AT round trips")
+    parser.add_argument("--sms", type=int, default=20, help="SMS to send (0 to skip)")
+    parser.add_argument("--connects", type=int, default=5, help="connection cycles (0 to skip)")
+    parser.add_argument("--gps", type=float, default=10, help="seconds of NMEA to measure (0 to skip)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for simulated latencies")
+    parser.add_argument("--pin", help="require this SIM PIN")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s")
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+
+    results = run_simulated(args.count, args.scale, args.sms, args.connects, args.gps, args.pin)
+    if args.json:
+        print(json.dumps([r.summary() for r in results], indent=2))
+    else:
+        for result in results:
+            print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import random
+import threading
+import time
+import logging
+from enum import IntEnum
+from pathlib import Path
+from modem.metrics import CONNECT_SECONDS, CONNECTION_DROPS, STEP_SECONDS
+from modem.qmi import QMIError
+
+logger = logging.getLogger(__name__)
+
+IFF_UP = 0x1
+
+
+class State(IntEnum):
+    OFFLINE = 0
+    SIM_READY = 1
+    REGISTERED = 2
+    SESSION_UP = 3
+    CONFIGURED = 4
+
+
+class Backoff:
+    """Exponential backoff with jitter.
+
+    The first retries come quickly so a condition that is met a moment later
+    is noticed right away; the delay then grows up to maximum.
+    """
+
+    def __init__(self, initial=0.25, maximum=8.0, factor=2.0, jitter=0.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempt = 0
+
+    def next(self) -> float:
+        delay = min(self.maximum, self.initial * self.factor**self.attempt)
+        self.attempt += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempt = 0
+
+
+class ConnectionStateMachine:
+    """Drives a ModemInterface from OFFLINE to CONFIGURED.
+
+    offline -> SIM ready -> registered -> session up -> interface configured
+
+    Each state has a cheap check and an action to reach the next one. run()
+    advances as soon as a check passes and polls with backoff otherwise. The
+    last good state is remembered across runs: a later run first re-checks
+    it and only falls back as far as needed instead of starting over.
+    """
+
+    def __init__(self, interface, backoff=None):
+        self.interface = interface
+        self.backoff = backoff or Backoff()
+        self.state = State.OFFLINE
+        self.state_entered = {}
+        self._wake = threading.Event()
+        self._pin_attempted = False
+        self._online_requested = False
+
+    @property
+    def client(self):
+        return self.interface.client
+
+    def notify(self):
+        """Wake a waiting run() early, e.g. from a registration URC."""
+        self._wake.set()
+
+    def invalidate(self, state):
+        """Drop back to state if the machine is currently beyond it."""
+        if self.state > state:
+            logger.info(f"Connection state {self.state.name} -> {state.name}")
+            self.state = state
+            CONNECTION_DROPS.labels(state.name).inc()
+        self._wake.set()
+
+    def restore(self, state):
+        """Jump to a state known to hold, e.g. from a revalidated saved session."""
+        self._enter(state)
+
+    def _enter(self, state):
+        if state != self.state:
+            logger.info(f"Connection state {self.state.name} -> {state.name}")
+            self.state = state
+            self.state_entered[state] = time.monotonic()
+
+    # --- checks -------------------------------------------------------------
+
+    def sim_ready(self) -> bool:
+        if self.client.get_operating_mode() != "online":
+            return False
+        return self.client.get_card_status().ready
+
+    def registered(self) -> bool:
+        return self.client.get_serving_system().registered
+
+    def session_up(self) -> bool:
+        return self.client.get_packet_service_status() == "connected"
+
+    def configured(self) -> bool:
+        flags = Path(f"/sys/class/net/{self.interface.interface}/flags")
+        try:
+            return bool(int(flags.read_text(), 16) & IFF_UP) and self.session_up()
+        except (OSError, ValueError):
+            return False
+
+    CHECKS = {
+        State.SIM_READY: "sim_ready",
+        State.REGISTERED: "registered",
+        State.SESSION_UP: "session_up",
+        State.CONFIGURED: "configured",
+    }
+
+    def holds(self, state) -> bool:
+        if state == State.OFFLINE:
+            return True
+        try:
+            return getattr(self, self.CHECKS[state])()
+        except (QMIError, OSError) as e:
+            logger.debug(f"Check for {state.name} failed: {e}")
+            return False
+
+    # --- actions ------------------------------------------------------------
+
+    def _advance_offline(self):
+        mode = self.client.get_operating_mode()
+        if mode != "online":
+            if not self._online_requested:
+                logger.info(f"Modem is {mode}. Switching to online mode...")
+                self.client.set_operating_mode("online")
+                self._online_requested = True
+            return False
+        status = self.client.get_card_status()
+        if status.needs_pin and not self._pin_attempted:
+            # Only one attempt per run so a wrong PIN cannot lock the SIM
+            logger.info("SIM requires PIN. Sending PIN...")
+            self._pin_attempted = True
+            self.client.verify_pin(self.interface.sim.pin1)
+            return False
+        return status.ready
+
+    def _advance_sim_ready(self):
+        return self.registered()
+
+    def _advance_registered(self):
+        if self.session_up():
+            return True
+        return self.interface.start_network()
+
+    def _advance_session_up(self):
+        self.interface.get_connection_info()
+        self.interface.configure_interface()
+        return self.configured()
+
+    ACTIONS = {
+        State.OFFLINE: "_advance_offline",
+        State.SIM_READY: "_advance_sim_ready",
+        State.REGISTERED: "_advance_registered",
+        State.SESSION_UP: "_advance_session_up",
+    }
+
+    def step(self) -> bool:
+        """Try to move one state forward. Returns True if it did."""
+        start = time.monotonic()
+        result = "advanced"
+        try:
+            advanced = getattr(self, self.ACTIONS[self.state])()
+            if not advanced:
+                result = "waiting"
+        except (QMIError, OSError) as e:
+            logger.warning(f"{self.state.name}: {e}")
+            advanced = False
+            result = "error"
+        STEP_SECONDS.labels(self.state.name, result).observe(time.monotonic() - start)
+        if advanced:
+            self._enter(State(self.state + 1))
+        return advanced
+
+    def resume(self):
+        """Fall back from the last good state to the highest one that still holds."""
+        while self.state > State.OFFLINE and not self.holds(self.state):
+            self._enter(State(self.state - 1))
+            CONNECTION_DROPS.labels(self.state.name).inc()
+        return self.state
+
+    def run(self, timeout=120, target=State.CONFIGURED) -> bool:
+        self._pin_attempted = False
+        self._online_requested = False
+        self.backoff.reset()
+        deadline = time.monotonic() + timeout
+        start = time.monotonic()
+        origin = self.resume().name
+        while self.state < target:
+            if self.step():
+                self.backoff.reset()
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"Connection stuck in {self.state.name} after {timeout}s.")
+                CONNECT_SECONDS.labels(origin, "timeout").observe(time.monotonic() - start)
+                return False
+            self._wake.wait(min(self.backoff.next(), remaining))
+            self._wake.clear()
+        CONNECT_SECONDS.labels(origin, "ok").observe(time.monotonic() - start)
+        logger.info(
+            f"Reached {self.state.name} in {time.monotonic() - start:.2f}s."
+        )
+        return True
+
+    def wait_for(self, check, timeout, what):
+        """Poll check() with backoff until it returns a truthy value."""
+        backoff = Backoff(self.backoff.initial, self.backoff.maximum)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                result = check()
+                if result:
+                    return result
+            except (QMIError, OSError) as e:
+                logger.debug(f"Waiting for {what}: {e}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Timed out waiting for {what}.")
+                return None
+            self._wake.wait(min(backoff.next(), remaining))
+            self._wake.clear()
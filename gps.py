@@ -1,7 +1,7 @@
 import logging
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 class GPSInfo:
     def __init__(
@@ -51,10 +51,92 @@ class GPSInfo:
             logger.error(f"Failed to parse CGNSINF: {e}")
             return cls(raw=response.strip())
 
+    @classmethod
+    def from_qgpsloc(cls, response):
+        """
+        Parse response from AT+QGPSLOC=2 (decimal degrees) and return GPSInfo.
+        Example response:
+        +QGPSLOC: 125633.000,37.77490,-122.41940,1.1,10.0,3,0.00,0.0,0.0,141025,08
+        """
+        try:
+            if "+QGPSLOC:" not in response:
+                raise ValueError("Invalid QGPSLOC response.")
+
+            parts = response.split(":", 1)[1].strip().split(",")
+            date = parts[9]
+            return cls(
+                fix_status="1" if int(parts[5]) >= 2 else "0",
+                timestamp=f"20{date[4:6]}{date[2:4]}{date[0:2]}{parts[0]}",
+                latitude=float(parts[1]),
+                longitude=float(parts[2]),
+                altitude=float(parts[4]),
+                speed=float(parts[7]),
+                raw=response.strip(),
+            )
+        except Exception as e:
+            logger.error(f"Failed to parse QGPSLOC: {e}")
+            return cls(raw=response.strip())
+
     def __str__(self):
         return (
             f"GPS Fix: {self.fix_status}, "
             f"Timestamp: {self.timestamp}, "
             f"Latitude: {self.latitude}, Longitude: {self.longitude}, "
             f"Altitude: {self.altitude} m, Speed: {self.speed} km/h"
-        )
\ No newline at end of file
+        )
+
+
+class GPSFix:
+    """Compact, numerically typed single fix.
+
+    timestamp is seconds since the epoch (UTC), coordinates are decimal
+    degrees, altitude is metres, speed is km/h and quality is the GGA fix
+    quality (0 = no fix).
+    """
+
+    __slots__ = ("timestamp", "latitude", "longitude", "altitude", "speed", "quality")
+
+    def __init__(self, timestamp, latitude, longitude, altitude=0.0, speed=0.0, quality=0):
+        self.timestamp = timestamp
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+        self.speed = speed
+        self.quality = quality
+
+    def has_fix(self):
+        return self.quality > 0 and self.latitude is not None
+
+    @classmethod
+    def from_info(cls, info):
+        """Convert a GPSInfo (string or numeric fields) into a GPSFix."""
+
+        def num(value):
+            return float(value) if value not in (None, "") else None
+
+        timestamp = None
+        if info.timestamp:
+            try:
+                timestamp = (
+                    datetime.strptime(str(info.timestamp)[:14], "%Y%m%d%H%M%S")
+                    .replace(tzinfo=timezone.utc)
+                    .timestamp()
+                )
+            except ValueError:
+                pass
+        return cls(
+            timestamp,
+            num(info.latitude),
+            num(info.longitude),
+            num(info.altitude) or 0.0,
+            num(info.speed) or 0.0,
+            1 if info.has_fix() else 0,
+        )
+
+    def __str__(self):
+        return (
+            f"GPS Fix: {self.quality}, "
+            f"Timestamp: {self.timestamp}, "
+            f"Latitude: {self.latitude}, Longitude: {self.longitude}, "
+            f"Altitude: {self.altitude} m, Speed: {self.speed} km/h"
+        )
@@ -3,8 +3,17 @@ import subprocess
 import time
 import logging
 import os
+import shutil
 import sys
 from modem.card import SIM
+from modem.qmi import QMIClient, QMIError, QmicliClient
+from modem.connection import ConnectionStateMachine, State
+from modem.metrics import SHELL_FAILURES, SHELL_SECONDS, shell_name
+from modem.netlink import configure_link
+from modem.tracing import TRACE
+from modem.session import DEFAULT_SESSION_FILE, SessionRecord, SessionStore, interface_address
+
+SHELL_TRACE = TRACE.channel("shell")
 
 
 class ModemInterface:
@@ -19,6 +28,12 @@ class ModemInterface:
         baudrate: int = 115200,
         timeout: int = 5,
         interface: str = "wwan0",
+        session_file: str = DEFAULT_SESSION_FILE,
+        transport: str = "auto",
+        require_root: bool = True,
+        resolv_conf: str = None,
+        route_metric: int = None,
+        ip_type: str = "4,6",
     ):
         self.qmi = qmi
         self.ttyUSB1 = ttyUSB1
@@ -29,7 +44,59 @@ class ModemInterface:
         self.baudrate = baudrate
         self.timeout = timeout
         self.interface = interface
-        self.check_sudo()
+        self.transport = transport  # AT port transport: "auto", "raw" or "pyserial"
+        self.resolv_conf = resolv_conf  # where to write DNS servers; None = systemd-resolved
+        self._applied_dns = None
+        self.route_metric = route_metric  # default route metric; None = netlink.ROUTE_METRIC + ifindex
+        self.ip_type = ip_type  # data session IP family: "4", "6" or "4,6" (dual-stack)
+        self.packet_data_handle = None
+        self.current_settings = None
+        self._client = None
+        self.state_machine = ConnectionStateMachine(self)
+        self.session_store = SessionStore(session_file)
+        if require_root:
+            self.check_sudo()
+
+    @property
+    def client(self):
+        """Persistent QMI client, falling back to qmicli if the QMUX device
+        cannot be opened (e.g. it is held by ModemManager)."""
+        if self._client is None:
+            try:
+                self._client = QMIClient(self.qmi).open()
+            except OSError as e:
+                logging.warning(f"Cannot open {self.qmi} directly ({e}); using qmicli.")
+                self._client = QmicliClient(self.qmi, self.run_command)
+        return self._client
+
+    @property
+    def nmea_port(self):
+        """On the RM520N the second USB serial interface carries NMEA."""
+        return self.ttyUSB1
+
+    def close(self):
+        if self._client is not None:
+            # Keep the WDS client ID only for a saved session: nothing else
+            # would ever release it
+            self._client.close(keep=("wds",) if self._session_holds_wds() else ())
+            self._client = None
+
+    def _session_holds_wds(self) -> bool:
+        cid = self._client.client_ids.get("wds")
+        record = self.session_store.load() if cid is not None else None
+        return record is not None and record.wds_client_id == cid
+
+    @staticmethod
+    def _release_wds(client):
+        """Return a kept WDS client ID to the modem (CTL Release Client ID)."""
+        if "wds" not in client.client_ids:
+            return
+        if isinstance(client, QMIClient):
+            try:
+                client.release_client_id("wds")
+            except (QMIError, OSError) as e:
+                logging.info(f"Could not release WDS client: {e}")
+        client.client_ids.pop("wds", None)
 
     def all_devices_exist(self) -> bool:
         return all(
@@ -50,7 +117,8 @@ class ModemInterface:
             f"ttyUSB4={self.ttyUSB4}, baudrate={self.baudrate})"
         )
 
-    def check_sudo(self):
+    @staticmethod
+    def check_sudo():
         if os.geteuid() != 0:
             logging.error("This script must be run with sudo/root privileges.")
             sys.exit(1)
@@ -58,106 +126,188 @@ class ModemInterface:
             logging.info("Running as root.")
 
     def run_command(self, cmd):
-        logging.info(f"Running: {cmd}")
+        logging.debug(f"Running: {cmd}")
+        SHELL_TRACE.tx(cmd.encode())
+        start = time.monotonic()
         result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        SHELL_TRACE.rx(result.stdout.encode())
+        name = shell_name(cmd)
+        SHELL_SECONDS.labels(name).observe(time.monotonic() - start)
+        if result.returncode != 0:
+            SHELL_FAILURES.labels(name).inc()
         if result.stdout:
-            logging.info(f"Output: {result.stdout.strip()}")
+            logging.debug(f"Output: {result.stdout.strip()}")
         if result.stderr:
             logging.warning(f"Error: {result.stderr.strip()}")
         return result.stdout or ""
 
-    def reset_modem(self):
+    def reset_modem(self, timeout=60):
         logging.info("Resetting the modem...")
-        output = self.run_command(
-            cmd=f"sudo qmicli -d {self.qmi} --dms-set-operating-mode=reset"
-        )
-        if "error" in output.lower():
-            logging.warning("Failed to reset modem.")
-        else:
+        try:
+            self.client.set_operating_mode("reset")
             logging.info("Modem reset command issued successfully.")
-
-        time.sleep(5)  # Allow time for the modem to reboot
+        except QMIError as e:
+            logging.warning(f"Failed to reset modem: {e}")
+            return False
+        if self._client is not None:
+            self._client.client_ids.clear()  # client IDs do not survive the reset
+        self.close()
+        self._applied_dns = None  # wwan0 is re-created
+        self.state_machine.invalidate(State.OFFLINE)
+
+        # The QMI node disappears while the modem re-enumerates on USB
+        machine = self.state_machine
+        machine.wait_for(lambda: not os.path.exists(self.qmi), 10, "modem to go down")
+        mode = machine.wait_for(self._reopen_operating_mode, timeout, "modem to come back")
+        return mode is not None
+
+    def _reopen_operating_mode(self):
+        if not os.path.exists(self.qmi):
+            return None
+        try:
+            mode = self.client.get_operating_mode()
+        except (QMIError, OSError):
+            self.close()
+            raise
+        return mode if mode not in ("reset", "shutting-down") else None
 
     def get_operating_mode(self):
-        output = self.run_command(
-            cmd=f"sudo qmicli -d {self.qmi} --dms-get-operating-mode"
-        )
-        if "offline" in output.lower():
-            logging.info("Modem is offline. Switching to online mode...")
-            self.run_command(
-                cmd=f"sudo qmicli -d {self.qmi} --dms-set-operating-mode=online"
-            )
-            time.sleep(2)  # Give it a moment to come online
+        mode = self.client.get_operating_mode()
+        if mode != "online":
+            logging.info(f"Modem is {mode}. Switching to online mode...")
+            self.client.set_operating_mode("online")
         else:
             logging.info("Modem is already online.")
+        return mode
 
     def check_sim_status(self):
-        output = self.run_command(
-            cmd=f"sudo qmicli -d {self.qmi} --uim-get-card-status"
-        )
-        if "PIN1 state: 'enabled, not verified'" in output:
+        status = self.client.get_card_status()
+        if status.needs_pin:
             logging.info("SIM requires PIN. Sending PIN...")
-            self.run_command(
-                cmd=f"sudo qmicli -d {self.qmi} --uim-verify-pin=PIN1,{self.sim.pin1}"
-            )
-            time.sleep(2)
-        elif (
-            "PIN1 state: 'disabled'" in output or "Application state: 'ready'" in output
-        ):
+            try:
+                self.client.verify_pin(self.sim.pin1)
+            except QMIError as e:
+                logging.error(f"SIM PIN rejected: {e}")
+        elif status.pin1_state == "disabled" or status.ready:
             logging.info("SIM is ready.")
         else:
-            logging.warning("Unexpected SIM status. Proceeding cautiously.")
+            logging.warning(f"Unexpected SIM status {status}. Proceeding cautiously.")
+        return status
 
-    def check_registration(self) -> bool:
-        output = self.run_command(
-            cmd=f"sudo qmicli -d {self.qmi} --nas-get-serving-system"
+    def check_registration(self, timeout=15) -> bool:
+        serving = self.state_machine.wait_for(
+            self._registered_serving_system, timeout, "network registration"
         )
-        time.sleep(2)
-        if "registration state: 'registered'" in output.lower():
-            logging.info("Modem is registered to network.")
+        if serving:
+            logging.info(f"Modem is registered to network ({serving.operator}).")
             return True
-        else:
-            logging.info("Modem not registered. Retrying...")
-            for i in range(3):
-                time.sleep(3)
-                output = self.run_command(
-                    cmd=f"sudo qmicli -d {self.qmi} --nas-get-serving-system"
-                )
-                if "registration state: 'registered'" in output.lower():
-                    logging.info("Modem is now registered.")
-                    return True
-            logging.warning("Modem failed to register after retries.")
-            return False
+        logging.warning("Modem failed to register.")
+        return False
+
+    def _registered_serving_system(self):
+        serving = self.client.get_serving_system()
+        return serving if serving.registered else None
 
     def start_network(self):
-        output = self.run_command(
-            cmd=f"sudo qmicli -d {self.qmi} --wds-start-network=\"apn={self.sim.apn},ip-type='4,6'\" --client-no-release-cid"
-        )
-        if (
-            "network started" in output.lower()
-            and "packet data handle" in output.lower()
-        ):
-            logging.info("Network session started.")
-            return True
-        else:
-            logging.error("Failed to start network session.")
-            return True
+        try:
+            self.packet_data_handle = self.client.start_network(self.sim.apn, self.ip_type)
+        except QMIError as e:
+            logging.error(f"Failed to start network session: {e}")
+            return False
+        logging.info(f"Network session started (handle {self.packet_data_handle}).")
+        return True
 
     def get_connection_info(self):
-        output = self.run_command(
-            cmd=f"sudo qmicli -d {self.qmi} --wds-get-current-settings"
+        settings = self.client.get_current_settings()
+        logging.info(f"Connection info retrieved: {settings}")
+        self.current_settings = settings
+        return settings
+
+    def identity(self):
+        """(IMEI, ICCID) of the modem and the inserted SIM."""
+        imei = self.client.get_ids().get("imei")
+        try:
+            iccid = self.client.get_iccid()
+        except QMIError:
+            iccid = None
+        return imei, iccid
+
+    def save_session(self):
+        settings = self.current_settings or self.get_connection_info()
+        imei, iccid = self.identity()
+        record = SessionRecord(
+            packet_data_handle=self.packet_data_handle,
+            wds_client_id=self.client.client_ids.get("wds"),
+            apn=self.sim.apn,
+            ip=settings.ip,
+            prefix_length=settings.prefix_length,
+            gateway=settings.gateway,
+            dns=settings.dns,
+            mtu=settings.mtu,
+            interface=self.interface,
+            imei=imei,
+            iccid=iccid,
         )
-        logging.info("Connection info retrieved:\n" + output)
+        try:
+            self.session_store.save(record)
+        except OSError as e:
+            logging.warning(f"Could not save session: {e}")
+
+    def warm_start(self) -> bool:
+        """Skip straight to CONFIGURED if the saved session is still live.
+
+        Reuses the saved WDS client ID so the session started by a previous
+        run stays visible, then checks SIM/modem identity, packet service
+        status and the address on the interface.
+        """
+        record = self.session_store.load()
+        if record is None:
+            return False
+        if record.apn != self.sim.apn or record.interface != self.interface:
+            logging.info("Saved session is for a different APN or interface.")
+            return False
+        if self._client is None and record.wds_client_id is not None:
+            try:
+                self._client = QMIClient(
+                    self.qmi, timeout=1, client_ids={"wds": record.wds_client_id}
+                ).open()
+            except OSError:
+                pass
+        client = self.client
+        try:
+            if self.identity() != (record.imei, record.iccid):
+                logging.info("Modem or SIM changed since the saved session.")
+                self.session_store.clear()
+                return False
+            if client.get_packet_service_status() != "connected":
+                logging.info("Saved session is no longer connected.")
+                return False
+            settings = client.get_current_settings()
+        except (QMIError, OSError) as e:
+            logging.info(f"Saved session could not be revalidated: {e}")
+            self._release_wds(client)
+            return False
+        finally:
+            if isinstance(client, QMIClient):
+                client.timeout = self.timeout
+        if settings.ip != record.ip:
+            logging.info(f"Session address changed ({record.ip} -> {settings.ip}).")
+            return False
 
-    def connect(self) -> bool:
-        output = self.run_command(
-            cmd=f"sudo qmicli -d {self.qmi} --wds-get-current-settings"
-        )
-        logging.info("Connection settings:\n" + output)
+        self.packet_data_handle = record.packet_data_handle
+        self.current_settings = settings
+        if interface_address(self.interface) != settings.ip:
+            # Session is up, only the host side needs configuring again
+            self.state_machine.restore(State.SESSION_UP)
+            return False
+        self.state_machine.restore(State.CONFIGURED)
+        return True
 
     def set_raw_ip_mode(self):
         raw_ip_path = f"/sys/class/net/{self.interface}/qmi/raw_ip"
         if Path(raw_ip_path).exists():
+            if Path(raw_ip_path).read_text().strip() == "Y":
+                return
             logging.info(f"Enabling raw-ip mode on {self.interface}...")
             try:
                 with open(raw_ip_path, "w") as f:
@@ -173,42 +323,74 @@ class ModemInterface:
             )
 
     def configure_interface(self):
+        """Apply the settings the modem reported (WDS current settings) to
+        the interface over rtnetlink: link up, MTU, address and default
+        route. Raw-IP mode needs no DHCP; udhcpc is only used when the
+        settings are incomplete or netlink is refused."""
         logging.info(f"Setting raw-ip mode for {self.interface}...")
         self.set_raw_ip_mode()
 
+        settings = self.current_settings
+        if settings is None or not settings.ip or not settings.prefix_length:
+            logging.warning("Modem reported no IP settings; falling back to DHCP.")
+            self._configure_dhcp()
+            return
+        logging.info(f"Configuring {self.interface} with {settings}...")
+        try:
+            configure_link(
+                self.interface,
+                settings.ip,
+                settings.prefix_length,
+                settings.gateway,
+                settings.mtu,
+                metric=self.route_metric,
+            )
+        except OSError as e:
+            logging.warning(f"Netlink configuration of {self.interface} failed ({e}); falling back to DHCP.")
+            self._configure_dhcp()
+            return
+        self.apply_dns(settings.dns)
+
+    def _configure_dhcp(self):
         logging.info(f"Bringing up interface {self.interface}...")
         self.run_command(cmd=f"sudo ip link set {self.interface} up")
 
         logging.info(f"Requesting IP address via DHCP on {self.interface}...")
         self.run_command(cmd=f"sudo udhcpc -i {self.interface}")
 
-    def connect(self):
-        logging.info("[STEP] Checking modem operating mode...")
-        self.get_operating_mode()
-
-        logging.info("[STEP] Checking SIM status...")
-        self.check_sim_status()
-
-        logging.info("[STEP] Checking network registration...")
-        if not self.check_registration():
-            logging.error(
-                "Modem is not registered to the network. Aborting connection attempt."
-            )
-            return False
-
-        logging.info("[STEP] Starting network session...")
-        if not self.start_network():
-            logging.error("Failed to start network session.")
-            return False
-
-        logging.info("[STEP] Getting session details...")
-        self.get_connection_info()
-
-        logging.info("[STEP] Configuring interface...")
-        self.configure_interface()
-
-        logging.info("[DONE] WWAN connection should now be up.")
-        return True
+    def apply_dns(self, servers):
+        """Hand the modem's DNS servers to the resolver: written to
+        resolv_conf when set, otherwise registered for the link with
+        systemd-resolved. Nothing is done while they are unchanged."""
+        servers = [s for s in servers if s]
+        if not servers or servers == self._applied_dns:
+            return
+        if self.resolv_conf:
+            tmp = f"{self.resolv_conf}.tmp"
+            with open(tmp, "w") as f:
+                f.write("".join(f"nameserver {server}\n" for server in servers))
+            os.replace(tmp, self.resolv_conf)
+        elif shutil.which("resolvectl"):
+            self.run_command(cmd=f"sudo resolvectl dns {self.interface} {' '.join(servers)}")
+        else:
+            logging.warning(f"DNS servers {servers} not applied; set resolv_conf.")
+            return
+        logging.info(f"DNS servers for {self.interface}: {', '.join(servers)}")
+        self._applied_dns = servers
+
+    def connect(self, timeout=120) -> bool:
+        """Bring the data connection up, resuming from the last good state."""
+        if self.state_machine.state == State.OFFLINE and self.warm_start():
+            logging.info("[DONE] Reusing the saved WWAN session.")
+            return True
+        if self.state_machine.run(timeout=timeout):
+            self.save_session()
+            logging.info("[DONE] WWAN connection is up.")
+            return True
+        logging.error(
+            f"Connection attempt stopped in state {self.state_machine.state.name}."
+        )
+        return False
 
 ###to do
 # phone call
@@ -0,0 +1,302 @@
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from modem.connection import State
+from modem.interface import ModemInterface
+from modem.modem import Modem
+from modem.session import DEFAULT_SESSION_FILE
+
+logger = logging.getLogger(__name__)
+
+SYSFS_USB = "/sys/bus/usb/devices"
+QUECTEL_VENDOR = "2c7c"
+
+# RM520N USB interface numbers
+IF_DM = 0
+IF_NMEA = 1
+IF_AT = 2
+IF_MODEM = 3
+IF_QMI = 4
+
+
+def _read(path):
+    try:
+        return Path(path).read_text().strip()
+    except OSError:
+        return None
+
+
+def _node(interface_dir, *patterns):
+    """First /dev node published under an interface directory, e.g. its
+    ttyUSBn, cdc-wdmN or network interface name."""
+    for pattern in patterns:
+        for match in sorted(interface_dir.glob(pattern)):
+            return match.name
+    return None
+
+
+class ModemPorts:
+    """Device nodes of one modem found in sysfs."""
+
+    def __init__(self, usb_path, product=None, serial=None):
+        self.usb_path = usb_path  # e.g. "2-1.3", stable per physical port
+        self.product = product
+        self.serial = serial
+        self.dm = self.nmea = self.at = self.modem = self.qmi = None
+        self.net = None
+
+    @property
+    def id(self):
+        return self.serial or self.usb_path
+
+    @property
+    def complete(self) -> bool:
+        return all((self.at, self.nmea, self.qmi, self.net))
+
+    def interface(self, sim, session_dir=None, **kwargs) -> ModemInterface:
+        """ModemInterface for these ports. Privileges are not checked here
+        (require_root=False), ModemManager checks them once for all modems."""
+        session_dir = session_dir or os.path.dirname(DEFAULT_SESSION_FILE)
+        kwargs.setdefault("session_file", os.path.join(session_dir, f"session-{self.id}.json"))
+        kwargs.setdefault("require_root", False)
+        return ModemInterface(
+            qmi=self.qmi,
+            ttyUSB1=self.nmea,
+            ATCommand=self.at,
+            ttyUSB3=self.modem,
+            ttyUSB4=self.dm,
+            sim=sim,
+            interface=self.net,
+            **kwargs,
+        )
+
+    def __repr__(self):
+        return (
+            f"ModemPorts({self.id}: at={self.at}, nmea={self.nmea}, "
+            f"qmi={self.qmi}, net={self.net})"
+        )
+
+
+def discover(sysfs=SYSFS_USB, vendor=QUECTEL_VENDOR):
+    """Find attached modems of vendor and map their USB interfaces to
+    device nodes. Returns [ModemPorts], ordered by USB path."""
+    root = Path(sysfs)
+    found = []
+    for device in sorted(root.iterdir() if root.is_dir() else ()):
+        if ":" in device.name or _read(device / "idVendor") != vendor:
+            continue
+        ports = ModemPorts(device.name, _read(device / "idProduct"), _read(device / "serial"))
+        for interface in device.parent.glob(f"{device.name}:*"):
+            number = _read(interface / "bInterfaceNumber")
+            if number is None:
+                continue
+            number = int(number, 16)
+            tty = _node(interface, "ttyUSB*", "tty/ttyUSB*")
+            if number == IF_DM:
+                ports.dm = tty and f"/dev/{tty}"
+            elif number == IF_NMEA:
+                ports.nmea = tty and f"/dev/{tty}"
+            elif number == IF_AT:
+                ports.at = tty and f"/dev/{tty}"
+            elif number == IF_MODEM:
+                ports.modem = tty and f"/dev/{tty}"
+            elif number == IF_QMI:
+                wdm = _node(interface, "usbmisc/cdc-wdm*", "usb/cdc-wdm*")
+                ports.qmi = wdm and f"/dev/{wdm}"
+                ports.net = _node(interface, "net/*")
+        if ports.complete:
+            found.append(ports)
+        else:
+            logger.warning(f"Skipping modem at {device.name}, missing ports: {ports}")
+    return found
+
+
+class Busy(Exception):
+    """The modem is still working on an earlier operation."""
+
+
+class ModemManager:
+    """Discovers the attached modems and runs operations on all of them in
+    parallel.
+
+    Every modem has its own worker and busy lock: an operation that
+    overruns its timeout is reported as a TimeoutError for that modem only,
+    and the modem is skipped (Busy) until it finishes, so one hung modem
+    never delays the others.
+    """
+
+    def __init__(
+        self, sim, sims=None, sysfs=SYSFS_USB, vendor=QUECTEL_VENDOR, max_workers=16, require_root=True, **interface_args
+    ):
+        if require_root:
+            ModemInterface.check_sudo()
+        self.sim = sim
+        self.sims = dict(sims or {})  # modem id or USB path -> SIM
+        self.sysfs = sysfs
+        self.vendor = vendor
+        self.interface_args = interface_args
+        self.modems = {}  # id -> Modem
+        self.ports = {}  # id -> ModemPorts
+        self._busy = {}  # id -> Lock
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ModemManager")
+        self._lock = threading.Lock()
+
+    def _sim_for(self, ports):
+        return self.sims.get(ports.id) or self.sims.get(ports.usb_path) or self.sim
+
+    def _open(self, ports):
+        modem = Modem(ports.interface(self._sim_for(ports), **self.interface_args))
+        modem.sms_flag_file = f"{modem.sms_flag_file}-{ports.id}"
+        return modem
+
+    def refresh(self, timeout=30):
+        """Pick up newly attached modems and drop ones that disappeared.
+        Returns {id: ModemPorts} of modems that could not be opened."""
+        present = {ports.id: ports for ports in discover(self.sysfs, self.vendor)}
+        with self._lock:
+            for modem_id in set(self.modems) - set(present):
+                logger.info(f"Modem {modem_id} is gone.")
+                self._close(modem_id)
+            new = {i: p for i, p in present.items() if i not in self.modems}
+        opened = self._map(new, self._open, timeout, abandon=self._close_late)
+        failed = {}
+        with self._lock:
+            for modem_id, result in opened.items():
+                if isinstance(result, Exception):
+                    logger.error(f"Could not open modem {modem_id}: {result}")
+                    failed[modem_id] = new[modem_id]
+                    continue
+                self.modems[modem_id] = result
+                self.ports[modem_id] = new[modem_id]
+                self._busy[modem_id] = threading.Lock()
+                logger.info(f"Added modem {new[modem_id]}")
+        return failed
+
+    @staticmethod
+    def _close_late(future):
+        """Close a Modem whose opening finished after refresh() gave up on
+        it, so it does not keep the ports locked."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        modem = future.result()
+        logger.warning(f"Closing {modem.interface.ATCommand}, opened after the refresh timed out.")
+        try:
+            modem.close()
+        except Exception as e:
+            logger.warning(f"Closing late modem failed: {e}")
+
+    def _run(self, modem_id, fn, item):
+        busy = self._busy.get(modem_id)
+        if busy is not None and not busy.acquire(blocking=False):
+            raise Busy(f"Modem {modem_id} is busy")
+        try:
+            return fn(item)
+        finally:
+            if busy is not None:
+                busy.release()
+
+    def _map(self, items, fn, timeout, abandon=None):
+        """Run fn(item) for every {id: item} concurrently; {id: result or
+        exception}. Returns after timeout even if some calls are still
+        running; those are cancelled if they have not started, and
+        abandon(future) is called when a running one finishes."""
+        futures = {
+            self._executor.submit(self._run, modem_id, fn, item): modem_id
+            for modem_id, item in items.items()
+        }
+        done, _ = wait(futures, timeout)
+        results = {}
+        for future, modem_id in futures.items():
+            if future not in done:
+                results[modem_id] = TimeoutError(f"Modem {modem_id} did not finish within {timeout}s")
+                if not future.cancel() and abandon is not None:
+                    future.add_done_callback(abandon)
+            elif future.exception() is not None:
+                results[modem_id] = future.exception()
+            else:
+                results[modem_id] = future.result()
+        return results
+
+    def run(self, fn, timeout=60, modem_ids=None):
+        """fn(modem) on all (or the given) modems at once; {id: result or exception}."""
+        with self._lock:
+            items = {i: m for i, m in self.modems.items() if modem_ids is None or i in modem_ids}
+        return self._map(items, fn, timeout)
+
+    def connect_all(self, timeout=120):
+        """Bring every modem's data connection up in parallel; {id: bool or exception}."""
+
+        def connect(modem):
+            if not modem.interface.connect(timeout=timeout):
+                return False
+            modem.enable_urcs()
+            return True
+
+        return self.run(connect, timeout + 5)
+
+    def health(self, timeout=10):
+        """{id: {"state", "internet", "signal"}} for every modem, plus
+        "radio" statistics for modems running a radio sampler."""
+
+        def check(modem):
+            status = {
+                "state": modem.interface.state_machine.resume().name,
+                "internet": modem.is_internet_up(),
+                "signal": modem.status.signal(),
+            }
+            if modem.radio is not None:
+                status["radio"] = modem.radio_stats()
+            return status
+
+        return self.run(check, timeout)
+
+    def send_sms(self, number, text, modem_id=None, timeout=120):
+        """Send through modem_id, or through the first connected modem that
+        accepts the message."""
+        if modem_id is not None:
+            return self.run(lambda modem: modem.send_sms(number, text), timeout, [modem_id])[modem_id]
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            # The last state the state machine reached; probing every modem
+            # first (health()) would cost AT and QMI round trips each time
+            candidates = [i for i, m in self.modems.items() if m.interface.state_machine.state > State.OFFLINE]
+        for candidate_id in candidates:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            results = self.run(lambda modem: modem.send_sms(number, text), remaining, [candidate_id])[candidate_id]
+            if not isinstance(results, Exception) and results and all(r.ok for r in results):
+                return results
+        return None
+
+    def send_sms_all(self, messages, timeout=300):
+        """{id: [(number, text), ...]} sent by each modem concurrently."""
+        with self._lock:
+            items = {i: (self.modems[i], batch) for i, batch in messages.items() if i in self.modems}
+        return self._map(items, lambda item: item[0].send_sms_batch(item[1]), timeout)
+
+    def _close(self, modem_id):
+        modem = self.modems.pop(modem_id, None)
+        self.ports.pop(modem_id, None)
+        self._busy.pop(modem_id, None)
+        if modem is not None:
+            try:
+                modem.close()
+            except Exception as e:
+                logger.warning(f"Closing modem {modem_id} failed: {e}")
+
+    def close(self):
+        with self._lock:
+            for modem_id in list(self.modems):
+                self._close(modem_id)
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        self.refresh()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,255 @@
+import re
+import threading
+import logging
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a fast AT round trip up to a slow network attach
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_COMMAND_NAME = re.compile(r"^AT[+&$%^]?[A-Z0-9]*[=?]?", re.IGNORECASE)
+
+
+def command_name(cmd) -> str:
+    """Argument-free label for an AT command: "AT+CMGS=23" -> "AT+CMGS=",
+    "AT+CMGD=1;+CMGD=2" -> "AT+CMGD=;"."""
+    match = _COMMAND_NAME.match(cmd)
+    name = match.group(0).upper() if match else cmd[:16]
+    return name + (";" if ";" in cmd else "")
+
+
+def shell_name(cmd) -> str:
+    """Low-cardinality label for a shell command line:
+    "sudo qmicli -d /dev/cdc-wdm0 --wds-start-network=..." -> "qmicli --wds-start-network",
+    "sudo ip link set wwan0 up" -> "ip link"."""
+    args = [a for a in cmd.split() if a != "sudo"]
+    if not args:
+        return ""
+    program = args[0].rsplit("/", 1)[-1]
+    action = next((a.split("=", 1)[0] for a in args[1:] if a.startswith("--")), None)
+    if action is None and len(args) > 1 and args[1].isalpha():
+        action = args[1]
+    return f"{program} {action}" if action else program
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect and two adds."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate of quantile q (0..1), interpolated within its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Family:
+    """A named metric with one child per label combination.
+
+    Child updates are plain attribute arithmetic without a lock; the
+    instrumented paths (AT, QMI, the state machine) already serialize
+    themselves, and an occasional lost increment is acceptable for metrics.
+    """
+
+    def __init__(self, name, kind, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = Histogram(self.buckets) if self.kind == "histogram" else Counter()
+                    self._children[values] = child
+        return child
+
+    def items(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def clear(self):
+        with self._lock:
+            self._children.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+
+    def _add(self, family):
+        self.families[family.name] = family
+        return family
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Family(name, "counter", help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Family(name, "histogram", help, labelnames, buckets))
+
+    def reset(self):
+        for family in self.families.values():
+            family.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        out = []
+        for family in self.families.values():
+            out.append(f"# HELP {family.name} {family.help}")
+            out.append(f"# TYPE {family.name} {family.kind}")
+            for values, metric in family.items():
+                if family.kind == "counter":
+                    out.append(f"{family.name}{_label_text(family.labelnames, values)} {metric.value}")
+                    continue
+                cumulative = 0
+                bounds = [str(b) for b in family.buckets] + ["+Inf"]
+                for bound, n in zip(bounds, metric.counts):
+                    cumulative += n
+                    labels = _label_text(family.labelnames, values, [("le", bound)])
+                    out.append(f"{family.name}_bucket{labels} {cumulative}")
+                labels = _label_text(family.labelnames, values)
+                out.append(f"{family.name}_sum{labels} {metric.sum}")
+                out.append(f"{family.name}_count{labels} {metric.count}")
+        return "\n".join(out) + "\n"
+
+    def snapshot(self) -> dict:
+        """Pull API: {metric: [{labels..., value | count/sum/p50/p90/p99}]}."""
+        out = {}
+        for family in self.families.values():
+            rows = []
+            for values, metric in family.items():
+                row = dict(zip(family.labelnames, values))
+                if family.kind == "counter":
+                    row["value"] = metric.value
+                else:
+                    row.update(
+                        count=metric.count,
+                        sum=metric.sum,
+                        p50=metric.quantile(0.5),
+                        p90=metric.quantile(0.9),
+                        p99=metric.quantile(0.99),
+                    )
+                rows.append(row)
+            out[family.name] = rows
+        return out
+
+
+REGISTRY = Registry()
+
+AT_SECONDS = REGISTRY.histogram(
+    "modem_at_command_seconds", "AT command round-trip time.", ("command",)
+)
+AT_RESULTS = REGISTRY.counter(
+    "modem_at_commands_total", "AT commands by final status (OK, ERROR, TIMEOUT).", ("command", "status")
+)
+PORT_BYTES = REGISTRY.counter(
+    "modem_port_bytes_total", "Bytes transferred on a serial port.", ("port", "direction")
+)
+SHELL_SECONDS = REGISTRY.histogram(
+    "modem_shell_command_seconds", "Run time of external commands (qmicli, ip, ...).", ("command",)
+)
+SHELL_FAILURES = REGISTRY.counter(
+    "modem_shell_command_failures_total", "External commands that exited non-zero.", ("command",)
+)
+QMI_SECONDS = REGISTRY.histogram(
+    "modem_qmi_request_seconds", "QMI request round-trip time.", ("service", "message")
+)
+QMI_ERRORS = REGISTRY.counter(
+    "modem_qmi_errors_total", "QMI requests that failed or timed out.", ("service", "message", "error")
+)
+STEP_SECONDS = REGISTRY.histogram(
+    "modem_connection_step_seconds", "Time spent in one connection state machine step.", ("state", "result")
+)
+CONNECT_SECONDS = REGISTRY.histogram(
+    "modem_connect_seconds", "Duration of connection runs by starting state.", ("from_state", "result")
+)
+CONNECTION_DROPS = REGISTRY.counter(
+    "modem_connection_drops_total", "Times the connection fell back to an earlier state.", ("to_state",)
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class MetricsServer:
+    """Serves registry at http://host:port/metrics from a daemon thread."""
+
+    def __init__(self, registry=REGISTRY, port=9105, host="127.0.0.1"):
+        handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="MetricsServer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"Serving metrics on http://{self.httpd.server_address[0]}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -2,38 +2,169 @@
 
 import logging
 import os
+import socket
+import threading
 import time
 from datetime import datetime
 from modem.card import SIM
 from modem.interface import ModemInterface
 from modem.serial import Serial
 from modem.at import AT
+from modem.reader import ATReader
+from modem.connection import State
+from modem.probe import ConnectivityProber
+from modem.sms import SMSInbox
+from modem.sockets import SocketStack
+from modem.transfer import FTPClient, HTTPClient
+from modem.nmea import NMEAStream
+from modem.radio import RadioSampler
+from modem.provision import Profile
+from modem.status import StatusCache
+from modem.metrics import REGISTRY, MetricsServer
+from modem.telemetry import Telemetry, fix_record
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
-)
 logger = logging.getLogger(__name__)
 
 
 class Modem:
     def __init__(self, interface: ModemInterface):
+        """Open the AT port and start reading from it. Raises PortBusyError
+        if another process holds the port, or OSError if it cannot be
+        opened at all."""
         self.timeout = 1
         self.interface = interface
         self.serial = Serial(interface)
-        self.at = AT(self.serial.serial_conn)
+        self.reader = ATReader(self.serial.serial_conn)
+        self.reader.subscribe("+CREG:", self._on_registration)
+        self.reader.subscribe("+CEREG:", self._on_registration)
+        self.reader.subscribe("+C5GREG:", self._on_registration)
+        self.reader.subscribe("RDY", self._on_modem_ready)
+        self.reader.start()
+        self.at = AT(self.serial.serial_conn, reader=self.reader)
+        self.inbox = SMSInbox(self.at, self.reader)
+        self.status = StatusCache(self.at, self.reader)
         self.sms_flag_file = "/tmp/sms_sent_once"
+        self.prober = ConnectivityProber(interface=interface.interface)
+        self.gps_stream = None
+        self.radio = None
+        self.telemetry = None
+        self.sockets = SocketStack(self.at, self.reader)
+        # Set by URC handlers to cut monitor_connection's sleep short
+        self._wake = threading.Event()
+        self.metrics_server = None
 
     def connect(self):
         self.interface.connect()
+        self.enable_urcs()
+
+    def enable_urcs(self):
+        """Ask the modem to report registration changes and new SMS as URCs."""
+        Profile(registration_urcs=1, sms_routing="2,1,0,0,0").apply(self.at)
+
+    def provision(self, profile=None, reattach=True):
+        """Bring the modem's configuration in line with profile (by default
+        the SIM's APN and PIN); only settings that differ are written.
+        Returns the Changes made."""
+        if profile is None:
+            profile = Profile.from_sim(self.interface.sim)
+        changes = profile.apply(self.at, reattach=reattach)
+        if any(change.name == "sms_format" for change in changes):
+            self.at.sms.invalidate()
+        return changes
+
+    def on_urc(self, prefix, callback):
+        """Register callback(line) for URCs starting with prefix."""
+        return self.reader.subscribe(prefix, callback)
+
+    def open_socket(self, host, port, kind="TCP", timeout=60):
+        """TCP/UDP connection over the modem's own IP stack (AT+QIOPEN),
+        usable when the wwan0 data path is down."""
+        return self.sockets.connect(host, port, kind, timeout)
+
+    def ftp(self, host, port=21, user="anonymous", password="", **kwargs) -> FTPClient:
+        """Client for streamed, resumable FTP transfers through the modem."""
+        return FTPClient(self.at, self.reader, host, port, user, password, **kwargs)
+
+    def http(self, headers=None, **kwargs) -> HTTPClient:
+        """Client for streamed, resumable HTTP(S) transfers through the modem."""
+        return HTTPClient(self.at, self.reader, headers, **kwargs)
+
+    def close(self):
+        """Stop background threads and release the ports."""
+        self.stop_telemetry()
+        self.sockets.close()
+        if self.gps_stream is not None:
+            self.stop_gps_stream()
+        self.stop_radio_sampler()
+        self.reader.stop()
+        self.serial.close_serial()
+        self.interface.close()
+
+    def start_telemetry(self, directory, host, port=1883, topic=None, via_modem=False, gps_interval=30, radio_interval=60, **kwargs):
+        """Spool GPS fixes, radio statistics and telemetry.record() data in
+        directory and upload them to an MQTT broker in compressed batches
+        while the link is up (see modem.telemetry). With via_modem, the
+        broker is reached over the modem's own TCP stack instead of wwan0."""
+        if self.telemetry is not None and self.telemetry.is_alive():
+            return self.telemetry
+        client_id = self.status.imei() or "modem"
+        if via_modem:
+            connect = lambda: self.open_socket(host, port)
+        else:
+            connect = lambda: socket.create_connection((host, port), timeout=30)
+        self.telemetry = Telemetry(directory, connect, topic or f"modems/{client_id}/telemetry", client_id, **kwargs)
+        if gps_interval:
+            self.telemetry.add_source("gps", self._gps_record, gps_interval)
+        if radio_interval:
+            self.telemetry.add_source("radio", lambda: self.radio_stats(radio_interval) if self.radio else None, radio_interval)
+        self.telemetry.start()
+        return self.telemetry
+
+    def stop_telemetry(self):
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry = None
+
+    def _gps_record(self):
+        fix = self.gps_stream.latest if self.gps_stream is not None else None
+        return fix_record(fix) if fix is not None and fix.has_fix() else None
+
+    def metrics(self) -> dict:
+        """Latency histograms and counters collected so far (see modem.metrics)."""
+        return REGISTRY.snapshot()
+
+    def serve_metrics(self, port=9105, host="127.0.0.1"):
+        """Expose metrics in Prometheus text format at http://host:port/metrics."""
+        if self.metrics_server is None:
+            self.metrics_server = MetricsServer(REGISTRY, port, host).start()
+        return self.metrics_server
+
+    def _on_registration(self, line):
+        # +CREG: <stat>[,...]; 1 = home, 5 = roaming
+        stat = line.split(":", 1)[1].split(",")[0].strip()
+        if stat not in ("1", "5"):
+            logger.warning(f"Network registration lost: {line}")
+            self.interface.state_machine.invalidate(State.SIM_READY)
+            self._wake.set()
+        else:
+            self.interface.state_machine.notify()
+
+    def _on_modem_ready(self, line):
+        logger.warning("Modem restarted (RDY).")
+        self.at.sms.invalidate()
+        self.interface.state_machine.invalidate(State.OFFLINE)
+        self._wake.set()
 
     def is_internet_up(self) -> bool:
-        return self.interface.run_command(cmd=f"ping -c 2 8.8.8.8")
+        return self.prober.is_up()
 
     def monitor_connection(self, check_interval=30):
         while True:
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            if not self.is_internet_up():
+            up = self.is_internet_up()
+            if self.telemetry is not None:
+                self.telemetry.set_online(up)
+            if not up:
                 if not self.has_sms_been_sent():
                     logging.warning(
                         f"{now}: Internet down. Restarting PPP and sending SMS."
@@ -53,13 +184,23 @@ class Modem:
                     logging.info(f"{now}: Internet back. SMS flag cleared.")
                 else:
                     logging.debug(f"{now}: Internet up and running.")
-            time.sleep(check_interval)
+            self._wake.wait(check_interval)
+            self._wake.clear()
 
     def send_sms(self, phoneNumber, text):
-        self.at.send_sms(phoneNumber=phoneNumber, text=text)
+        return self.at.send_sms(phoneNumber=phoneNumber, text=text)
+
+    def send_sms_batch(self, messages):
+        """Send [(phoneNumber, text), ...] reusing one SMS session setup."""
+        return self.at.sms.send_many(messages)
 
     def receive_sms(self):
-        raise NotImplementedError("Receive Sms is not yet implemented.")
+        """Drain the SIM's SMS storage; returns complete SMSMessages."""
+        return self.inbox.drain()
+
+    def incoming_sms(self, timeout=None):
+        """Generator yielding messages as +CMTI notifications arrive."""
+        return self.inbox.messages(timeout=timeout)
 
     def has_sms_been_sent(self):
         return os.path.exists(self.sms_flag_file)
@@ -71,9 +212,59 @@ class Modem:
         if os.path.exists(self.sms_flag_file):
             os.remove(self.sms_flag_file)
 
+    def start_gps_stream(self, track=None):
+        """Keep GNSS running and stream NMEA from the modem's NMEA port.
+        Valid fixes are also appended to track (a TrackBuffer) if given."""
+        if self.gps_stream is not None and self.gps_stream.is_alive():
+            return self.gps_stream
+        if not self.at.start_gnss():
+            return None
+        self.gps_stream = NMEAStream(
+            self.interface.nmea_port,
+            self.interface.baudrate,
+            track=track,
+            transport=self.interface.transport,
+        )
+        self.gps_stream.start()
+        return self.gps_stream
+
+    def stop_gps_stream(self):
+        if self.gps_stream is not None:
+            self.gps_stream.stop()
+            self.gps_stream = None
+        self.at.stop_gnss()
+
+    def start_radio_sampler(self, interval=1.0, capacity=3600, **kwargs):
+        """Poll serving/neighbour cell metrics (AT+QENG) in the background;
+        read them with radio_stats()."""
+        if self.radio is not None and self.radio.is_alive():
+            return self.radio
+        self.radio = RadioSampler(self.at, interval, capacity, **kwargs)
+        self.radio.start()
+        return self.radio
+
+    def stop_radio_sampler(self):
+        if self.radio is not None:
+            self.radio.stop()
+            self.radio = None
+
+    def radio_stats(self, seconds=30):
+        """Signal statistics over the last seconds, or None without a sampler."""
+        return self.radio.stats(seconds) if self.radio is not None else None
+
+    def get_gps_fix(self):
+        """Latest GPSFix from the stream, or None before the first fix."""
+        if self.gps_stream is None:
+            self.start_gps_stream()
+            return None
+        return self.gps_stream.latest
+
     def get_gps_coordinates(self):
         """
-        Prototype method to get GPS coordinates from the modem.
-        Should return a tuple (latitude, longitude).
+        Return the cached (latitude, longitude) of the latest fix right away,
+        or None while there is no fix. Starts streaming on first use.
         """
-        raise NotImplementedError("GPS coordinate retrieval is not yet implemented.")
\ No newline at end of file
+        fix = self.get_gps_fix()
+        if fix is None or not fix.has_fix():
+            return None
+        return fix.latitude, fix.longitude
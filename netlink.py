@@ -0,0 +1,225 @@
+import errno
+import ipaddress
+import os
+import socket
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+
+NETLINK_ROUTE = 0
+
+# Message types (linux/rtnetlink.h)
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+
+# Flags
+NLM_F_REQUEST = 0x001
+NLM_F_ACK = 0x004
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_DUMP = 0x300
+NLM_F_CREATE = 0x400
+
+# Attributes
+IFLA_MTU = 4
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+
+IFF_UP = 0x1
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_LINK = 253
+RT_SCOPE_NOWHERE = 255
+RTN_UNICAST = 1
+
+NLMSG_HEADER = struct.Struct("=IHHII")  # len, type, flags, seq, pid
+IFINFOMSG = struct.Struct("=BxHiII")  # family, type, index, flags, change
+IFADDRMSG = struct.Struct("=BBBBi")  # family, prefixlen, flags, scope, index
+# Routes get ROUTE_METRIC + ifindex unless a metric is given, so every modem
+# interface has its own default route next to the host's (lower) ones
+ROUTE_METRIC = 700
+
+RTMSG = struct.Struct("=BBBBBBBBI")  # family, dst_len, src_len, tos, table, protocol, scope, type, flags
+RTATTR = struct.Struct("=HH")  # len, type
+
+
+class NetlinkError(OSError):
+    pass
+
+
+def _align(n):
+    return (n + 3) & ~3
+
+
+def _attr(kind, value) -> bytes:
+    data = RTATTR.pack(RTATTR.size + len(value), kind) + value
+    return data + b"\0" * (_align(len(data)) - len(data))
+
+
+def _attrs(data, offset):
+    """{type: bytes} of the rtattrs in data from offset."""
+    out = {}
+    while offset + RTATTR.size <= len(data):
+        length, kind = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        out[kind] = data[offset + RTATTR.size : offset + length]
+        offset += _align(length)
+    return out
+
+
+class Netlink:
+    """Minimal rtnetlink client: link flags and MTU, IPv4 addresses and
+    routes. Every request is acknowledged by the kernel; failures raise
+    NetlinkError with the kernel's errno. Needs CAP_NET_ADMIN."""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.sock.bind((0, 0))
+        self._seq = 0
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _request(self, kind, flags, body):
+        """Send one message and return the payloads of the replies (for
+        dumps) once the kernel acknowledges or finishes it."""
+        self._seq += 1
+        seq = self._seq
+        self.sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(body), kind, flags | NLM_F_REQUEST, seq, 0) + body)
+        replies = []
+        while True:
+            data = self.sock.recv(65536)
+            offset = 0
+            while offset + NLMSG_HEADER.size <= len(data):
+                length, msg_type, _, msg_seq, _ = NLMSG_HEADER.unpack_from(data, offset)
+                payload = data[offset + NLMSG_HEADER.size : offset + length]
+                offset += _align(length)
+                if msg_seq != seq:
+                    continue
+                if msg_type == NLMSG_DONE:
+                    return replies
+                if msg_type == NLMSG_ERROR:
+                    code = -struct.unpack_from("=i", payload)[0]
+                    if code:
+                        raise NetlinkError(code, f"{os.strerror(code)} (netlink message {kind})")
+                    return replies
+                replies.append((msg_type, payload))
+
+    def set_link(self, index, up=True, mtu=None):
+        body = IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, IFF_UP if up else 0, IFF_UP)
+        if mtu:
+            body += _attr(IFLA_MTU, struct.pack("=I", mtu))
+        self._request(RTM_NEWLINK, NLM_F_ACK, body)
+
+    def addresses(self, index):
+        """[(address, prefix_length)] of the IPv4 addresses on index."""
+        out = []
+        for msg_type, payload in self._request(RTM_GETADDR, NLM_F_DUMP, IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)):
+            family, prefix, _, _, ifindex = IFADDRMSG.unpack_from(payload)
+            if msg_type != RTM_NEWADDR or family != socket.AF_INET or ifindex != index:
+                continue
+            attrs = _attrs(payload, IFADDRMSG.size)
+            address = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+            if address:
+                out.append((socket.inet_ntoa(address), prefix))
+        return out
+
+    def _address_message(self, kind, flags, index, address, prefix_length):
+        packed = socket.inet_aton(address)
+        body = IFADDRMSG.pack(socket.AF_INET, prefix_length, 0, RT_SCOPE_UNIVERSE, index)
+        body += _attr(IFA_LOCAL, packed) + _attr(IFA_ADDRESS, packed)
+        self._request(kind, flags, body)
+
+    def add_address(self, index, address, prefix_length):
+        self._address_message(RTM_NEWADDR, NLM_F_ACK | NLM_F_CREATE | NLM_F_REPLACE, index, address, prefix_length)
+
+    def delete_address(self, index, address, prefix_length):
+        self._address_message(RTM_DELADDR, NLM_F_ACK, index, address, prefix_length)
+
+    def _route_message(self, kind, flags, index, destination, prefix_length, gateway, metric, scope, rtype):
+        body = RTMSG.pack(socket.AF_INET, prefix_length, 0, 0, RT_TABLE_MAIN, RTPROT_BOOT, scope, rtype, 0)
+        if prefix_length:
+            body += _attr(RTA_DST, socket.inet_aton(destination))
+        body += _attr(RTA_OIF, struct.pack("=i", index))
+        if gateway:
+            body += _attr(RTA_GATEWAY, socket.inet_aton(gateway))
+        if metric is not None:
+            body += _attr(RTA_PRIORITY, struct.pack("=I", metric))
+        self._request(kind, flags, body)
+
+    def add_route(self, index, destination="0.0.0.0", prefix_length=0, gateway=None, metric=None):
+        """Add a main-table route through index; without a gateway the
+        route is on-link. Fails with EEXIST if the table already has a route
+        to destination with the same metric."""
+        scope = RT_SCOPE_UNIVERSE if gateway else RT_SCOPE_LINK
+        flags = NLM_F_ACK | NLM_F_CREATE | NLM_F_EXCL
+        self._route_message(RTM_NEWROUTE, flags, index, destination, prefix_length, gateway, metric, scope, RTN_UNICAST)
+
+    def delete_route(self, index, destination="0.0.0.0", prefix_length=0, metric=None):
+        """Delete the route to destination through index. Routes through
+        other interfaces do not match (ESRCH)."""
+        self._route_message(RTM_DELROUTE, NLM_F_ACK, index, destination, prefix_length, None, metric, RT_SCOPE_NOWHERE, 0)
+
+    def set_route(self, index, destination="0.0.0.0", prefix_length=0, gateway=None, metric=None):
+        """Add a route through index, replacing an earlier route of the same
+        interface and metric. A route of another interface with that metric
+        is left in place and the EEXIST is raised."""
+        try:
+            self.add_route(index, destination, prefix_length, gateway, metric)
+        except NetlinkError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            self.delete_route(index, destination, prefix_length, metric)
+            self.add_route(index, destination, prefix_length, gateway, metric)
+
+
+def configure_link(ifname, address, prefix_length, gateway=None, mtu=None, metric=None):
+    """Apply modem-reported IPv4 settings to ifname: MTU and link up, the
+    address (replacing any other IPv4 address), and a default route.
+
+    The default route goes via gateway when the kernel accepts it and is
+    on-link otherwise, which is all a raw-IP interface needs. It uses
+    metric, or ROUTE_METRIC + the interface index, and only ever replaces
+    a route of ifname itself: default routes of other interfaces stay.
+    """
+    index = socket.if_nametoindex(ifname)
+    if metric is None:
+        metric = ROUTE_METRIC + index
+    with Netlink() as nl:
+        nl.set_link(index, up=True, mtu=mtu)
+        for old, old_prefix in nl.addresses(index):
+            if (old, old_prefix) != (address, prefix_length):
+                logger.info(f"Removing stale address {old}/{old_prefix} from {ifname}")
+                nl.delete_address(index, old, old_prefix)
+        nl.add_address(index, address, prefix_length)
+        network = ipaddress.ip_network(f"{address}/{prefix_length}", strict=False)
+        if gateway and ipaddress.ip_address(gateway) not in network:
+            # Gateway outside the assigned subnet: make it reachable first
+            nl.set_route(index, gateway, 32, metric=metric)
+        try:
+            nl.set_route(index, gateway=gateway, metric=metric)
+        except NetlinkError as e:
+            if not gateway or e.errno not in (errno.ENETUNREACH, errno.EINVAL):
+                raise
+            logger.info(f"Gateway {gateway} rejected ({e}); using an on-link default route.")
+            nl.set_route(index, metric=metric)
+    logger.info(f"{ifname} configured: {address}/{prefix_length} via {gateway or 'link'}, mtu {mtu}, metric {metric}")
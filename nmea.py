@@ -0,0 +1,250 @@
+import queue
+import threading
+import time
+import logging
+import serial
+from datetime import datetime, timezone
+from modem.gps import GPSFix
+from modem.metrics import PORT_BYTES
+from modem.tracing import TRACE
+from modem.transport import open_port
+
+logger = logging.getLogger(__name__)
+
+KNOTS_TO_KMH = 1.852
+
+
+def checksum_ok(sentence) -> bool:
+    """Validate the *hh checksum of a "$...*hh" sentence."""
+    if not sentence.startswith("$") or len(sentence) < 4 or sentence[-3] != "*":
+        return False
+    calculated = 0
+    for char in sentence[1:-3]:
+        calculated ^= ord(char)
+    try:
+        return calculated == int(sentence[-2:], 16)
+    except ValueError:
+        return False
+
+
+def parse_sentence(sentence):
+    """Split a checked sentence into (type, fields); "GPGGA" -> "GGA"."""
+    sentence = sentence.strip()
+    if not checksum_ok(sentence):
+        return None
+    fields = sentence[1:-3].split(",")
+    return fields[0][2:], fields[1:]
+
+
+def _degrees(value, hemisphere):
+    """ddmm.mmmm / dddmm.mmmm plus N/S/E/W to signed decimal degrees."""
+    if not value:
+        return None
+    dot = value.find(".")
+    split = (dot if dot >= 0 else len(value)) - 2
+    degrees = float(value[:split]) + float(value[split:]) / 60
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+def _float(value):
+    return float(value) if value else None
+
+
+class Satellite:
+    __slots__ = ("prn", "elevation", "azimuth", "snr")
+
+    def __init__(self, prn, elevation, azimuth, snr):
+        self.prn = prn
+        self.elevation = elevation
+        self.azimuth = azimuth
+        self.snr = snr
+
+    def __repr__(self):
+        return f"Satellite(prn={self.prn}, el={self.elevation}, az={self.azimuth}, snr={self.snr})"
+
+
+class NMEAParser:
+    """Incremental GGA/RMC/GSA/GSV parser.
+
+    feed() takes one sentence at a time and returns a GPSFix whenever a
+    GGA completes a position; RMC, GSA and GSV data seen for the same epoch
+    is merged into it.
+    """
+
+    def __init__(self):
+        self.date = None
+        self._day = None
+        self.speed = None
+        self.course = None
+        self.fix_type = None
+        self.pdop = self.hdop = self.vdop = None
+        self.satellites_used = ()
+        self.satellites = {}
+        self._gsv = {}
+        self.errors = 0
+
+    def feed(self, sentence):
+        parsed = parse_sentence(sentence)
+        if parsed is None:
+            if sentence.strip():
+                self.errors += 1
+            return None
+        kind, fields = parsed
+        handler = getattr(self, f"_on_{kind.lower()}", None)
+        if handler is None:
+            return None
+        try:
+            return handler(fields)
+        except (ValueError, IndexError) as e:
+            self.errors += 1
+            logger.debug(f"Bad {kind} sentence {sentence!r}: {e}")
+            return None
+
+    def _on_rmc(self, f):
+        # time, status, lat, N/S, lon, E/W, speed knots, course, date ddmmyy, ...
+        if f[8] and f[8] != self.date:
+            self.date = f[8]
+            self._day = (
+                datetime.strptime(f[8], "%d%m%y").replace(tzinfo=timezone.utc).timestamp()
+            )
+        self.speed = _float(f[6]) * KNOTS_TO_KMH if f[6] else None
+        self.course = _float(f[7])
+        return None
+
+    def _on_gsa(self, f):
+        # mode, fix type (1 none, 2 2D, 3 3D), 12 PRNs, PDOP, HDOP, VDOP
+        self.fix_type = int(f[1]) if f[1] else None
+        self.satellites_used = tuple(int(p) for p in f[2:14] if p)
+        self.pdop, self.hdop, self.vdop = (_float(v) for v in f[14:17])
+        return None
+
+    def _on_gsv(self, f):
+        # total sentences, sentence number, satellites in view, 4x (prn, el, az, snr)
+        total, number = int(f[0]), int(f[1])
+        if number == 1:
+            self._gsv = {}
+        for i in range(3, len(f) - 3, 4):
+            if f[i]:
+                prn = int(f[i])
+                self._gsv[prn] = Satellite(prn, _float(f[i + 1]), _float(f[i + 2]), _float(f[i + 3]))
+        if number == total:
+            self.satellites = self._gsv
+        return None
+
+    def _on_gga(self, f):
+        # time, lat, N/S, lon, E/W, quality, satellites, HDOP, altitude, M, ...
+        quality = int(f[5]) if f[5] else 0
+        return GPSFix(
+            self._epoch(f[0]),
+            _degrees(f[1], f[2]),
+            _degrees(f[3], f[4]),
+            _float(f[8]) or 0.0,
+            self.speed or 0.0,
+            quality,
+        )
+
+    def _epoch(self, hhmmss):
+        if not hhmmss:
+            return None
+        day = self._day
+        if day is None:  # no RMC date yet, assume today (UTC)
+            now = datetime.now(timezone.utc)
+            day = now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        seconds = int(hhmmss[0:2]) * 3600 + int(hhmmss[2:4]) * 60 + float(hhmmss[4:])
+        return day + seconds
+
+
+class NMEAStream(threading.Thread):
+    """Reads the modem's NMEA port continuously and keeps the latest fix.
+
+    GNSS must be running with NMEA output on the USB NMEA port (see
+    AT.start_gnss()). latest is updated in place; fixes() yields every new
+    position as it is parsed.
+    """
+
+    def __init__(self, port, baudrate=115200, maxsize=100, track=None, transport="auto"):
+        super().__init__(name="NMEAStream", daemon=True)
+        self.port = port
+        self.baudrate = baudrate
+        self.transport = transport
+        self.track = track  # optional TrackBuffer that records every valid fix
+        self.parser = NMEAParser()
+        self.latest = None
+        self.latest_time = None
+        self._subscribers = []
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._running = threading.Event()
+
+    def fixes(self, timeout=None):
+        """Generator of new fixes; stops after timeout seconds without one."""
+        q = queue.Queue(self._maxsize)
+        with self._lock:
+            self._subscribers.append(q)
+        try:
+            while True:
+                try:
+                    yield q.get(timeout=timeout)
+                except queue.Empty:
+                    return
+        finally:
+            with self._lock:
+                self._subscribers.remove(q)
+
+    def _publish(self, fix):
+        with self._lock:
+            self.latest = fix
+            self.latest_time = time.monotonic()
+            subscribers = list(self._subscribers)
+        if self.track is not None and fix.has_fix():
+            self.track.append(fix)
+        for q in subscribers:
+            try:
+                q.put_nowait(fix)
+            except queue.Full:
+                q.get_nowait()  # drop the oldest fix for slow consumers
+                q.put_nowait(fix)
+
+    def feed(self, line):
+        fix = self.parser.feed(line)
+        if fix is not None:
+            self._publish(fix)
+        return fix
+
+    def run(self):
+        self._running.set()
+        try:
+            conn = open_port(self.port, self.baudrate, timeout=1, transport=self.transport)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not open NMEA port {self.port}: {e}")
+            self._running.clear()
+            return
+        logger.info(f"Streaming NMEA from {self.port}.")
+        framed = hasattr(conn, "read_lines")
+        bytes_in = PORT_BYTES.labels(self.port, "in")
+        trace = TRACE.channel(self.port)
+        try:
+            while self._running.is_set():
+                try:
+                    if framed:
+                        for view in conn.read_lines(1):
+                            bytes_in.inc(len(view) + 1)
+                            trace.rx(view, b"\n")
+                            self.feed(str(view, "ascii", "ignore"))
+                        continue
+                    line = conn.readline()
+                except (OSError, serial.SerialException) as e:
+                    logger.error(f"NMEA stream stopped: {e}")
+                    break
+                if line:
+                    bytes_in.inc(len(line))
+                    trace.rx(line)
+                    self.feed(line.decode("ascii", errors="ignore"))
+        finally:
+            conn.close()
+        self._running.clear()
+
+    def stop(self, timeout=2):
+        self._running.clear()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
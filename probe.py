@@ -0,0 +1,190 @@
+import errno
+import os
+import random
+import selectors
+import socket
+import struct
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+SO_BINDTODEVICE = getattr(socket, "SO_BINDTODEVICE", 25)
+
+# (host, port, kind); kind is "tcp" (connect) or "dns" (UDP query)
+DEFAULT_TARGETS = (
+    ("8.8.8.8", 53, "dns"),
+    ("1.1.1.1", 53, "dns"),
+    ("1.1.1.1", 443, "tcp"),
+)
+
+
+def link_state(interface):
+    """(operstate, carrier) from sysfs; carrier is None when unreadable."""
+    base = f"/sys/class/net/{interface}"
+    try:
+        with open(f"{base}/operstate") as f:
+            operstate = f.read().strip()
+    except OSError:
+        return "missing", None
+    try:
+        with open(f"{base}/carrier") as f:
+            carrier = f.read().strip() == "1"
+    except OSError:
+        carrier = None  # reading carrier fails with EINVAL while the link is down
+    return operstate, carrier
+
+
+def link_up(interface) -> bool:
+    operstate, carrier = link_state(interface)
+    # Raw-IP WWAN devices usually report operstate "unknown" when up
+    return operstate in ("up", "unknown") and carrier is not False
+
+
+def dns_query(query_id):
+    """Minimal DNS query for the root NS records; any answer proves reachability."""
+    return struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + b"\x00" + struct.pack(">HH", 2, 1)
+
+
+class ProbeResult:
+    __slots__ = ("target", "ok", "rtt", "timestamp")
+
+    def __init__(self, target, ok, rtt, timestamp):
+        self.target = target
+        self.ok = ok
+        self.rtt = rtt
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        host, port, kind = self.target
+        rtt = f"{self.rtt * 1000:.1f}ms" if self.rtt is not None else "-"
+        return f"ProbeResult({kind}://{host}:{port}, ok={self.ok}, rtt={rtt})"
+
+
+class ConnectivityProber:
+    """In-process connectivity checks bound to the WWAN interface.
+
+    All targets of a round are probed concurrently on non-blocking sockets
+    from the calling thread; results are kept in a rolling window for loss
+    and RTT statistics.
+    """
+
+    def __init__(self, interface="wwan0", targets=DEFAULT_TARGETS, timeout=2.0, window=30):
+        self.interface = interface
+        self.targets = tuple(targets)
+        self.timeout = timeout
+        self.results = deque(maxlen=window)
+
+    def _socket(self, kind):
+        sock = socket.socket(
+            socket.AF_INET, socket.SOCK_STREAM if kind == "tcp" else socket.SOCK_DGRAM
+        )
+        sock.setblocking(False)
+        if self.interface:
+            sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, self.interface.encode())
+        return sock
+
+    def _start(self, target, sel):
+        host, port, kind = target
+        sock = self._socket(kind)
+        if kind == "tcp":
+            err = sock.connect_ex((host, port))
+            if err not in (0, errno.EINPROGRESS):
+                sock.close()
+                raise OSError(err, os.strerror(err))
+            sel.register(sock, selectors.EVENT_WRITE, (target, None))
+        else:
+            query_id = random.getrandbits(16)
+            sock.sendto(dns_query(query_id), (host, port))
+            sel.register(sock, selectors.EVENT_READ, (target, query_id))
+
+    @staticmethod
+    def _finish(sock, query_id):
+        if query_id is None:
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            # A refused connection still proves the path to the host works
+            return err in (0, errno.ECONNREFUSED)
+        data = sock.recv(512)
+        return len(data) >= 4 and struct.unpack(">H", data[:2])[0] == query_id and data[2] & 0x80
+
+    def probe_once(self, timeout=None):
+        """Probe every target once, concurrently. Returns the round's results."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        results = []
+        with selectors.DefaultSelector() as sel:
+            for target in self.targets:
+                try:
+                    self._start(target, sel)
+                except OSError as e:
+                    logger.debug(f"Probe {target} failed to start: {e}")
+                    results.append(ProbeResult(target, False, None, start))
+            while sel.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for key, _ in sel.select(remaining):
+                    target, query_id = key.data
+                    try:
+                        ok = bool(self._finish(key.fileobj, query_id))
+                    except OSError:
+                        ok = False
+                    rtt = time.monotonic() - start
+                    results.append(ProbeResult(target, ok, rtt if ok else None, start))
+                    sel.unregister(key.fileobj)
+                    key.fileobj.close()
+            for key in list(sel.get_map().values()):
+                results.append(ProbeResult(key.data[0], False, None, start))
+                sel.unregister(key.fileobj)
+                key.fileobj.close()
+        self.results.extend(results)
+        return results
+
+    def is_up(self, confirm=2) -> bool:
+        """Link is up and at least one target answers. A failed round is
+        repeated up to confirm times before reporting the link down, so a
+        single lost packet does not trigger a reconnect."""
+        if not link_up(self.interface):
+            logger.info(f"{self.interface} link is down.")
+            return False
+        for _ in range(max(1, confirm)):
+            if any(r.ok for r in self.probe_once()):
+                return True
+        return False
+
+    def loss(self) -> float:
+        if not self.results:
+            return 0.0
+        return sum(1 for r in self.results if not r.ok) / len(self.results)
+
+    def rtt_stats(self):
+        """(min, avg, max) RTT in seconds over the window, or None."""
+        rtts = [r.rtt for r in self.results if r.ok]
+        if not rtts:
+            return None
+        return min(rtts), sum(rtts) / len(rtts), max(rtts)
+
+    def watch(self, interval=0.25, timeout=0.5, failures=2):
+        """Sub-second detection mode: yield True/False whenever connectivity
+        changes. The link state is checked every interval; targets are
+        probed with a short timeout and the link is declared down after
+        failures consecutive bad rounds."""
+        state = None
+        bad = 0
+        while True:
+            started = time.monotonic()
+            if not link_up(self.interface):
+                up = False
+                bad = failures
+            elif any(r.ok for r in self.probe_once(timeout)):
+                up = True
+                bad = 0
+            else:
+                bad += 1
+                up = state if bad < failures else False
+            if up is not None and up != state:
+                state = up
+                yield state
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
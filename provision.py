@@ -0,0 +1,307 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _payloads(response, prefix, key=None):
+    """Payloads of the lines starting with prefix; with key, the rest of
+    the lines whose first field is "key" (as in +QNWPREFCFG: "lte_band",1:3)."""
+    out = []
+    for value in response.values(prefix):
+        if key is None:
+            out.append(value)
+            continue
+        name, _, rest = value.partition(",")
+        if name.strip('"').lower() == key:
+            out.append(rest)
+    return out
+
+
+def _first(response, prefix, key=None):
+    values = _payloads(response, prefix, key)
+    return values[0].strip().strip('"') if values else None
+
+
+def _ints(value):
+    """(1, 3, 7) from "1:3:7", "1,3,7" or any iterable of numbers."""
+    if isinstance(value, str):
+        value = value.replace(":", ",").split(",")
+    return tuple(int(v) for v in value if str(v).strip())
+
+
+class Setting:
+    """One configurable modem setting.
+
+    query reads it (one command, or a tuple of them; a profile reads all
+    its settings with AT.batch()),
+    parse(response) turns the reply into a value comparable with
+    normalize(desired), and commands(current, desired) are the writes that
+    bring the modem from current to desired. reattach marks settings that
+    only take effect on the next network attach.
+    """
+
+    def __init__(self, query, parse, commands, normalize=None, matches=None, reattach=False, secret=False):
+        self.query = query
+        self.parse = parse
+        self.commands = commands
+        self.normalize = normalize or (lambda value: value)
+        self.matches = matches or (lambda current, desired: current == desired)
+        self.reattach = reattach
+        self.secret = secret
+
+
+def _config(command, prefix, key, normalize=str, render=None):
+    """Setting stored as AT<command>="key",<value> (QNWPREFCFG, QGPSCFG, ...)."""
+    render = render or (lambda value: f'"{value}"')
+
+    def parse(response):
+        value = _first(response, prefix, key)
+        return None if value is None else normalize(value)
+
+    return Setting(
+        f'AT{command}="{key}"',
+        parse,
+        lambda current, desired: [f'AT{command}="{key}",{render(desired)}'],
+        normalize,
+    )
+
+
+def _parse_pin(response):
+    return _first(response, "+CPIN:")
+
+
+def _parse_contexts(response):
+    contexts = {}
+    for value in response.values("+CGDCONT:"):
+        fields = [f.strip().strip('"') for f in value.split(",")]
+        if len(fields) >= 3 and fields[0].isdigit():
+            contexts[int(fields[0])] = (fields[1].upper(), fields[2])
+    return contexts
+
+
+def _normalize_contexts(contexts):
+    """{cid: apn or (pdp_type, apn)}; pdp_type defaults to IPV4V6."""
+    out = {}
+    for cid, context in contexts.items():
+        pdp_type, apn = ("IPV4V6", context) if isinstance(context, str) else context
+        out[int(cid)] = (pdp_type.upper(), apn)
+    return out
+
+
+def _context_commands(current, desired):
+    current = current or {}
+    return [
+        f'AT+CGDCONT={cid},"{pdp_type}","{apn}"'
+        for cid, (pdp_type, apn) in desired.items()
+        if current.get(cid) != (pdp_type, apn)
+    ]
+
+
+def _band_list(bands):
+    return tuple(sorted(_ints(bands)))
+
+
+def _parse_sms_format(response):
+    value = _first(response, "+CMGF:")
+    return None if value is None else int(value)
+
+
+def _parse_sms_routing(response):
+    value = _first(response, "+CNMI:")
+    return None if value is None else _ints(value)
+
+
+REGISTRATION_URCS = ("+CREG", "+CEREG", "+C5GREG")
+
+
+def _parse_registration_urcs(response):
+    # +CREG: <n>,<stat>[,...]
+    modes = {}
+    for prefix in REGISTRATION_URCS:
+        value = _first(response, f"{prefix}:")
+        if value is not None:
+            modes[prefix] = int(value.split(",")[0])
+    return modes
+
+
+def _registration_commands(current, desired):
+    current = current or {}
+    return [f"AT{prefix}={desired}" for prefix in REGISTRATION_URCS if current.get(prefix) != desired]
+
+
+# name -> Setting, in the order changes are applied (PIN first: most
+# other writes fail while the SIM is locked)
+SETTINGS = {
+    "pin": Setting(
+        "AT+CPIN?",
+        _parse_pin,
+        lambda current, pin: [f'AT+CPIN="{pin}"'],
+        matches=lambda current, pin: current == "READY",
+        secret=True,
+    ),
+    "contexts": Setting(
+        "AT+CGDCONT?",
+        _parse_contexts,
+        _context_commands,
+        _normalize_contexts,
+        matches=lambda current, desired: not _context_commands(current, desired),
+        reattach=True,
+    ),
+    "mode": _config(
+        "+QNWPREFCFG",
+        "+QNWPREFCFG:",
+        "mode_pref",
+        lambda mode: (mode if isinstance(mode, str) else ":".join(mode)).upper(),
+        render=str,
+    ),
+    "lte_bands": _config("+QNWPREFCFG", "+QNWPREFCFG:", "lte_band", _band_list, lambda b: ":".join(map(str, b))),
+    "nr5g_bands": _config("+QNWPREFCFG", "+QNWPREFCFG:", "nr5g_band", _band_list, lambda b: ":".join(map(str, b))),
+    "nsa_bands": _config("+QNWPREFCFG", "+QNWPREFCFG:", "nsa_nr5g_band", _band_list, lambda b: ":".join(map(str, b))),
+    "gnss_outport": _config("+QGPSCFG", "+QGPSCFG:", "outport", lambda port: port.lower()),
+    "gnss_constellations": _config("+QGPSCFG", "+QGPSCFG:", "gnssconfig", int, str),
+    "gnss_autostart": _config("+QGPSCFG", "+QGPSCFG:", "autogps", lambda on: int(on), str),
+    "sms_format": Setting(
+        "AT+CMGF?",
+        _parse_sms_format,
+        lambda current, mode: [f"AT+CMGF={mode}"],
+        lambda mode: {"pdu": 0, "text": 1}.get(mode, mode),
+    ),
+    "sms_routing": Setting(
+        "AT+CNMI?",
+        _parse_sms_routing,
+        lambda current, routing: [f"AT+CNMI={','.join(map(str, routing))}"],
+        _ints,
+    ),
+    "urc_port": _config("+QURCCFG", "+QURCCFG:", "urcport", lambda port: port.lower()),
+    "registration_urcs": Setting(
+        tuple(f"AT{prefix}?" for prefix in REGISTRATION_URCS),
+        _parse_registration_urcs,
+        _registration_commands,
+        int,
+        matches=lambda current, n: not _registration_commands(current, n),
+    ),
+}
+
+
+class _Replies:
+    """The responses to a setting's queries, read like a single response."""
+
+    def __init__(self, responses):
+        self.ok = all(r.ok for r in responses)
+        self.lines = [line for r in responses for line in r.lines]
+
+    def values(self, prefix):
+        return [line[len(prefix):].strip() for line in self.lines if line.startswith(prefix)]
+
+
+def _queries(setting):
+    return (setting.query,) if isinstance(setting.query, str) else setting.query
+
+
+class Change:
+    def __init__(self, name, current, desired, commands, reattach=False, secret=False):
+        self.name = name
+        self.current = current
+        self.desired = desired
+        self.commands = commands
+        self.reattach = reattach
+        self.secret = secret
+        self.responses = []
+
+    @property
+    def ok(self) -> bool:
+        return len(self.responses) == len(self.commands) and all(r.ok for r in self.responses)
+
+    def __repr__(self):
+        desired = "***" if self.secret else repr(self.desired)
+        return f"Change({self.name}: {self.current!r} -> {desired})"
+
+
+class Profile:
+    """Declarative modem configuration.
+
+    Profile(contexts={1: "internet"}, mode="LTE:NR5G", lte_bands=[1, 3, 7],
+    gnss_outport="usbnmea", sms_format="pdu") describes how the modem
+    should be set up; see SETTINGS for every name. apply() reads all of
+    them in chained AT commands and writes only what differs, so
+    re-applying an unchanged profile costs a single round trip.
+    """
+
+    def __init__(self, **settings):
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown profile settings: {', '.join(sorted(unknown))}")
+        self.settings = {
+            name: SETTINGS[name].normalize(settings[name])
+            for name in SETTINGS
+            if settings.get(name) is not None
+        }
+
+    @classmethod
+    def from_sim(cls, sim, **settings):
+        """Profile with the SIM's APN on context 1 and its PIN."""
+        settings.setdefault("contexts", {1: sim.apn})
+        settings.setdefault("pin", sim.pin1 or None)
+        return cls(**settings)
+
+    def read(self, at) -> dict:
+        """Current modem values of this profile's settings."""
+        queries = [q for name in self.settings for q in _queries(SETTINGS[name])]
+        responses = iter(at.batch(queries))
+        current = {}
+        for name in self.settings:
+            setting = SETTINGS[name]
+            replies = _Replies([next(responses) for _ in _queries(setting)])
+            current[name] = setting.parse(replies) if replies.ok else None
+        return current
+
+    def diff(self, at) -> list:
+        """Changes needed to bring the modem to this profile."""
+        current = self.read(at)
+        changes = []
+        for name, desired in self.settings.items():
+            setting = SETTINGS[name]
+            if current.get(name) is not None and setting.matches(current[name], desired):
+                continue
+            changes.append(
+                Change(name, current.get(name), desired, setting.commands(current.get(name), desired), setting.reattach, setting.secret)
+            )
+        return changes
+
+    def apply(self, at, reattach=True) -> list:
+        """Write the settings that differ from the modem's; returns the
+        Changes made. With reattach, changes that only take effect on the
+        next attach (PDP contexts) are wrapped in AT+CFUN=4 / AT+CFUN=1.
+        The PIN is sent first, on its own and once; if the SIM rejects it,
+        nothing else is written."""
+        changes = self.diff(at)
+        if not changes:
+            logger.debug("Modem profile up to date.")
+            return changes
+        logger.info(f"Applying modem profile: {changes}")
+        if changes[0].name == "pin":
+            # On its own and never retried: every failed attempt costs one
+            # of the SIM's three tries
+            pin = changes[0]
+            pin.responses = [at.command(cmd) for cmd in pin.commands]
+            if not pin.ok:
+                logger.error(f"SIM PIN rejected ({pin.responses[-1].final or pin.responses[-1].status}); profile not applied.")
+                return [pin]
+            changes = changes[1:]
+            if not changes:
+                return [pin]
+        else:
+            pin = None
+        detach = reattach and any(c.reattach for c in changes)
+        if detach:
+            at.command("AT+CFUN=4", timeout=15)
+        try:
+            responses = iter(at.batch([cmd for change in changes for cmd in change.commands]))
+            for change in changes:
+                change.responses = [next(responses) for _ in change.commands]
+                if not change.ok:
+                    logger.error(f"Profile setting {change.name} failed: {[r.final or r.status for r in change.responses]}")
+        finally:
+            if detach:
+                at.command("AT+CFUN=1", timeout=15)
+        return [pin] + changes if pin else changes
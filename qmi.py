@@ -0,0 +1,643 @@
+import functools
+import os
+import re
+import select
+import socket
+import struct
+import threading
+import time
+import logging
+from modem.metrics import QMI_ERRORS, QMI_SECONDS
+from modem.tracing import TRACE
+
+logger = logging.getLogger(__name__)
+
+# QMI services
+CTL = 0x00
+WDS = 0x01
+DMS = 0x02
+NAS = 0x03
+UIM = 0x0B
+SERVICES = {"wds": WDS, "dms": DMS, "nas": NAS, "uim": UIM}
+SERVICE_NAMES = {CTL: "ctl", **{v: k for k, v in SERVICES.items()}}
+
+# CTL messages
+CTL_ALLOCATE_CID = 0x0022
+CTL_RELEASE_CID = 0x0023
+
+# DMS messages
+DMS_GET_REVISION = 0x0023
+DMS_GET_IDS = 0x0025
+DMS_GET_OPERATING_MODE = 0x002D
+DMS_SET_OPERATING_MODE = 0x002E
+DMS_UIM_GET_ICCID = 0x003C
+
+# NAS messages
+NAS_GET_SERVING_SYSTEM = 0x0024
+
+# WDS messages
+WDS_START_NETWORK = 0x0020
+WDS_STOP_NETWORK = 0x0021
+WDS_GET_PACKET_SERVICE_STATUS = 0x0022
+WDS_GET_CURRENT_SETTINGS = 0x002D
+
+# UIM messages
+UIM_VERIFY_PIN = 0x0026
+UIM_GET_CARD_STATUS = 0x002F
+
+# (service, message) -> "get-operating-mode" etc., for metrics labels
+MESSAGE_NAMES = {
+    (SERVICES.get(name[:3].lower(), CTL), value): name[4:].lower().replace("_", "-")
+    for name, value in list(globals().items())
+    if name[:4] in ("CTL_", "DMS_", "NAS_", "WDS_", "UIM_") and isinstance(value, int)
+}
+
+OPERATING_MODES = {
+    0: "online",
+    1: "low-power",
+    2: "factory-test",
+    3: "offline",
+    4: "reset",
+    5: "shutting-down",
+    6: "persistent-low-power",
+    7: "mode-only-low-power",
+}
+REGISTRATION_STATES = {
+    0: "not-registered",
+    1: "registered",
+    2: "searching",
+    3: "registration-denied",
+    4: "unknown",
+}
+CONNECTION_STATUS = {
+    1: "disconnected",
+    2: "connected",
+    3: "suspended",
+    4: "authenticating",
+}
+CARD_STATES = {0: "absent", 1: "present", 2: "error"}
+APP_STATES = {
+    0: "unknown",
+    1: "detected",
+    2: "pin1-or-upin-pin-required",
+    3: "puk1-or-upin-puk-required",
+    4: "check-personalization-state",
+    5: "pin1-blocked",
+    6: "illegal",
+    7: "ready",
+}
+PIN_STATES = {
+    0: "not-initialized",
+    1: "enabled-not-verified",
+    2: "enabled-verified",
+    3: "disabled",
+    4: "blocked",
+    5: "permanently-blocked",
+}
+ERRORS = {
+    0x0001: "MalformedMessage",
+    0x0002: "NoMemory",
+    0x0003: "Internal",
+    0x0005: "ClientIdsExhausted",
+    0x000E: "CallFailed",
+    0x0010: "OutOfCall",
+    0x001A: "NoEffect",
+    0x0028: "IncorrectPin",
+    0x0030: "InvalidQmiCommand",
+    0x0034: "DeviceNotReady",
+    0x0047: "NotSupported",
+}
+
+# WDS Start Network IP family preference; "4,6" sends none
+IP_FAMILIES = {"4": 4, "6": 6}
+
+# WDS "requested settings" mask for Get Current Settings
+SETTINGS_APN = 1 << 3
+SETTINGS_DNS = 1 << 4
+SETTINGS_IP_ADDRESS = 1 << 8
+SETTINGS_GATEWAY = 1 << 9
+SETTINGS_MTU = 1 << 13
+SETTINGS_IP_FAMILY = 1 << 15
+
+
+class QMIError(Exception):
+    def __init__(self, message, code=None):
+        self.code = code
+        if code is not None:
+            message = f"{message}: {ERRORS.get(code, 'Error')} ({code:#06x})"
+        super().__init__(message)
+
+
+def _ipv4(value):
+    return socket.inet_ntoa(struct.pack(">I", value))
+
+
+class CardStatus:
+    def __init__(self, card_state, app_state, pin1_state, pin1_retries=None, puk1_retries=None):
+        self.card_state = card_state
+        self.app_state = app_state
+        self.pin1_state = pin1_state
+        self.pin1_retries = pin1_retries
+        self.puk1_retries = puk1_retries
+
+    @property
+    def ready(self) -> bool:
+        return self.app_state == "ready"
+
+    @property
+    def needs_pin(self) -> bool:
+        return self.pin1_state == "enabled-not-verified"
+
+    def __repr__(self):
+        return (
+            f"CardStatus(card={self.card_state}, app={self.app_state}, "
+            f"pin1={self.pin1_state}, pin1_retries={self.pin1_retries})"
+        )
+
+
+class ServingSystem:
+    def __init__(self, registration, ps_attached=None, radio_interfaces=(), mcc=None, mnc=None, operator=None):
+        self.registration = registration
+        self.ps_attached = ps_attached
+        self.radio_interfaces = tuple(radio_interfaces)
+        self.mcc = mcc
+        self.mnc = mnc
+        self.operator = operator
+
+    @property
+    def registered(self) -> bool:
+        return self.registration == "registered"
+
+    def __repr__(self):
+        return (
+            f"ServingSystem(registration={self.registration}, "
+            f"operator={self.operator}, mcc={self.mcc}, mnc={self.mnc})"
+        )
+
+
+class CurrentSettings:
+    def __init__(self, ip=None, subnet=None, gateway=None, dns=(), mtu=None, apn=None):
+        self.ip = ip
+        self.subnet = subnet
+        self.gateway = gateway
+        self.dns = list(dns)
+        self.mtu = mtu
+        self.apn = apn
+
+    @property
+    def prefix_length(self):
+        if not self.subnet:
+            return None
+        return bin(struct.unpack(">I", socket.inet_aton(self.subnet))[0]).count("1")
+
+    def __repr__(self):
+        return (
+            f"CurrentSettings(ip={self.ip}/{self.prefix_length}, gateway={self.gateway}, "
+            f"dns={self.dns}, mtu={self.mtu}, apn={self.apn})"
+        )
+
+
+def encode_tlvs(tlvs):
+    return b"".join(struct.pack("<BH", t, len(v)) + v for t, v in tlvs.items())
+
+
+def decode_tlvs(data):
+    tlvs = {}
+    offset = 0
+    while offset + 3 <= len(data):
+        t, length = struct.unpack_from("<BH", data, offset)
+        offset += 3
+        tlvs[t] = bytes(data[offset : offset + length])
+        offset += length
+    return tlvs
+
+
+def encode_message(service, client_id, transaction, message, tlvs=None):
+    """Build a QMUX frame carrying one QMI request."""
+    payload = encode_tlvs(tlvs or {})
+    if service == CTL:
+        sdu = struct.pack("<BBHH", 0x00, transaction, message, len(payload))
+    else:
+        sdu = struct.pack("<BHHH", 0x00, transaction, message, len(payload))
+    sdu += payload
+    header = struct.pack("<BHBBB", 0x01, 5 + len(sdu), 0x00, service, client_id)
+    return header + sdu
+
+
+def decode_message(frame):
+    """Split a QMUX frame into (service, client_id, flags, transaction, message, tlvs)."""
+    try:
+        _, _, _, service, client_id = struct.unpack_from("<BHBBB", frame, 0)
+        if service == CTL:
+            flags, transaction, message, length = struct.unpack_from("<BBHH", frame, 6)
+            body = frame[12 : 12 + length]
+        else:
+            flags, transaction, message, length = struct.unpack_from("<BHHH", frame, 6)
+            body = frame[13 : 13 + length]
+    except struct.error:
+        raise QMIError(f"Malformed QMUX frame {bytes(frame).hex()}") from None
+    return service, client_id, flags, transaction, message, decode_tlvs(body)
+
+
+def check_result(tlvs, what):
+    if 0x02 not in tlvs:
+        raise QMIError(f"{what}: response without result TLV")
+    try:
+        result, error = struct.unpack_from("<HH", tlvs[0x02])
+    except struct.error:
+        raise QMIError(f"{what}: malformed result TLV") from None
+    if result != 0:
+        raise QMIError(what, error)
+
+
+def _decodes(method):
+    """Raise QMIError for a reply that lacks a TLV the method reads or is
+    too short for it, like for any other failed request."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except (KeyError, IndexError, struct.error) as e:
+            raise QMIError(f"Malformed reply to {method.__name__}: {type(e).__name__} {e}") from e
+
+    return wrapper
+
+
+class QMIClient:
+    """Persistent in-process QMI client over a cdc-wdm QMUX device.
+
+    The device is opened once and one client ID per service is allocated on
+    first use and kept for the lifetime of the client, so repeated calls cost
+    a single write/read instead of a qmicli process, a sudo and a CID
+    allocation each.
+    """
+
+    def __init__(self, device, timeout=5, client_ids=None):
+        self.device = device
+        self.timeout = timeout
+        self.client_ids = dict(client_ids or {})
+        self.fd = None
+        self._buffer = bytearray()
+        self._transaction = 0
+        self._lock = threading.RLock()
+        self._trace = TRACE.channel(device)
+
+    def open(self):
+        self.fd = os.open(self.device, os.O_RDWR | os.O_NONBLOCK | os.O_NOCTTY)
+        logger.info(f"Opened QMI device {self.device}.")
+        return self
+
+    def close(self, keep=("wds",)):
+        """Release client IDs and close the device. Services listed in keep
+        hold on to their CID so a running data session survives the close."""
+        if self.fd is None:
+            return
+        for name, cid in list(self.client_ids.items()):
+            if name in keep:
+                continue
+            try:
+                self.release_client_id(name)
+            except (QMIError, OSError) as e:
+                logger.warning(f"Could not release {name} client {cid}: {e}")
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        return self.open() if self.fd is None else self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- transport ----------------------------------------------------------
+
+    def _next_transaction(self):
+        # CTL transaction IDs are a single byte, keep all services in range
+        self._transaction = self._transaction % 0xFF + 1
+        return self._transaction
+
+    def _read_frame(self, deadline):
+        while True:
+            if len(self._buffer) >= 3:
+                length = struct.unpack_from("<H", self._buffer, 1)[0] + 1
+                if len(self._buffer) >= length:
+                    frame = bytes(self._buffer[:length])
+                    del self._buffer[:length]
+                    self._trace.rx(frame)
+                    return frame
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            select.select([self.fd], [], [], remaining)
+            try:
+                self._buffer += os.read(self.fd, 4096)
+            except BlockingIOError:
+                pass
+
+    def request(self, service, message, tlvs=None, client_id=None, timeout=None):
+        """Send one request and return the response TLVs, raising QMIError
+        when the modem reports a failure."""
+        if self.fd is None:
+            self.open()
+        start = time.monotonic()
+        labels = (SERVICE_NAMES.get(service, str(service)), MESSAGE_NAMES.get((service, message), f"{message:#06x}"))
+        try:
+            tlvs = self._request(service, message, tlvs, client_id, timeout)
+        except QMIError as e:
+            QMI_ERRORS.labels(*labels, "timeout" if e.code is None else ERRORS.get(e.code, f"{e.code:#06x}")).inc()
+            raise
+        except OSError as e:
+            QMI_ERRORS.labels(*labels, type(e).__name__).inc()
+            raise
+        QMI_SECONDS.labels(*labels).observe(time.monotonic() - start)
+        if 0x02 in tlvs and struct.unpack_from("<H", tlvs[0x02])[0] != 0:
+            error = struct.unpack_from("<H", tlvs[0x02], 2)[0]
+            QMI_ERRORS.labels(*labels, ERRORS.get(error, f"{error:#06x}")).inc()
+        return tlvs
+
+    def _request(self, service, message, tlvs, client_id, timeout):
+        with self._lock:
+            if client_id is None:
+                client_id = 0 if service == CTL else self.client_id(service)
+            transaction = self._next_transaction()
+            request = encode_message(service, client_id, transaction, message, tlvs)
+            self._trace.tx(request)
+            os.write(self.fd, request)
+            deadline = time.monotonic() + (timeout or self.timeout)
+            while True:
+                frame = self._read_frame(deadline)
+                if frame is None:
+                    raise QMIError(f"Timeout waiting for QMI message {message:#06x} on service {service}")
+                r_service, r_cid, flags, r_transaction, r_message, r_tlvs = decode_message(frame)
+                indication = flags & (0x02 if r_service == CTL else 0x04)
+                if (
+                    indication
+                    or r_service != service
+                    or r_transaction != transaction
+                    or r_message != message
+                    or (service != CTL and r_cid != client_id)
+                ):
+                    logger.debug(f"Skipping QMI frame service={r_service} message={r_message:#06x}")
+                    continue
+                return r_tlvs
+
+    def client_id(self, service):
+        names = {v: k for k, v in SERVICES.items()}
+        name = names[service]
+        if name not in self.client_ids:
+            tlvs = self.request(CTL, CTL_ALLOCATE_CID, {0x01: bytes([service])})
+            check_result(tlvs, f"Allocate {name} client")
+            try:
+                self.client_ids[name] = tlvs[0x01][1]
+            except (KeyError, IndexError):
+                raise QMIError(f"Allocate {name} client: malformed reply") from None
+            logger.info(f"Allocated QMI {name} client {self.client_ids[name]}.")
+        return self.client_ids[name]
+
+    def release_client_id(self, name):
+        cid = self.client_ids.pop(name)
+        tlvs = self.request(CTL, CTL_RELEASE_CID, {0x01: bytes([SERVICES[name], cid])})
+        check_result(tlvs, f"Release {name} client")
+
+    def call(self, service, message, tlvs=None, what=None, timeout=None):
+        response = self.request(service, message, tlvs, timeout=timeout)
+        check_result(response, what or f"QMI message {message:#06x}")
+        return response
+
+    # --- DMS ----------------------------------------------------------------
+
+    @_decodes
+    def get_operating_mode(self) -> str:
+        tlvs = self.call(DMS, DMS_GET_OPERATING_MODE, what="Get operating mode")
+        return OPERATING_MODES.get(tlvs[0x01][0], "unknown")
+
+    def set_operating_mode(self, mode):
+        value = {v: k for k, v in OPERATING_MODES.items()}[mode]
+        self.call(DMS, DMS_SET_OPERATING_MODE, {0x01: bytes([value])}, what=f"Set operating mode {mode}")
+
+    @_decodes
+    def get_ids(self) -> dict:
+        tlvs = self.call(DMS, DMS_GET_IDS, what="Get IDs")
+        names = {0x10: "esn", 0x11: "imei", 0x12: "meid"}
+        return {names[t]: v.decode(errors="ignore") for t, v in tlvs.items() if t in names}
+
+    @_decodes
+    def get_revision(self) -> str:
+        tlvs = self.call(DMS, DMS_GET_REVISION, what="Get revision")
+        return tlvs[0x01].decode(errors="ignore")
+
+    @_decodes
+    def get_iccid(self) -> str:
+        tlvs = self.call(DMS, DMS_UIM_GET_ICCID, what="Get ICCID")
+        return tlvs[0x01].decode(errors="ignore")
+
+    # --- NAS ----------------------------------------------------------------
+
+    @_decodes
+    def get_serving_system(self) -> ServingSystem:
+        tlvs = self.call(NAS, NAS_GET_SERVING_SYSTEM, what="Get serving system")
+        state, _, ps_attach, _, count = struct.unpack_from("<BBBBB", tlvs[0x01])
+        radio = tuple(tlvs[0x01][5 : 5 + count])
+        mcc = mnc = operator = None
+        if 0x12 in tlvs:
+            mcc, mnc, desc_len = struct.unpack_from("<HHB", tlvs[0x12])
+            operator = tlvs[0x12][5 : 5 + desc_len].decode(errors="ignore")
+        return ServingSystem(
+            REGISTRATION_STATES.get(state, "unknown"),
+            ps_attached=ps_attach == 1,
+            radio_interfaces=radio,
+            mcc=mcc,
+            mnc=mnc,
+            operator=operator,
+        )
+
+    # --- WDS ----------------------------------------------------------------
+
+    @_decodes
+    def start_network(self, apn, ip_type="4,6", timeout=60) -> int:
+        """Start a data session and return its packet data handle.
+
+        ip_type is "4", "6" or "4,6" as for qmicli. "4,6" leaves the IP
+        family to the modem, which brings up the dual-stack context its
+        profile asks for.
+        """
+        tlvs = {0x14: apn.encode()}
+        if ip_type in IP_FAMILIES:
+            tlvs[0x19] = bytes([IP_FAMILIES[ip_type]])
+        response = self.request(WDS, WDS_START_NETWORK, tlvs, timeout=timeout)
+        try:
+            check_result(response, "Start network")
+        except QMIError as e:
+            if 0x10 in response:
+                reason = struct.unpack_from("<H", response[0x10])[0]
+                raise QMIError(f"{e} (call end reason {reason})", e.code) from None
+            raise
+        return struct.unpack_from("<I", response[0x01])[0]
+
+    def stop_network(self, handle):
+        self.call(WDS, WDS_STOP_NETWORK, {0x01: struct.pack("<I", handle)}, what="Stop network")
+
+    @_decodes
+    def get_packet_service_status(self) -> str:
+        tlvs = self.call(WDS, WDS_GET_PACKET_SERVICE_STATUS, what="Get packet service status")
+        return CONNECTION_STATUS.get(tlvs[0x01][0], "unknown")
+
+    @_decodes
+    def get_current_settings(self) -> CurrentSettings:
+        mask = (
+            SETTINGS_APN
+            | SETTINGS_DNS
+            | SETTINGS_IP_ADDRESS
+            | SETTINGS_GATEWAY
+            | SETTINGS_MTU
+            | SETTINGS_IP_FAMILY
+        )
+        tlvs = self.call(
+            WDS, WDS_GET_CURRENT_SETTINGS, {0x10: struct.pack("<I", mask)}, what="Get current settings"
+        )
+
+        def ip(t):
+            return _ipv4(struct.unpack_from("<I", tlvs[t])[0]) if t in tlvs else None
+
+        return CurrentSettings(
+            ip=ip(0x1E),
+            subnet=ip(0x21),
+            gateway=ip(0x20),
+            dns=[d for d in (ip(0x15), ip(0x16)) if d],
+            mtu=struct.unpack_from("<I", tlvs[0x29])[0] if 0x29 in tlvs else None,
+            apn=tlvs[0x14].decode(errors="ignore") if 0x14 in tlvs else None,
+        )
+
+    # --- UIM ----------------------------------------------------------------
+
+    @_decodes
+    def get_card_status(self) -> CardStatus:
+        tlvs = self.call(UIM, UIM_GET_CARD_STATUS, what="Get card status")
+        data = tlvs[0x10]
+        gw_primary = struct.unpack_from("<H", data, 0)[0]
+        offset = 8
+        cards = data[offset]
+        offset += 1
+        found = None
+        for slot in range(cards):
+            card_state = data[offset]
+            offset += 5  # card state, UPIN state, UPIN/UPUK retries, error code
+            apps = data[offset]
+            offset += 1
+            for index in range(apps):
+                app_state = data[offset + 1]
+                aid_len = data[offset + 6]
+                offset += 7 + aid_len
+                pin1_state, pin1_retries, puk1_retries = data[offset + 1 : offset + 4]
+                offset += 7  # UPIN replaces PIN1, PIN1 x3, PIN2 x3
+                if found is None or gw_primary == (slot << 8 | index):
+                    found = CardStatus(
+                        CARD_STATES.get(card_state, "unknown"),
+                        APP_STATES.get(app_state, "unknown"),
+                        PIN_STATES.get(pin1_state, "unknown"),
+                        pin1_retries,
+                        puk1_retries,
+                    )
+            if found is None:
+                found = CardStatus(CARD_STATES.get(card_state, "unknown"), "unknown", "unknown")
+        return found or CardStatus("absent", "unknown", "unknown")
+
+    def verify_pin(self, pin, pin_id=1):
+        tlvs = {
+            0x01: bytes([0x00, 0x00]),  # primary GW provisioning session, no AID
+            0x02: bytes([pin_id, len(pin)]) + pin.encode(),
+        }
+        self.call(UIM, UIM_VERIFY_PIN, tlvs, what="Verify PIN")
+
+
+class QmicliClient:
+    """Same interface as QMIClient on top of qmicli, for setups where the
+    QMUX device is owned by another process (ModemManager, qmi-proxy)."""
+
+    def __init__(self, device, run_command):
+        self.device = device
+        self.run_command = run_command
+        self.client_ids = {}
+
+    def close(self, keep=("wds",)):
+        pass
+
+    def _qmicli(self, args):
+        return self.run_command(cmd=f"sudo qmicli -d {self.device} {args}")
+
+    @staticmethod
+    def _field(output, name):
+        match = re.search(rf"{re.escape(name)}:\s*'?([^'\n]*)'?", output, re.IGNORECASE)
+        return match.group(1).strip() if match else None
+
+    def get_operating_mode(self) -> str:
+        return self._field(self._qmicli("--dms-get-operating-mode"), "Mode") or "unknown"
+
+    def set_operating_mode(self, mode):
+        output = self._qmicli(f"--dms-set-operating-mode={mode}")
+        if "error" in output.lower() or not output:
+            raise QMIError(f"Set operating mode {mode} failed")
+
+    def get_ids(self) -> dict:
+        output = self._qmicli("--dms-get-ids")
+        return {"imei": self._field(output, "IMEI")}
+
+    def get_revision(self) -> str:
+        return self._field(self._qmicli("--dms-get-revision"), "Revision")
+
+    def get_iccid(self) -> str:
+        return self._field(self._qmicli("--dms-uim-get-iccid"), "ICCID")
+
+    def get_serving_system(self) -> ServingSystem:
+        output = self._qmicli("--nas-get-serving-system")
+        return ServingSystem(
+            self._field(output, "Registration state") or "unknown",
+            operator=self._field(output, "Description"),
+        )
+
+    def start_network(self, apn, ip_type="4,6", timeout=60) -> int:
+        output = self._qmicli(
+            f"--wds-start-network=\"apn={apn},ip-type='{ip_type}'\" --client-no-release-cid"
+        )
+        handle = self._field(output, "Packet data handle")
+        if "network started" not in output.lower() or handle is None:
+            raise QMIError("Start network failed")
+        return int(handle)
+
+    def stop_network(self, handle):
+        self._qmicli(f"--wds-stop-network={handle}")
+
+    def get_packet_service_status(self) -> str:
+        output = self._qmicli("--wds-get-packet-service-status")
+        return self._field(output, "Connection status") or "unknown"
+
+    def get_current_settings(self) -> CurrentSettings:
+        output = self._qmicli("--wds-get-current-settings")
+        mtu = self._field(output, "MTU")
+        return CurrentSettings(
+            ip=self._field(output, "IPv4 address"),
+            subnet=self._field(output, "IPv4 subnet mask"),
+            gateway=self._field(output, "IPv4 gateway address"),
+            dns=[
+                d
+                for d in (
+                    self._field(output, "IPv4 primary DNS"),
+                    self._field(output, "IPv4 secondary DNS"),
+                )
+                if d
+            ],
+            mtu=int(mtu) if mtu and mtu.isdigit() else None,
+        )
+
+    def get_card_status(self) -> CardStatus:
+        output = self._qmicli("--uim-get-card-status")
+        return CardStatus(
+            self._field(output, "Card state") or "unknown",
+            self._field(output, "Application state") or "unknown",
+            (self._field(output, "PIN1 state") or "unknown").replace(", ", "-").replace(" ", "-"),
+        )
+
+    def verify_pin(self, pin, pin_id=1):
+        output = self._qmicli(f"--uim-verify-pin=PIN{pin_id},{pin}")
+        if "error" in output.lower():
+            raise QMIError("Verify PIN failed")
@@ -0,0 +1,296 @@
+import math
+import threading
+import time
+import logging
+from array import array
+from bisect import bisect_left
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the array module covers everything
+    np = None
+
+logger = logging.getLogger(__name__)
+
+NAN = float("nan")
+
+# Radio access technology codes stored in the rat column
+RATS = ("NONE", "LTE", "NR5G-NSA", "NR5G-SA")
+RAT_NONE, RAT_LTE, RAT_NSA, RAT_SA = range(4)
+
+# Column layout of the ring buffer; signal values are dBm/dB, NaN if not reported
+COLUMNS = (
+    ("timestamp", "d"),
+    ("rat", "B"),
+    ("band", "H"),
+    ("cell_id", "Q"),
+    ("pci", "H"),
+    ("rsrp", "f"),  # serving cell: LTE anchor, or NR in SA mode
+    ("rsrq", "f"),
+    ("sinr", "f"),
+    ("nr_rsrp", "f"),  # NR leg (NSA) or NR serving cell (SA)
+    ("nr_rsrq", "f"),
+    ("nr_sinr", "f"),
+    ("neighbours", "B"),
+    ("neighbour_rsrp", "f"),  # strongest neighbour
+)
+SIGNALS = ("rsrp", "rsrq", "sinr", "nr_rsrp", "nr_rsrq", "nr_sinr")
+PERCENTILES = (10, 50, 90)
+
+SERVING_COMMAND = 'AT+QENG="servingcell"'
+NEIGHBOUR_COMMAND = 'AT+QENG="servingcell";+QENG="neighbourcell"'
+
+# Field index of RSRP in "neighbourcell ..." lines, by RAT
+NEIGHBOUR_RSRP = {"LTE": 5, "NR": 4}
+
+
+def _number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return NAN  # "-" when not reported
+
+
+def _integer(value, base=10):
+    try:
+        return int(value, base)
+    except ValueError:
+        return 0
+
+
+def _serving(sample, f):
+    """Fill sample from one serving-cell field list starting at the RAT name."""
+    rat = f[0]
+    if rat == "LTE" and len(f) >= 15:
+        # "LTE",<is_tdd>,<MCC>,<MNC>,<cellID>,<PCID>,<earfcn>,<band>,<UL_bw>,<DL_bw>,
+        # <TAC>,<RSRP>,<RSRQ>,<RSSI>,<SINR>,...
+        sample.update(
+            rat=max(sample["rat"], RAT_LTE),
+            cell_id=_integer(f[4], 16),
+            pci=_integer(f[5]),
+            band=_integer(f[7]),
+            rsrp=_number(f[11]),
+            rsrq=_number(f[12]),
+            sinr=_number(f[14]) / 5 - 20,  # reported as 0..250 in 1/5 dB steps
+        )
+    elif rat == "NR5G-SA" and len(f) >= 13:
+        # "NR5G-SA",<duplex>,<MCC>,<MNC>,<cellID>,<PCID>,<TAC>,<ARFCN>,<band>,<DL_bw>,
+        # <RSRP>,<RSRQ>,<SINR>,...
+        values = dict(rsrp=_number(f[10]), rsrq=_number(f[11]), sinr=_number(f[12]))
+        sample.update(values, rat=RAT_SA, cell_id=_integer(f[4], 16), pci=_integer(f[5]), band=_integer(f[8]))
+        sample.update({f"nr_{k}": v for k, v in values.items()})
+    elif rat == "NR5G-NSA" and len(f) >= 9:
+        # "NR5G-NSA",<MCC>,<MNC>,<PCID>,<RSRP>,<SINR>,<RSRQ>,<ARFCN>,<band>,...
+        sample.update(
+            rat=RAT_NSA,
+            nr_rsrp=_number(f[4]),
+            nr_sinr=_number(f[5]),
+            nr_rsrq=_number(f[6]),
+        )
+
+
+def parse_qeng(values) -> dict:
+    """Column values for one sample from the payloads of +QENG: lines
+    (servingcell in LTE, NSA or SA layout, plus optional neighbourcell)."""
+    sample = {name: NAN if code == "f" else 0 for name, code in COLUMNS}
+    for value in values:
+        f = [v.strip().strip('"') for v in value.split(",")]
+        kind = f[0]
+        if kind == "servingcell":
+            if len(f) > 2:
+                _serving(sample, f[2:])  # single-line LTE or NR5G-SA
+        elif kind.startswith("neighbourcell"):
+            index = NEIGHBOUR_RSRP.get(f[1] if len(f) > 1 else "")
+            if index is None or len(f) <= index:
+                continue
+            sample["neighbours"] += 1
+            rsrp = _number(f[index])
+            if not rsrp <= sample["neighbour_rsrp"]:  # also replaces NaN
+                sample["neighbour_rsrp"] = rsrp
+        else:
+            _serving(sample, f)  # NSA: separate "LTE" and "NR5G-NSA" lines
+    sample["neighbours"] = min(sample["neighbours"], 255)
+    return sample
+
+
+def _percentile(ordered, p):
+    """Nearest-rank percentile of a sorted sequence."""
+    return ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1]
+
+
+class RadioBuffer:
+    """Fixed-size ring of radio samples in typed columns (~50 bytes each).
+
+    Samples are stored as plain numbers, never as objects; window() and
+    stats() work on column slices, with numpy when it is installed.
+    """
+
+    def __init__(self, capacity=3600):
+        self.capacity = capacity
+        self.count = 0
+        self._next = 0  # physical index of the next write
+        self._lock = threading.Lock()
+        for name, code in COLUMNS:
+            setattr(self, name, array(code, [0]) * capacity)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, sample):
+        with self._lock:
+            i = self._next
+            self.timestamp[i] = timestamp
+            for name, _ in COLUMNS[1:]:
+                getattr(self, name)[i] = sample[name]
+            self._next = (i + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def latest(self):
+        """The newest sample as {column: value}, or None."""
+        with self._lock:
+            if not self.count:
+                return None
+            i = (self._next - 1) % self.capacity
+            return {name: getattr(self, name)[i] for name, _ in COLUMNS}
+
+    def window(self, seconds=None, now=None) -> dict:
+        """{column: array} of the samples from the last seconds (all if
+        None), oldest first."""
+        with self._lock:
+            first = (self._next - self.count) % self.capacity
+            start = 0
+            if seconds is not None:
+                now = time.time() if now is None else now
+                ts, cap = self.timestamp, self.capacity
+                start = bisect_left(range(self.count), now - seconds, key=lambda i: ts[(first + i) % cap])
+            begin = (first + start) % self.capacity
+            length = self.count - start
+            out = {}
+            for name, _ in COLUMNS:
+                column = getattr(self, name)
+                if begin + length <= self.capacity:
+                    out[name] = column[begin : begin + length]
+                else:
+                    out[name] = column[begin:] + column[: begin + length - self.capacity]
+            return out
+
+    def stats(self, seconds=30, now=None) -> dict:
+        """Summary of the last seconds: per-signal mean/min/p10/p50/p90,
+        handovers (serving cell changes), RAT changes and how often a
+        serving cell was reported at all."""
+        columns = self.window(seconds, now)
+        n = len(columns["timestamp"])
+        out = {"samples": n}
+        if not n:
+            return out
+        out["span"] = columns["timestamp"][-1] - columns["timestamp"][0]
+        out["rat"] = RATS[columns["rat"][-1]]
+        out["band"] = columns["band"][-1]
+        out["neighbours"] = columns["neighbours"][-1]
+        for name in SIGNALS:
+            out[name] = self._summary(columns[name])
+        rat, cell, pci = columns["rat"], columns["cell_id"], columns["pci"]
+        if np is not None:
+            rat = np.frombuffer(rat, dtype=np.uint8)
+            attached = rat != RAT_NONE
+            cells = np.frombuffer(cell, dtype=np.uint64)[attached]
+            pcis = np.frombuffer(pci, dtype=np.uint16)[attached]
+            rats = rat[attached]
+            out["availability"] = float(attached.mean())
+            out["handovers"] = int(np.count_nonzero((cells[1:] != cells[:-1]) | (pcis[1:] != pcis[:-1])))
+            out["rat_changes"] = int(np.count_nonzero(rats[1:] != rats[:-1]))
+        else:
+            attached = [i for i, r in enumerate(rat) if r != RAT_NONE]
+            keys = [(cell[i], pci[i]) for i in attached]
+            rats = [rat[i] for i in attached]
+            out["availability"] = len(attached) / n
+            out["handovers"] = sum(a != b for a, b in zip(keys, keys[1:]))
+            out["rat_changes"] = sum(a != b for a, b in zip(rats, rats[1:]))
+        margin = self._summary(columns["neighbour_rsrp"])
+        if margin and out["rsrp"]:
+            # > 0: the best neighbour is stronger than the serving cell
+            out["neighbour_margin"] = margin["mean"] - out["rsrp"]["mean"]
+        return out
+
+    @staticmethod
+    def _summary(column):
+        if np is not None:
+            values = np.frombuffer(column, dtype=np.float32)
+            values = np.sort(values[np.isfinite(values)])
+            if not len(values):
+                return None
+            summary = {"mean": float(values.mean()), "min": float(values[0])}
+            summary.update((f"p{p}", float(_percentile(values, p))) for p in PERCENTILES)
+            return summary
+        values = sorted(filter(math.isfinite, column))
+        if not values:
+            return None
+        summary = {"mean": math.fsum(values) / len(values), "min": values[0]}
+        summary.update((f"p{p}", _percentile(values, p)) for p in PERCENTILES)
+        return summary
+
+
+class RadioSampler(threading.Thread):
+    """Polls AT+QENG="servingcell" at a fixed rate into a RadioBuffer.
+
+    Neighbour cells are chained into every neighbour_every-th poll, so it
+    stays one AT round trip. The sampler keeps its share of AT port time
+    below max_duty: when commands slow down because the port is busy
+    (SMS, transfers), the poll interval stretches instead of queueing up.
+    """
+
+    def __init__(self, at, interval=1.0, capacity=3600, neighbour_every=5, max_duty=0.2):
+        super().__init__(name="RadioSampler", daemon=True)
+        self.at = at
+        self.interval = interval
+        self.buffer = RadioBuffer(capacity)
+        self.neighbour_every = neighbour_every
+        self.max_duty = max_duty
+        self.polls = 0
+        self.failures = 0
+        self._running = threading.Event()
+        self._stopping = threading.Event()
+
+    def sample(self) -> bool:
+        """Take one sample now; False if the modem did not answer."""
+        with_neighbours = self.neighbour_every and self.polls % self.neighbour_every == 0
+        self.polls += 1
+        response = self.at.command(NEIGHBOUR_COMMAND if with_neighbours else SERVING_COMMAND)
+        if not response.ok:
+            self.failures += 1
+            return False
+        sample = parse_qeng(response.values("+QENG:"))
+        if not with_neighbours:
+            # Carry the last neighbour reading forward between neighbour polls
+            last = self.buffer.latest()
+            if last is not None:
+                sample["neighbours"] = last["neighbours"]
+                sample["neighbour_rsrp"] = last["neighbour_rsrp"]
+        self.buffer.append(time.time(), sample)
+        return True
+
+    def stats(self, seconds=30) -> dict:
+        return self.buffer.stats(seconds)
+
+    def run(self):
+        self._running.set()
+        logger.info(f"Radio sampler started ({self.interval}s interval).")
+        deadline = time.monotonic()
+        while not self._stopping.is_set():
+            start = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Radio sample failed: {e}")
+            busy = time.monotonic() - start
+            deadline = max(deadline + self.interval, start + busy / self.max_duty)
+            self._stopping.wait(max(0.0, deadline - time.monotonic()))
+        self._running.clear()
+        logger.info("Radio sampler stopped.")
+
+    def stop(self, timeout=2):
+        self._running.clear()
+        self._stopping.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
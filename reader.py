@@ -0,0 +1,277 @@
+import queue
+import select
+import threading
+import time
+import logging
+from modem.at import CONNECT, PROMPT, final_status, response_prefixes
+from modem.metrics import PORT_BYTES
+from modem.tracing import TRACE
+
+logger = logging.getLogger(__name__)
+
+# Prefixes of unsolicited result codes the RM520N emits on the AT port
+URC_PREFIXES = (
+    "RDY",
+    "POWERED DOWN",
+    "+CPIN:",
+    "+CFUN:",
+    "+QUSIM:",
+    "+QIND:",
+    "+CMTI:",
+    "+CMT:",
+    "+CDSI:",
+    "+CDS:",
+    "+CREG:",
+    "+CGREG:",
+    "+CEREG:",
+    "+C5GREG:",
+    "+QIURC:",
+    "+QIOPEN:",
+    "+QFTP",
+    "+QHTTP",
+    "+QNETDEVSTATUS:",
+)
+ANY = "*"
+
+
+def is_urc(line, in_flight, own_prefixes=()) -> bool:
+    """True if line is unsolicited rather than part of the command in flight."""
+    if not in_flight:
+        return True
+    if own_prefixes and line.startswith(own_prefixes):
+        return False
+    return line.startswith(URC_PREFIXES)
+
+
+class ATReader(threading.Thread):
+    """Single reader for the AT port.
+
+    Splits the incoming byte stream into lines, hands lines that belong to
+    the command in flight to the waiting caller and dispatches unsolicited
+    result codes to subscribers. Callbacks run on the reader thread and must
+    not issue AT commands themselves; use queue() for that.
+    """
+
+    def __init__(self, connection, poll_interval=0.2):
+        super().__init__(name="ATReader", daemon=True)
+        self.connection = connection
+        self.poll_interval = poll_interval
+        self._buffer = bytearray()
+        self._responses = queue.Queue()
+        self._lock = threading.Lock()
+        self._in_flight = False
+        self._own_prefixes = ()
+        self._prompt = False
+        self._raw = None  # RawData expected after CONNECT
+        self._subscribers = {}
+        self._running = threading.Event()
+        port = getattr(connection, "port", None) or "unknown"
+        self._bytes_in = PORT_BYTES.labels(port, "in")
+        self._trace = TRACE.channel(port)
+
+    # --- subscription -----------------------------------------------------
+
+    def subscribe(self, prefix, callback):
+        """Call callback(line) for every URC starting with prefix ("*" = all)."""
+        with self._lock:
+            self._subscribers.setdefault(prefix, []).append(callback)
+        return callback
+
+    def unsubscribe(self, prefix, callback):
+        """Remove a callback, or a queue returned by queue()."""
+        callback = getattr(callback, "callback", callback)
+        with self._lock:
+            callbacks = self._subscribers.get(prefix, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def queue(self, prefix, maxsize=0) -> queue.Queue:
+        """Return a queue.Queue that receives every URC starting with prefix.
+        Release it with unsubscribe(prefix, q)."""
+        q = queue.Queue(maxsize)
+        q.callback = self.subscribe(prefix, lambda line: self._offer(q, line))
+        return q
+
+    def wait_for(self, prefix, timeout):
+        """Block until a URC starting with prefix arrives; None on timeout.
+        Only sees URCs that arrive after the call."""
+        q = self.queue(prefix)
+        try:
+            return q.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        finally:
+            self.unsubscribe(prefix, q)
+
+    @staticmethod
+    def _offer(q, line):
+        try:
+            q.put_nowait(line)
+        except queue.Full:
+            logger.warning(f"URC queue full, dropping: {line}")
+
+    # --- command side -----------------------------------------------------
+
+    def begin(self, cmd, prompt=False, raw=None):
+        """Mark cmd as in flight; its response lines go to readline(). With
+        raw (an at.RawData), the bytes after the CONNECT line are passed to
+        raw instead of being split into lines."""
+        with self._lock:
+            while not self._responses.empty():
+                self._responses.get_nowait()
+            self._in_flight = True
+            self._own_prefixes = response_prefixes(cmd)
+            self._prompt = prompt
+            self._raw = raw
+
+    def end(self):
+        with self._lock:
+            self._in_flight = False
+            self._own_prefixes = ()
+            self._prompt = False
+            if self._raw is not None:
+                self._raw.active = False
+                self._raw = None
+
+    def readline(self, deadline):
+        """Next response line for the command in flight, or None at deadline."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        try:
+            return self._responses.get(timeout=remaining)
+        except queue.Empty:
+            return None
+
+    def take_responses(self) -> list:
+        """Response lines queued so far, without waiting."""
+        lines = []
+        while True:
+            try:
+                lines.append(self._responses.get_nowait())
+            except queue.Empty:
+                return lines
+
+    # --- reader thread ----------------------------------------------------
+
+    def _dispatch(self, line):
+        with self._lock:
+            if not is_urc(line, self._in_flight, self._own_prefixes):
+                self._responses.put(line)
+                if final_status(line):
+                    # Anything after the final result code is unsolicited,
+                    # e.g. the +QFTPGET: or +QIOPEN: that follows OK
+                    self._in_flight = False
+                elif self._raw is not None and line.startswith(CONNECT):
+                    self._raw.active = True
+                return
+            callbacks = [
+                cb
+                for prefix, cbs in self._subscribers.items()
+                if prefix == ANY or line.startswith(prefix)
+                for cb in cbs
+            ]
+        if not callbacks:
+            logger.debug(f"Unhandled URC: {line}")
+        for callback in callbacks:
+            try:
+                callback(line)
+            except Exception as e:
+                logger.error(f"URC callback failed for {line!r}: {e}")
+
+    def _active_raw(self):
+        raw = self._raw
+        return raw if raw is not None and raw.active else None
+
+    def feed(self, data):
+        """Split data into lines and dispatch them; in data mode the payload
+        goes to the RawData instead."""
+        raw = self._active_raw()
+        if raw is not None and not self._buffer:
+            data = data[raw.feed(data):]
+        self._buffer += data
+        idx = self._buffer.find(b"\n")
+        while idx >= 0:
+            line = self._buffer[:idx].decode(errors="ignore").strip()
+            del self._buffer[: idx + 1]
+            if line:
+                self._dispatch(line)
+                raw = self._active_raw()
+                if raw is not None:
+                    del self._buffer[: raw.feed(bytes(self._buffer[: raw.remaining]))]
+            idx = self._buffer.find(b"\n")
+        if self._prompt and self._buffer.strip().startswith(PROMPT.encode()):
+            with self._lock:
+                self._prompt = False
+            self._buffer.clear()
+            self._responses.put(PROMPT)
+
+    def _read_framed(self):
+        """Zero-copy path for transports that frame lines themselves
+        (RawTransport): lines are decoded straight from the receive buffer."""
+        raw = self._active_raw()
+        if raw is not None:
+            self._read_raw_framed(raw)
+            return
+        for view in self.connection.read_lines(self.poll_interval):
+            self._bytes_in.inc(len(view) + 1)
+            self._trace.rx(view, b"\n")
+            line = str(view, "ascii", "ignore").strip()
+            if line:
+                self._dispatch(line)
+                if self._active_raw() is not None:
+                    break  # the rest of the buffer is payload
+        if self._prompt:
+            pending = self.connection.peek()
+            if bytes(pending).strip().startswith(PROMPT.encode()):
+                with self._lock:
+                    self._prompt = False
+                self.connection.consume(len(pending))
+                self._responses.put(PROMPT)
+
+    def _read_raw_framed(self, raw):
+        """Data mode on a RawTransport: payload goes to the sink as views of
+        the receive buffer."""
+        pending = self.connection.peek()
+        if not len(pending):
+            self.connection.fill(self.poll_interval)
+            pending = self.connection.peek()
+        n = raw.feed(pending)
+        self._trace.rx(pending[:n])
+        self.connection.consume(n)
+        self._bytes_in.inc(n)
+
+    def _read(self):
+        waiting = self.connection.in_waiting
+        if not waiting:
+            select.select([self.connection.fileno()], [], [], self.poll_interval)
+            waiting = self.connection.in_waiting
+        if waiting:
+            data = self.connection.read(waiting)
+            self._bytes_in.inc(len(data))
+            self._trace.rx(data)
+            return data
+        return b""
+
+    def run(self):
+        self._running.set()
+        logger.info("AT reader started.")
+        framed = hasattr(self.connection, "read_lines")
+        while self._running.is_set():
+            try:
+                if framed:
+                    self._read_framed()
+                    continue
+                data = self._read()
+            except (OSError, ValueError, TypeError) as e:
+                if self._running.is_set():
+                    logger.error(f"AT reader stopped: {e}")
+                break
+            if data:
+                self.feed(data)
+        self._running.clear()
+
+    def stop(self, timeout=1):
+        self._running.clear()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
@@ -1,52 +1,137 @@
+import fcntl
+import os
+import time
 import serial
-import subprocess
+import termios
 import logging
 from modem.interface import ModemInterface
+from modem.transport import RawTransport
+
+
+class PortBusyError(serial.SerialException):
+    """The serial port is locked or opened by another process."""
+
+    def __init__(self, port, owners=()):
+        self.port = port
+        self.owners = list(owners)
+        detail = ", ".join(f"{name} (pid {pid})" for pid, name in self.owners)
+        super().__init__(f"Serial port {port} is in use" + (f" by {detail}" if detail else ""))
+
+
+def port_owners(port):
+    """[(pid, command)] of processes holding port open, from /proc/*/fd."""
+    target = os.path.realpath(port)
+    owners = []
+    me = os.getpid()
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit() or int(pid) == me:
+            continue
+        fd_dir = f"/proc/{pid}/fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue  # process exited or not ours to inspect
+        for fd in fds:
+            try:
+                if os.readlink(f"{fd_dir}/{fd}") == target:
+                    with open(f"/proc/{pid}/comm") as f:
+                        owners.append((int(pid), f.read().strip()))
+                    break
+            except OSError:
+                continue
+    return owners
 
 
 class Serial:
-    def __init__(self, modem: ModemInterface):
+    def __init__(self, modem: ModemInterface, wait: float = 0, transport: str = None):
+        """Open the AT port exclusively. If it is busy, retry for up to
+        wait seconds, then raise PortBusyError naming the owners.
+
+        transport is "raw" (RawTransport), "pyserial", or "auto" to try the
+        raw transport and fall back to pyserial; defaults to modem.transport.
+        """
         self.modem = modem
+        self.transport = transport or getattr(modem, "transport", "auto")
         self.logger = logging.getLogger(self.__class__.__name__)
         self.serial_conn = None
-        if self.serialAvailable():
-            self.serial_conn = self.open_serial()
-        else:
-            self.serial_conn = None
+        self.serial_conn = self.open_serial(wait=wait)
 
     def serialAvailable(self) -> bool:
-        try:
-            output = subprocess.check_output(
-                ["sudo", "lsof", self.modem.ATCommand], text=True
+        owners = port_owners(self.modem.ATCommand)
+        if owners:
+            self.logger.info(
+                f"Serial port {self.modem.ATCommand} is in use by the following processes: {owners}"
             )
-            if output.strip():  # If there's any output, the port is in use
-                self.logger.info(
-                    f"Serial port {self.modem.ATCommand} is in use by the following processes:\n{output}"
-                )
-                return False
-        except subprocess.CalledProcessError:
-            self.logger.info(f"Serial port {self.modem.ATCommand} is not in use.")
+            return False
+        self.logger.info(f"Serial port {self.modem.ATCommand} is not in use.")
         return True
 
-    def open_serial(self) -> serial.Serial:
-        self.logger.debug(
-            f"Opening serial with: port={self.modem.ATCommand}, baudrate={self.modem.baudrate}, timeout={self.modem.timeout}"
-        )
+    def _open_raw(self) -> RawTransport:
         try:
-            serial_conn = serial.Serial(
-                port=self.modem.ATCommand,
+            # RawTransport takes the same non-blocking flock and TIOCEXCL
+            return RawTransport(
+                self.modem.ATCommand,
                 baudrate=self.modem.baudrate,
                 timeout=self.modem.timeout,
+                exclusive=True,
             )
-            self.logger.info(f"Opened serial port {serial_conn.port} successfully.")
-            return serial_conn
-        except serial.SerialException as e:
-            self.logger.error(f"Could not open serial port: {e}")
-            return None
+        except BlockingIOError as e:
+            raise serial.SerialException(f"Could not exclusively lock port {self.modem.ATCommand}: {e}")
+
+    def _open_exclusive(self):
+        if self.transport in ("auto", "raw"):
+            try:
+                return self._open_raw()
+            except serial.SerialException:
+                raise  # busy: falling back would only hit the same lock
+            except (OSError, ValueError, termios.error) as e:
+                if self.transport == "raw":
+                    raise serial.SerialException(f"Could not open port {self.modem.ATCommand}: {e}")
+                self.logger.info(f"Raw transport unavailable ({e}), falling back to pyserial.")
+        # exclusive=True makes pyserial take a non-blocking flock on the tty,
+        # so checking and claiming the port is a single atomic step.
+        serial_conn = serial.Serial(
+            port=self.modem.ATCommand,
+            baudrate=self.modem.baudrate,
+            timeout=self.modem.timeout,
+            exclusive=True,
+        )
+        try:
+            # Also refuse further open()s of the tty by non-root processes
+            fcntl.ioctl(serial_conn.fileno(), termios.TIOCEXCL)
+        except OSError as e:
+            self.logger.debug(f"TIOCEXCL not applied: {e}")
+        return serial_conn
+
+    def open_serial(self, wait: float = 0):
+        self.logger.debug(
+            f"Opening serial with: port={self.modem.ATCommand}, baudrate={self.modem.baudrate}, timeout={self.modem.timeout}"
+        )
+        deadline = time.monotonic() + wait
+        delay = 0.1
+        while True:
+            try:
+                serial_conn = self._open_exclusive()
+                self.logger.info(f"Opened serial port {serial_conn.port} successfully.")
+                return serial_conn
+            except serial.SerialException as e:
+                busy = "lock" in str(e).lower() or "busy" in str(e).lower()
+                if not busy:
+                    self.logger.error(f"Could not open serial port: {e}")
+                    raise
+                if time.monotonic() >= deadline:
+                    raise PortBusyError(self.modem.ATCommand, port_owners(self.modem.ATCommand)) from e
+                self.logger.info(f"Serial port {self.modem.ATCommand} busy, waiting...")
+                time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+                delay = min(delay * 2, 2.0)
 
     def close_serial(self):
         """Close the serial connection."""
         if self.serial_conn and self.serial_conn.is_open:
+            try:
+                fcntl.ioctl(self.serial_conn.fileno(), termios.TIOCNXCL)
+            except OSError:
+                pass
             self.serial_conn.close()
             self.logger.info("Serial connection closed.")
 
@@ -0,0 +1,90 @@
+import fcntl
+import json
+import os
+import socket
+import struct
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_FILE = "/var/lib/modem/session.json"
+SIOCGIFADDR = 0x8915
+
+
+def interface_address(ifname):
+    """IPv4 address currently assigned to ifname, or None."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            ifreq = fcntl.ioctl(s.fileno(), SIOCGIFADDR, struct.pack("256s", ifname.encode()[:15]))
+        except OSError:
+            return None
+    return socket.inet_ntoa(ifreq[20:24])
+
+
+class SessionRecord:
+    """The last data session that reached CONFIGURED."""
+
+    FIELDS = (
+        "packet_data_handle",
+        "wds_client_id",
+        "apn",
+        "ip",
+        "prefix_length",
+        "gateway",
+        "dns",
+        "mtu",
+        "interface",
+        "imei",
+        "iccid",
+        "saved_at",
+    )
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: v for k, v in data.items() if k in cls.FIELDS})
+
+    def __repr__(self):
+        return (
+            f"SessionRecord(handle={self.packet_data_handle}, cid={self.wds_client_id}, "
+            f"apn={self.apn}, ip={self.ip}/{self.prefix_length}, interface={self.interface})"
+        )
+
+
+class SessionStore:
+    def __init__(self, path=DEFAULT_SESSION_FILE):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return SessionRecord.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable session file {self.path}: {e}")
+            return None
+
+    def save(self, record):
+        record.saved_at = time.time()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(record.to_dict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        logger.info(f"Saved session {record} to {self.path}.")
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
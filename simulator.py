@@ -0,0 +1,1253 @@
+import math
+import os
+import posixpath
+import pty
+import random
+import select
+import shlex
+import socket
+import struct
+import threading
+import time
+import tty
+import zlib
+import logging
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from modem.qmi import (
+    CTL,
+    WDS,
+    DMS,
+    NAS,
+    UIM,
+    CTL_ALLOCATE_CID,
+    CTL_RELEASE_CID,
+    DMS_GET_REVISION,
+    DMS_GET_IDS,
+    DMS_GET_OPERATING_MODE,
+    DMS_SET_OPERATING_MODE,
+    DMS_UIM_GET_ICCID,
+    NAS_GET_SERVING_SYSTEM,
+    WDS_START_NETWORK,
+    WDS_STOP_NETWORK,
+    WDS_GET_PACKET_SERVICE_STATUS,
+    WDS_GET_CURRENT_SETTINGS,
+    UIM_VERIFY_PIN,
+    UIM_GET_CARD_STATUS,
+    OPERATING_MODES,
+    decode_message,
+    encode_tlvs,
+)
+from modem.sms import encode_submit, split_message
+from modem.telemetry import CONNACK, CONNECT, DISCONNECT, PINGREQ, PINGRESP, PUBACK, PUBLISH, encode_packet, read_packet
+
+logger = logging.getLogger(__name__)
+
+CTRL_Z = b"\x1a"
+ESC = b"\x1b"
+
+# Typical RM520N response times in seconds, longest matching prefix wins
+AT_LATENCY = {
+    "": 0.003,
+    "ATI": 0.005,
+    "AT+CSQ": 0.008,
+    "AT+COPS": 0.040,
+    "AT+CREG?": 0.006,
+    "AT+QCCID": 0.015,
+    "AT+CMGL": 0.030,
+    "AT+CMGS": 1.200,  # network round trip to the SMSC
+    "AT+CMGD": 0.020,
+    "AT+QGPS=1": 0.050,
+    "AT+QGPSLOC": 0.015,
+    "AT+QIACT=": 0.500,
+    "AT+QIOPEN": 0.010,
+    "AT+QISEND": 0.008,
+    "AT+QIRD": 0.004,
+    "AT+QICLOSE": 0.020,
+    "AT+QFTPOPEN": 0.300,
+    "AT+QFTPGET": 0.050,
+    "AT+QFTPPUT": 0.050,
+    "AT+QHTTPGET": 0.100,
+    "AT+QHTTPPOST": 0.100,
+    "AT+QENG": 0.020,
+}
+# Commands answered with a "> " prompt and completed by data + Ctrl+Z
+PROMPT_COMMANDS = ("AT+CMGS=", "AT+QISEND=")
+# Commands answered with CONNECT followed by raw payload from the modem
+DOWNLOAD_COMMANDS = ("AT+QFTPGET=", "AT+QHTTPREAD")
+QMI_LATENCY = {
+    None: 0.004,
+    (DMS, DMS_SET_OPERATING_MODE): 0.150,
+    (NAS, NAS_GET_SERVING_SYSTEM): 0.010,
+    (UIM, UIM_VERIFY_PIN): 0.300,
+    (WDS, WDS_START_NETWORK): 0.800,
+    (WDS, WDS_STOP_NETWORK): 0.200,
+}
+
+# QMI error codes used by the simulator (see qmi.ERRORS)
+QMI_CALL_FAILED = 0x000E
+QMI_INCORRECT_PIN = 0x0028
+QMI_INVALID_COMMAND = 0x0030
+
+
+def _open_pty():
+    """(master fd, slave fd, slave path) for a raw pseudo-terminal."""
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    return master, slave, os.ttyname(slave)
+
+
+def nmea_sentence(body) -> str:
+    checksum = 0
+    for char in body:
+        checksum ^= ord(char)
+    return f"${body}*{checksum:02X}\r\n"
+
+
+def _nmea_degrees(value, positive, negative, width):
+    hemisphere = positive if value >= 0 else negative
+    value = abs(value)
+    degrees = int(value)
+    return f"{degrees:0{width}d}{(value - degrees) * 60:07.4f}", hemisphere
+
+
+def _ipv4(address):
+    return struct.pack("<I", struct.unpack(">I", socket.inet_aton(address))[0])
+
+
+def encode_deliver(sender, text, timestamp=None, reference=0):
+    """SMS-DELIVER PDUs (hex, with an empty SMSC field) as AT+CMGL lists them,
+    built from the SMS-SUBMIT encoder."""
+    encoding, parts = split_message(text)
+    when = datetime.fromtimestamp(timestamp or time.time(), timezone.utc)
+    digits = when.strftime("%y%m%d%H%M%S") + "00"  # GMT+0
+    scts = bytes(int(digits[i + 1] + digits[i], 16) for i in range(0, 14, 2))
+    pdus = []
+    for sequence, units in enumerate(parts, start=1):
+        submit, _ = encode_submit(sender, encoding, units, reference, len(parts), sequence)
+        tpdu = bytes.fromhex(submit)[1:]
+        address_len = 2 + (tpdu[2] + 1) // 2
+        address = tpdu[2 : 2 + address_len]
+        pid, dcs, udl = tpdu[2 + address_len : 5 + address_len]
+        ud = tpdu[5 + address_len :]
+        first_octet = 0x04 | (tpdu[0] & 0x40)  # SMS-DELIVER, no more messages, UDHI
+        deliver = bytes([first_octet]) + address + bytes([pid, dcs]) + scts + bytes([udl]) + ud
+        pdus.append("00" + deliver.hex().upper())
+    return pdus
+
+
+class _Connection:
+    """A QIOPEN connection backed by a real host socket."""
+
+    def __init__(self, sim, connect_id, kind, host, port):
+        self.sim = sim
+        self.connect_id = connect_id
+        self.kind = kind
+        self.rx = bytearray()
+        self.notified = False  # +QIURC "recv" sent and not yet drained
+        self.lock = threading.Lock()
+        if kind == "UDP":
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.connect((host, port))
+        else:
+            self.sock = socket.create_connection((host, port), timeout=5)
+        self.sock.settimeout(None)
+        threading.Thread(target=self._pump, name="SimulatedSocket", daemon=True).start()
+
+    def _pump(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                data = b""
+            if not data and self.kind != "UDP":
+                self.sim.emit(f'+QIURC: "closed",{self.connect_id}')
+                return
+            with self.lock:
+                self.rx += data
+                notify = not self.notified
+                self.notified = True
+            if notify:
+                self.sim.emit(f'+QIURC: "recv",{self.connect_id}')
+
+    def read(self, size):
+        with self.lock:
+            data = bytes(self.rx[:size])
+            del self.rx[:size]
+            if not self.rx:
+                self.notified = False
+            return data
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class SimulatedModem:
+    """Scriptable Quectel RM520N stand-in served over pseudo-terminals.
+
+    at_port and nmea_port are tty paths that Serial, AT, ATReader and
+    NMEAStream open like the real ttyUSB2/ttyUSB1; qmi_port speaks QMUX for
+    QMIClient, and qmicli() stands in for the qmicli binary. Responses are
+    delayed by AT_LATENCY/QMI_LATENCY times scale, with jitter. Handlers
+    registered with on() take precedence over the built-in commands.
+    """
+
+    def __init__(
+        self,
+        scale=1.0,
+        jitter=0.2,
+        pin=None,
+        mode="online",
+        register_delay=1.5,
+        reboot_delay=5.0,
+        nmea_rate=1.0,
+        ttff=3.0,
+        position=(48.1173, 11.5167),
+        speed=1.5,
+        seed=None,
+    ):
+        self.scale = scale
+        self.jitter = jitter
+        self.at_latency = dict(AT_LATENCY)
+        self.qmi_latency = dict(QMI_LATENCY)
+        self.random = random.Random(seed)
+
+        self.imei = "869710030002905"
+        self.iccid = "8901260000000000001"
+        self.revision = "RM520NGLAAR01A07M4G"
+        self.operator = "Sim Mobile"
+        self.mcc, self.mnc = 1, 1
+        self.apn = None
+        self.settings = {
+            "ip": "10.64.12.34",
+            "subnet": "255.255.255.252",
+            "gateway": "10.64.12.33",
+            "dns": ("10.64.0.1", "10.64.0.2"),
+            "mtu": 1500,
+        }
+
+        self.pin = pin
+        self.pin_verified = pin is None
+        self.boot_mode = mode
+        self.mode = mode
+        self.registration = 0  # +CREG <stat>
+        self.register_delay = register_delay
+        self.reboot_delay = reboot_delay
+        self.handle = None
+        self.client_ids = {}
+        self.urc_modes = {"+CREG": 0, "+CEREG": 0, "+C5GREG": 0}
+        self.cnmi = False
+        self.cnmi_args = "0,0,0,0,0"
+        self.sms_format = 0
+        self.contexts = {1: ("IPV4V6", "")}  # AT+CGDCONT cid -> (pdp type, APN)
+        # AT+<command>="<key>"[,<value>] settings, values as the modem prints them
+        self.config = {
+            "+QNWPREFCFG": {
+                "mode_pref": "AUTO",
+                "lte_band": "1:2:3:4:5:7:8:12:13:14:17:18:19:20:25:26:28:29:30:32:34:38:39:40:41:42:43:46:48:66:71",
+                "nr5g_band": "1:2:3:5:7:8:12:20:25:28:38:40:41:48:66:71:77:78:79",
+                "nsa_nr5g_band": "1:2:3:5:7:8:12:20:25:28:38:40:41:48:66:71:77:78:79",
+            },
+            "+QGPSCFG": {"outport": '"usbnmea"', "gnssconfig": "1", "autogps": "0"},
+            "+QURCCFG": {"urcport": '"usbat"'},
+        }
+        self.echo = True
+        self.sms_storage = {}  # index -> PDU hex
+        self.sms_status = {}  # index -> +CMGL <stat>, 0 (received unread) if missing
+        self.sent = []  # PDUs submitted with AT+CMGS
+        self._message_reference = 0
+        self.pdp_active = False
+        self.connections = {}  # QIOPEN connectID -> _Connection
+        self._deferred = []  # actions to run once the current response is written
+        self.files = {}  # path -> bytearray served over QFTP*/QHTTP*
+        self.ftp_cwd = "/"
+        self.http_url = None
+        self.http_response = b""
+        self.drop_transfer_after = None  # cut the next download off after this many bytes
+
+        # Serving cell reported by AT+QENG; signal values random-walk per query
+        self.cell = {
+            "rat": "NR5G-NSA",  # "LTE", "NR5G-NSA" or "NR5G-SA"
+            "cell_id": 0x1A2D003,
+            "pci": 310,
+            "band": 3,
+            "nr_band": 78,
+            "rsrp": -95.0,
+            "rsrq": -11.0,
+            "sinr": 12.0,
+            "nr_rsrp": -88.0,
+            "nr_rsrq": -11.0,
+            "nr_sinr": 15.0,
+        }
+        self.neighbours = [(311, -101.0), (97, -106.0)]  # (pci, rsrp)
+        self.handover_rate = 0.0  # chance per AT+QENG of moving to another cell
+
+        self.nmea_rate = nmea_rate
+        self.ttff = ttff
+        self.position = list(position)
+        self.speed = speed  # m/s, heading east
+        self.gnss_started = None
+
+        self.handlers = {}
+        self._write_lock = threading.Lock()
+        self._state_lock = threading.RLock()
+        self._timers = []
+        self._running = threading.Event()
+        self._threads = []
+        self._fds = []
+
+    # --- lifecycle ------------------------------------------------------------
+
+    def start(self):
+        self._at_master, at_slave, self.at_port = _open_pty()
+        self._nmea_master, nmea_slave, self.nmea_port = _open_pty()
+        self._qmi_master, qmi_slave, self.qmi_port = _open_pty()
+        # Keep the slaves open so the masters never see EIO between clients
+        self._fds = [self._at_master, at_slave, self._nmea_master, nmea_slave, self._qmi_master, qmi_slave]
+        self._running.set()
+        for target in (self._serve_at, self._serve_qmi, self._serve_nmea):
+            thread = threading.Thread(target=target, name="SimulatedModem", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.mode == "online":
+            self._schedule_registration()
+        logger.info(f"Simulated modem: AT {self.at_port}, NMEA {self.nmea_port}, QMI {self.qmi_port}")
+        return self
+
+    def stop(self):
+        self._running.clear()
+        for connection in self.connections.values():
+            connection.close()
+        for timer in self._timers:
+            timer.cancel()
+        for thread in self._threads:
+            thread.join(1)
+        for fd in self._fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._fds = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def interface(self, sim=None, **kwargs):
+        """A ModemInterface wired to the simulated ports."""
+        from modem.card import SIM
+        from modem.interface import ModemInterface
+
+        sim = sim or SIM("+15550100", self.pin or "0000", "0000", "00000000", "00000000", "internet")
+        kwargs.setdefault("require_root", False)
+        return ModemInterface(
+            self.qmi_port, self.nmea_port, self.at_port, self.at_port, self.at_port, sim, **kwargs
+        )
+
+    # --- scripting ------------------------------------------------------------
+
+    def on(self, prefix, handler):
+        """Answer commands starting with prefix with handler(cmd) -> list of
+        response lines ending in the final result code, or None to fall
+        through to the built-in behaviour."""
+        self.handlers[prefix] = handler
+
+    def emit(self, line):
+        """Send an unsolicited line on the AT port."""
+        self._write(self._at_master, f"\r\n{line}\r\n".encode())
+
+    def _later(self, delay, action):
+        timer = threading.Timer(delay * self.scale, action)
+        timer.daemon = True
+        self._timers = [t for t in self._timers if t.is_alive()] + [timer]
+        timer.start()
+
+    def set_registration(self, stat):
+        with self._state_lock:
+            self.registration = stat
+            if stat not in (1, 5):
+                self.handle = None
+        for prefix, mode in self.urc_modes.items():
+            if mode:
+                self.emit(f"{prefix}: {stat}")
+
+    def _schedule_registration(self):
+        def register():
+            if self.mode == "online" and self.pin_verified and self.registration not in (1, 5):
+                self.set_registration(1)
+
+        self._later(self.register_delay, register)
+
+    def set_cell(self, **fields):
+        """Script the serving cell reported by AT+QENG (see self.cell)."""
+        with self._state_lock:
+            self.cell.update(fields)
+
+    def set_mode(self, mode):
+        with self._state_lock:
+            self.mode = mode
+            if mode == "reset":
+                self.reboot()
+            elif mode == "online":
+                self._schedule_registration()
+            elif self.registration:
+                self.set_registration(0)
+
+    def reboot(self):
+        """Drop all volatile state and announce RDY after reboot_delay."""
+        with self._state_lock:
+            self.registration = 0
+            self.handle = None
+            self.client_ids = {}
+            self.pin_verified = self.pin is None
+            self.urc_modes = dict.fromkeys(self.urc_modes, 0)
+            self.cnmi = False
+            self.gnss_started = None
+
+        def ready():
+            self.mode = self.boot_mode
+            self.emit("RDY")
+            if self.mode == "online":
+                self._schedule_registration()
+
+        self._later(self.reboot_delay, ready)
+
+    def verify_pin(self, pin) -> bool:
+        with self._state_lock:
+            if self.pin is not None and pin != self.pin:
+                return False
+            self.pin_verified = True
+        if self.mode == "online":
+            self._schedule_registration()
+        return True
+
+    def start_network(self, apn):
+        with self._state_lock:
+            if self.registration not in (1, 5):
+                return None
+            if self.handle is None:
+                self.apn = apn
+                self.handle = self.random.randrange(1, 0xFFFFFFFF)
+            return self.handle
+
+    def stop_network(self):
+        with self._state_lock:
+            self.handle = None
+
+    def deliver_sms(self, sender, text, timestamp=None):
+        """Store an incoming message (one entry per part) and raise +CMTI."""
+        with self._state_lock:
+            self._message_reference = (self._message_reference + 1) % 256
+            indexes = []
+            for pdu in encode_deliver(sender, text, timestamp, self._message_reference):
+                index = next(i for i in range(len(self.sms_storage) + 1) if i not in self.sms_storage)
+                self.sms_storage[index] = pdu
+                indexes.append(index)
+        if self.cnmi:
+            for index in indexes:
+                self.emit(f'+CMTI: "SM",{index}')
+        return indexes
+
+    def store_outgoing(self, number, text, stat=2):
+        """Store an SMS-SUBMIT in the outbox (stat 2: unsent, 3: sent), as
+        AT+CMGW would."""
+        encoding, parts = split_message(text)
+        with self._state_lock:
+            index = next(i for i in range(len(self.sms_storage) + 1) if i not in self.sms_storage)
+            self.sms_storage[index] = encode_submit(number, encoding, parts[0])[0]
+            self.sms_status[index] = stat
+        return index
+
+    # --- I/O ------------------------------------------------------------------
+
+    def _write(self, fd, data):
+        with self._write_lock:
+            try:
+                os.write(fd, data)
+            except OSError as e:
+                logger.debug(f"Simulator write failed: {e}")
+
+    def _delay(self, base):
+        if base and self.scale:
+            spread = base * self.jitter
+            time.sleep(max(0.0, base + self.random.uniform(-spread, spread)) * self.scale)
+
+    def _read(self, fd):
+        readable, _, _ = select.select([fd], [], [], 0.1)
+        if not readable:
+            return b""
+        try:
+            return os.read(fd, 65536)
+        except OSError:
+            return b""
+
+    # --- AT -------------------------------------------------------------------
+
+    def _serve_at(self):
+        buffer = bytearray()
+        pending = None  # command waiting for its data after the "> " prompt
+        receiving = None  # (command, length) reading a payload after CONNECT
+        while self._running.is_set():
+            buffer += self._read(self._at_master)
+            while self._running.is_set():
+                if receiving is not None:
+                    cmd, length = receiving
+                    if len(buffer) < length:
+                        break
+                    data, buffer = bytes(buffer[:length]), buffer[length:]
+                    receiving = None
+                    self._respond(cmd, self._at_upload(cmd, data))
+                    while self._deferred:
+                        self._deferred.pop(0)()
+                    continue
+                if pending is not None:
+                    end = min((i for i in (buffer.find(CTRL_Z), buffer.find(ESC)) if i >= 0), default=-1)
+                    if end < 0:
+                        break
+                    data, cancelled, buffer = buffer[:end], buffer[end:end + 1] == ESC, buffer[end + 1 :]
+                    cmd, pending = pending, None
+                    if not cancelled:
+                        self._respond(cmd, self._at_send_data(cmd, data.decode(errors="ignore").strip()))
+                    continue
+                end = buffer.find(b"\r")
+                if end < 0:
+                    break
+                line, buffer = buffer[:end].decode(errors="ignore").strip(), buffer[end + 1 :]
+                if not line:
+                    continue
+                if self.echo:
+                    self._write(self._at_master, (line + "\r").encode())
+                if line.upper().startswith(PROMPT_COMMANDS):
+                    self._delay(self.at_latency[""])
+                    self._write(self._at_master, b"\r\n> ")
+                    pending = line
+                    continue
+                if line.upper().startswith(DOWNLOAD_COMMANDS):
+                    self._serve_download(line)
+                    continue
+                length = self._upload_length(line)
+                if length is not None:
+                    self._delay(self.at_latency[""])
+                    self._write(self._at_master, b"\r\nCONNECT\r\n")
+                    receiving = (line, length)
+                    continue
+                self._respond(line, self.handle_at(line))
+                while self._deferred:
+                    self._deferred.pop(0)()
+
+    def _latency(self, cmd):
+        key = max((p for p in self.at_latency if cmd.upper().startswith(p)), key=len)
+        return self.at_latency[key]
+
+    def _respond(self, cmd, lines):
+        self._delay(self._latency(cmd))
+        self._write(self._at_master, b"".join(f"\r\n{line}\r\n".encode() for line in lines))
+
+    def handle_at(self, line):
+        """Response lines (ending in the final result code) for one command
+        line; ";"-chained commands are answered in order."""
+        if not line.upper().startswith("AT"):
+            return ["ERROR"]
+        commands = [line] if ";" not in line else ["AT" + part.strip() for part in line[2:].split(";") if part.strip()]
+        out = []
+        for cmd in commands:
+            lines = self._handle_one(cmd)
+            if lines[-1] != "OK":
+                return out + lines
+            out += lines[:-1]
+        return out + ["OK"]
+
+    def _handle_one(self, cmd):
+        for prefix, handler in self.handlers.items():
+            if cmd.upper().startswith(prefix.upper()):
+                lines = handler(cmd)
+                if lines is not None:
+                    return lines
+        upper = cmd.upper()
+        if upper in ("AT", "ATZ"):
+            return ["OK"]
+        if upper.startswith(("AT+QNWPREFCFG=", "AT+QGPSCFG=", "AT+QURCCFG=")):
+            return self._at_config(cmd)
+        if upper == "AT+CMGF?":
+            return [f"+CMGF: {self.sms_format}", "OK"]
+        if upper.startswith("AT+CMGF="):
+            self.sms_format = int(cmd.split("=", 1)[1])
+            return ["OK"]
+        if upper == "AT+CGDCONT?":
+            return [f'+CGDCONT: {cid},"{kind}","{apn}","0.0.0.0",0,0,0,0' for cid, (kind, apn) in sorted(self.contexts.items())] + ["OK"]
+        if upper.startswith("AT+CGDCONT="):
+            args = [a.strip().strip('"') for a in cmd.split("=", 1)[1].split(",")]
+            self.contexts[int(args[0])] = (args[1].upper(), args[2] if len(args) > 2 else "")
+            return ["OK"]
+        if upper in ("ATE0", "ATE1"):
+            self.echo = upper == "ATE1"
+            return ["OK"]
+        if upper == "ATI":
+            return ["Quectel", "RM520N-GL", f"Revision: {self.revision}", "OK"]
+        if upper in ("AT+GSN", "AT+CGSN"):
+            return [self.imei, "OK"]
+        if upper == "AT+QCCID":
+            return [f"+QCCID: {self.iccid}", "OK"]
+        if upper == "AT+CSQ":
+            rssi = self.random.randint(14, 24) if self.mode == "online" else 99
+            return [f"+CSQ: {rssi},99", "OK"]
+        if upper == "AT+CPIN?":
+            return ["+CPIN: READY" if self.pin_verified else "+CPIN: SIM PIN", "OK"]
+        if upper.startswith("AT+CPIN="):
+            return ["OK"] if self.verify_pin(cmd.split("=", 1)[1].strip('"')) else ["+CME ERROR: 16"]
+        if upper == "AT+CFUN?":
+            return [f"+CFUN: {1 if self.mode == 'online' else 4}", "OK"]
+        if upper.startswith("AT+CFUN="):
+            return self._at_cfun(cmd)
+        if upper == "AT+COPS?":
+            if self.registration in (1, 5):
+                return [f'+COPS: 0,0,"{self.operator}",7', "OK"]
+            return ["+COPS: 0", "OK"]
+        for prefix in self.urc_modes:
+            if upper == f"AT{prefix}?":
+                return [f"{prefix}: {self.urc_modes[prefix]},{self.registration}", "OK"]
+            if upper.startswith(f"AT{prefix}="):
+                self.urc_modes[prefix] = int(cmd.split("=", 1)[1] or 0)
+                return ["OK"]
+        if upper == "AT+CNMI?":
+            return [f"+CNMI: {self.cnmi_args}", "OK"]
+        if upper.startswith("AT+CNMI="):
+            self.cnmi_args = cmd.split("=", 1)[1]
+            self.cnmi = self.cnmi_args.split(",")[1:2] != ["0"]
+            return ["OK"]
+        if upper.startswith("AT+CMGL"):
+            out = []
+            for index, pdu in sorted(self.sms_storage.items()):
+                out += [f"+CMGL: {index},{self.sms_status.get(index, 0)},,{len(pdu) // 2 - 1}", pdu]
+            return out + ["OK"]
+        if upper.startswith("AT+CMGR="):
+            pdu = self.sms_storage.get(int(cmd.split("=", 1)[1]))
+            return [f"+CMGR: 0,,{len(pdu) // 2 - 1}", pdu, "OK"] if pdu else ["+CMS ERROR: 321"]
+        if upper.startswith("AT+CMGD="):
+            args = cmd.split("=", 1)[1].split(",")
+            with self._state_lock:
+                if len(args) > 1 and args[1].strip() == "4":
+                    self.sms_storage.clear()
+                    self.sms_status.clear()
+                else:
+                    self.sms_storage.pop(int(args[0]), None)
+                    self.sms_status.pop(int(args[0]), None)
+            return ["OK"]
+        if upper.startswith("AT+QGPS"):
+            return self._at_gnss(upper)
+        if upper.startswith(("AT+QICFG=", "AT+QICSGP=")):
+            return ["OK"]
+        if upper.startswith(("AT+QIACT", "AT+QIDEACT", "AT+QIOPEN=", "AT+QIRD=", "AT+QICLOSE=")):
+            return self._at_socket(cmd, upper)
+        if upper.startswith(("AT+QFTP", "AT+QHTTP")):
+            return self._at_file(cmd, upper)
+        if upper.startswith("AT+QENG="):
+            return self._at_qeng(upper)
+        return ["ERROR"]
+
+    def _at_config(self, cmd):
+        command, _, args = cmd[2:].partition("=")
+        key, _, value = args.partition(",")
+        settings = self.config[command.upper()]
+        key = key.strip('"').lower()
+        if key not in settings:
+            return ["+CME ERROR: 3"]
+        if value:
+            settings[key] = value
+            return ["OK"]
+        return [f'{command}: "{key}",{settings[key]}', "OK"]
+
+    def _at_cfun(self, cmd):
+        args = cmd.split("=", 1)[1].split(",")
+        if len(args) > 1 and args[1].strip() == "1":
+            self.set_mode("reset")
+        else:
+            self.set_mode("online" if args[0].strip() == "1" else "low-power")
+        return ["OK"]
+
+    def _at_socket(self, cmd, upper):
+        args = [a.strip().strip('"') for a in cmd.split("=", 1)[1].split(",")] if "=" in cmd else []
+        if upper == "AT+QIACT?":
+            if self.pdp_active:
+                return [f'+QIACT: 1,1,1,"{self.settings["ip"]}"', "OK"]
+            return ["OK"]
+        if upper.startswith("AT+QIACT="):
+            if self.registration not in (1, 5):
+                return ["+CME ERROR: 30"]  # no network service
+            self.pdp_active = True
+            return ["OK"]
+        if upper.startswith("AT+QIDEACT="):
+            self.pdp_active = False
+            for connect_id in list(self.connections):
+                self.connections.pop(connect_id).close()
+            return ["OK"]
+        if upper.startswith("AT+QIOPEN="):
+            connect_id, kind, host, port = int(args[1]), args[2].upper(), args[3], int(args[4])
+            if not self.pdp_active or connect_id in self.connections:
+                return ["ERROR"]
+
+            def open_connection():
+                try:
+                    self.connections[connect_id] = _Connection(self, connect_id, kind, host, port)
+                    self.emit(f"+QIOPEN: {connect_id},0")
+                except OSError:
+                    self.emit(f"+QIOPEN: {connect_id},566")  # socket connect failed
+
+            self._deferred.append(open_connection)
+            return ["OK"]
+        if upper.startswith("AT+QIRD="):
+            connection = self.connections.get(int(args[0]))
+            if connection is None:
+                return ["ERROR"]
+            data = connection.read(int(args[1]) if len(args) > 1 else 1500)
+            if not data:
+                return ["+QIRD: 0", "OK"]
+            return [f"+QIRD: {len(data)}", data.hex().upper(), "OK"]
+        if upper.startswith("AT+QICLOSE="):
+            connection = self.connections.pop(int(args[0]), None)
+            if connection is not None:
+                connection.close()
+            return ["OK"]
+        return ["ERROR"]
+
+    # --- FTP/HTTP ---------------------------------------------------------------
+
+    @staticmethod
+    def _args(cmd):
+        return [a.strip().strip('"') for a in cmd.split("=", 1)[1].split(",")] if "=" in cmd else []
+
+    def _ftp_path(self, name):
+        return posixpath.normpath(posixpath.join(self.ftp_cwd, name)).lstrip("/")
+
+    def _later_urc(self, line):
+        self._deferred.append(lambda: self.emit(line))
+
+    def _at_file(self, cmd, upper):
+        args = self._args(cmd)
+        if upper.startswith(("AT+QFTPCFG=", "AT+QHTTPCFG=")):
+            return ["OK"]
+        if not self.pdp_active:
+            return ["+CME ERROR: 30"]
+        if upper.startswith("AT+QFTPOPEN="):
+            self.ftp_cwd = "/"
+            self._later_urc("+QFTPOPEN: 0,0")
+        elif upper == "AT+QFTPCLOSE":
+            self._later_urc("+QFTPCLOSE: 0,0")
+        elif upper.startswith("AT+QFTPCWD="):
+            self.ftp_cwd = posixpath.join(self.ftp_cwd, args[0])
+            self._later_urc("+QFTPCWD: 0,0")
+        elif upper.startswith("AT+QFTPSIZE="):
+            data = self.files.get(self._ftp_path(args[0]))
+            self._later_urc(f"+QFTPSIZE: 0,{len(data)}" if data is not None else "+QFTPSIZE: 627,550")
+        elif upper.startswith("AT+QHTTPGET="):
+            status, self.http_response = self._http_get(urlsplit(self.http_url or "").path, {})
+            self._later_urc(f"+QHTTPGET: 0,{status},{len(self.http_response)}")
+        else:
+            return ["ERROR"]
+        return ["OK"]
+
+    def _upload_length(self, cmd):
+        """Bytes a data-mode command reads after CONNECT, or None."""
+        upper = cmd.upper()
+        if not upper.startswith(("AT+QHTTPURL=", "AT+QHTTPPOST=", "AT+QHTTPGET=", "AT+QFTPPUT=")):
+            return None
+        args = self._args(cmd)
+        if upper.startswith(("AT+QHTTPURL=", "AT+QHTTPPOST=")):
+            return int(args[0])
+        if upper.startswith("AT+QHTTPGET="):
+            return int(args[1]) if len(args) > 1 else None
+        return int(args[3]) if len(args) > 3 else None
+
+    def _at_upload(self, cmd, data):
+        upper = cmd.upper()
+        args = self._args(cmd)
+        if upper.startswith("AT+QHTTPURL="):
+            self.http_url = data.decode(errors="ignore")
+            return ["OK"]
+        if upper.startswith("AT+QFTPPUT="):
+            stored = self.files.setdefault(self._ftp_path(args[0]), bytearray())
+            del stored[int(args[2]) :]
+            stored += data
+            self._later_urc(f"+QFTPPUT: 0,{len(data)}")
+            return ["OK"]
+        method, path, headers, body = self._parse_request(data)
+        if upper.startswith("AT+QHTTPGET="):
+            status, self.http_response = self._http_get(path, headers)
+            self._later_urc(f"+QHTTPGET: 0,{status},{len(self.http_response)}")
+        else:
+            self._later_urc(f"+QHTTPPOST: 0,{self._http_post(path, headers, body)}")
+        return ["OK"]
+
+    @staticmethod
+    def _parse_request(data):
+        head, _, body = data.partition(b"\r\n\r\n")
+        lines = head.decode(errors="ignore").split("\r\n")
+        method, target = lines[0].split()[:2]
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method, urlsplit(target).path, headers, body
+
+    def _http_get(self, path, headers):
+        data = self.files.get(path.lstrip("/"))
+        if data is None:
+            return 404, b""
+        requested = headers.get("range", "")
+        if not requested.startswith("bytes="):
+            return 200, bytes(data)
+        first, _, last = requested[6:].partition("-")
+        first = int(first)
+        last = min(int(last) if last else len(data) - 1, len(data) - 1)
+        if first >= len(data):
+            return 416, b""
+        return 206, bytes(data[first : last + 1])
+
+    def _http_post(self, path, headers, body):
+        content_range = headers.get("content-range")
+        if content_range is None:
+            self.files[path.lstrip("/")] = bytearray(body)
+            return 201
+        span, _, total = content_range.split()[1].partition("/")
+        first = int(span.split("-")[0])
+        stored = self.files.setdefault(path.lstrip("/"), bytearray())
+        del stored[first:]
+        stored += body
+        return 201 if len(stored) >= int(total) else 308
+
+    def _serve_download(self, cmd):
+        """CONNECT, the raw payload, OK and the result URC, as AT+QFTPGET to
+        "COM:" and AT+QHTTPREAD produce them."""
+        self._delay(self._latency(cmd))
+        if cmd.upper().startswith("AT+QHTTPREAD"):
+            payload, urc = self.http_response, "+QHTTPREAD: 0"
+        else:
+            args = self._args(cmd)
+            data = self.files.get(self._ftp_path(args[0])) if self.pdp_active else None
+            if data is None:
+                self._write(self._at_master, b"\r\nOK\r\n")
+                self.emit("+QFTPGET: 627,550")
+                return
+            start = int(args[2]) if len(args) > 2 else 0
+            end = start + int(args[3]) if len(args) > 3 else len(data)
+            payload = bytes(data[start:end])
+            urc = f"+QFTPGET: 0,{len(payload)}"
+        self._write(self._at_master, b"\r\nCONNECT\r\n")
+        drop, self.drop_transfer_after = self.drop_transfer_after, None
+        if drop is not None and drop < len(payload):
+            # Link lost mid-transfer: the modem goes quiet
+            self._write(self._at_master, payload[:drop])
+            return
+        view = memoryview(payload)
+        for i in range(0, len(view), 65536):
+            self._write(self._at_master, view[i : i + 65536])
+        self._write(self._at_master, b"\r\nOK\r\n")
+        self.emit(urc)
+
+    def _at_send_data(self, cmd, pdu):
+        if cmd.upper().startswith("AT+QISEND="):
+            connection = self.connections.get(int(cmd.split("=", 1)[1].split(",")[0]))
+            if connection is None:
+                return ["ERROR"]
+            try:
+                connection.sock.sendall(bytes.fromhex(pdu))
+            except (OSError, ValueError):
+                return ["SEND FAIL"]
+            return ["SEND OK"]
+        if self.registration not in (1, 5):
+            return ["+CMS ERROR: 331"]  # no network service
+        with self._state_lock:
+            self._message_reference = (self._message_reference + 1) % 256
+            self.sent.append(pdu)
+            reference = self._message_reference
+        return [f"+CMGS: {reference}", "OK"]
+
+    def _at_gnss(self, upper):
+        if upper == "AT+QGPS=1":
+            if self.gnss_started is not None:
+                return ["+CME ERROR: 504"]  # session ongoing
+            self.gnss_started = time.monotonic()
+            return ["OK"]
+        if upper == "AT+QGPSEND":
+            if self.gnss_started is None:
+                return ["+CME ERROR: 505"]  # session not active
+            self.gnss_started = None
+            return ["OK"]
+        if upper == "AT+QGPS?":
+            return [f"+QGPS: {0 if self.gnss_started is None else 1}", "OK"]
+        if upper.startswith("AT+QGPSLOC"):
+            if self.gnss_started is None:
+                return ["+CME ERROR: 505"]  # session not active
+            if not self._has_fix():
+                return ["+CME ERROR: 516"]  # not fixed now
+            now = datetime.now(timezone.utc)
+            lat, lon = self.position
+            speed = self.speed * 3.6
+            return [
+                f"+QGPSLOC: {now:%H%M%S}.000,{lat:.5f},{lon:.5f},0.9,545.4,3,0.00,{speed:.1f},{speed / 1.852:.1f},{now:%d%m%y},08",
+                "OK",
+            ]
+        return ["ERROR"]
+
+    def _at_qeng(self, upper):
+        if self.registration not in (1, 5):
+            return ['+QENG: "servingcell","SEARCH"', "OK"]
+        with self._state_lock:
+            cell = self.cell
+            if self.random.random() < self.handover_rate:
+                cell["pci"], cell["rsrp"] = self.neighbours[0]
+                cell["cell_id"] += 1
+            for key, low, high in (("rsrp", -140, -44), ("rsrq", -20, -3), ("sinr", -10, 30)):
+                for name in (key, f"nr_{key}"):
+                    cell[name] = min(high, max(low, cell[name] + self.random.gauss(0, 1)))
+            cell = dict(cell)
+        rsrp, rsrq, sinr = round(cell["rsrp"]), round(cell["rsrq"]), round(cell["sinr"])
+        mcc, mnc = f"{self.mcc:03d}", f"{self.mnc:02d}"
+        if upper == 'AT+QENG="NEIGHBOURCELL"':
+            return [
+                f'+QENG: "neighbourcell intra","LTE",1300,{pci},-11,{round(level)},-70,0,20,6,38,62,32'
+                for pci, level in self.neighbours
+            ] + ["OK"]
+        if upper != 'AT+QENG="SERVINGCELL"':
+            return ["ERROR"]
+        lte = f'"LTE","FDD",{mcc},{mnc},{cell["cell_id"]:X},{cell["pci"]},1300,{cell["band"]},5,5,2B67,{rsrp},{rsrq},-64,{(sinr + 20) * 5},10,-'
+        nr = (round(cell["nr_rsrp"]), round(cell["nr_sinr"]), round(cell["nr_rsrq"]))
+        if cell["rat"] == "LTE":
+            return [f'+QENG: "servingcell","NOCONN",{lte}', "OK"]
+        if cell["rat"] == "NR5G-SA":
+            return [
+                f'+QENG: "servingcell","NOCONN","NR5G-SA","TDD",{mcc},{mnc},{cell["cell_id"]:X},{cell["pci"]},'
+                f'2B67,627264,{cell["nr_band"]},12,{nr[0]},{nr[2]},{nr[1]},-',
+                "OK",
+            ]
+        return [
+            '+QENG: "servingcell","NOCONN"',
+            f"+QENG: {lte}",
+            f'+QENG: "NR5G-NSA",{mcc},{mnc},{cell["pci"] + 200},{nr[0]},{nr[1]},{nr[2]},627264,{cell["nr_band"]},12,-',
+            "OK",
+        ]
+
+    # --- NMEA -----------------------------------------------------------------
+
+    def _has_fix(self):
+        return self.gnss_started is not None and time.monotonic() - self.gnss_started >= self.ttff * self.scale
+
+    def _serve_nmea(self):
+        interval = 1.0 / self.nmea_rate
+        next_at = time.monotonic()
+        while self._running.is_set():
+            time.sleep(max(0.0, next_at - time.monotonic()))
+            next_at += interval
+            if self.gnss_started is None:
+                continue
+            self._write(self._nmea_master, self.nmea_epoch(interval).encode())
+
+    def nmea_epoch(self, interval=1.0):
+        """GGA, GSA and RMC sentences for one epoch; moves the position on."""
+        now = datetime.now(timezone.utc)
+        hhmmss = f"{now:%H%M%S}.{now.microsecond // 10000:02d}"
+        if not self._has_fix():
+            return (
+                nmea_sentence(f"GPGGA,{hhmmss},,,,,0,00,99.9,,M,,M,,")
+                + nmea_sentence("GPGSA,A,1,,,,,,,,,,,,,99.9,99.9,99.9")
+                + nmea_sentence(f"GPRMC,{hhmmss},V,,,,,,,{now:%d%m%y},,,N")
+            )
+        lat, lon = self.position
+        lat_s, ns = _nmea_degrees(lat, "N", "S", 2)
+        lon_s, ew = _nmea_degrees(lon, "E", "W", 3)
+        knots = self.speed * 3.6 / 1.852
+        sentences = (
+            nmea_sentence(f"GPGGA,{hhmmss},{lat_s},{ns},{lon_s},{ew},1,08,0.9,545.4,M,46.9,M,,")
+            + nmea_sentence("GPGSA,A,3,04,05,09,12,17,24,25,29,,,,,1.8,0.9,1.5")
+            + nmea_sentence(f"GPRMC,{hhmmss},A,{lat_s},{ns},{lon_s},{ew},{knots:.1f},90.0,{now:%d%m%y},,,A")
+        )
+        # Step east along the parallel
+        self.position[1] += self.speed * interval / (111320.0 * max(0.01, math.cos(math.radians(lat))))
+        return sentences
+
+    # --- QMI ------------------------------------------------------------------
+
+    def _serve_qmi(self):
+        buffer = b""
+        while self._running.is_set():
+            buffer += self._read(self._qmi_master)
+            while len(buffer) >= 3:
+                length = struct.unpack_from("<H", buffer, 1)[0] + 1
+                if len(buffer) < length:
+                    break
+                frame, buffer = buffer[:length], buffer[length:]
+                try:
+                    service, cid, _, transaction, message, tlvs = decode_message(frame)
+                except struct.error:
+                    continue
+                self._delay(self.qmi_latency.get((service, message), self.qmi_latency[None]))
+                response = self.handle_qmi(service, message, tlvs)
+                self._write(self._qmi_master, self._qmi_frame(service, cid, transaction, message, response))
+
+    @staticmethod
+    def _qmi_frame(service, client_id, transaction, message, tlvs):
+        payload = encode_tlvs(tlvs)
+        if service == CTL:
+            sdu = struct.pack("<BBHH", 0x01, transaction, message, len(payload))
+        else:
+            sdu = struct.pack("<BHHH", 0x02, transaction, message, len(payload))
+        return struct.pack("<BHBBB", 0x01, 5 + len(sdu) + len(payload), 0x80, service, client_id) + sdu + payload
+
+    def handle_qmi(self, service, message, tlvs):
+        """Response TLVs (including the 0x02 result TLV) for one request."""
+        ok = {0x02: struct.pack("<HH", 0, 0)}
+
+        def error(code, extra=None):
+            return {0x02: struct.pack("<HH", 1, code), **(extra or {})}
+
+        key = (service, message)
+        if key == (CTL, CTL_ALLOCATE_CID):
+            requested = tlvs[0x01][0]
+            cid = max(self.client_ids.values(), default=0) + 1
+            self.client_ids[cid] = requested
+            return {**ok, 0x01: bytes([requested, cid])}
+        if key == (CTL, CTL_RELEASE_CID):
+            self.client_ids.pop(tlvs[0x01][1], None)
+            return {**ok, 0x01: tlvs[0x01]}
+        if key == (DMS, DMS_GET_OPERATING_MODE):
+            modes = {v: k for k, v in OPERATING_MODES.items()}
+            return {**ok, 0x01: bytes([modes.get(self.mode, 1)])}
+        if key == (DMS, DMS_SET_OPERATING_MODE):
+            self.set_mode(OPERATING_MODES.get(tlvs[0x01][0], "online"))
+            return ok
+        if key == (DMS, DMS_GET_IDS):
+            return {**ok, 0x11: self.imei.encode()}
+        if key == (DMS, DMS_GET_REVISION):
+            return {**ok, 0x01: self.revision.encode()}
+        if key == (DMS, DMS_UIM_GET_ICCID):
+            return {**ok, 0x01: self.iccid.encode()}
+        if key == (NAS, NAS_GET_SERVING_SYSTEM):
+            registered = self.registration in (1, 5)
+            state = 1 if registered else (2 if self.mode == "online" else 0)
+            system = struct.pack("<BBBBBB", state, int(registered), int(registered), 1, 1, 0x08)
+            out = {**ok, 0x01: system}
+            if registered:
+                name = self.operator.encode()
+                out[0x12] = struct.pack("<HHB", self.mcc, self.mnc, len(name)) + name
+            return out
+        if key == (UIM, UIM_GET_CARD_STATUS):
+            return {**ok, 0x10: self._card_status()}
+        if key == (UIM, UIM_VERIFY_PIN):
+            pin = tlvs[0x02][2 : 2 + tlvs[0x02][1]].decode()
+            return ok if self.verify_pin(pin) else error(QMI_INCORRECT_PIN)
+        if key == (WDS, WDS_START_NETWORK):
+            handle = self.start_network(tlvs.get(0x14, b"").decode())
+            if handle is None:
+                return error(QMI_CALL_FAILED, {0x10: struct.pack("<H", 1)})  # unspecified reason
+            return {**ok, 0x01: struct.pack("<I", handle)}
+        if key == (WDS, WDS_STOP_NETWORK):
+            self.stop_network()
+            return ok
+        if key == (WDS, WDS_GET_PACKET_SERVICE_STATUS):
+            return {**ok, 0x01: bytes([2 if self.handle else 1, 0])}
+        if key == (WDS, WDS_GET_CURRENT_SETTINGS):
+            if self.handle is None:
+                return error(QMI_CALL_FAILED)
+            s = self.settings
+            return {
+                **ok,
+                0x14: (self.apn or "").encode(),
+                0x15: _ipv4(s["dns"][0]),
+                0x16: _ipv4(s["dns"][1]),
+                0x1E: _ipv4(s["ip"]),
+                0x20: _ipv4(s["gateway"]),
+                0x21: _ipv4(s["subnet"]),
+                0x29: struct.pack("<I", s["mtu"]),
+            }
+        return error(QMI_INVALID_COMMAND)
+
+    def _card_status(self):
+        app_state = 7 if self.pin_verified else 2  # ready / PIN1 required
+        if self.pin is None:
+            pin1_state = 3  # disabled
+        else:
+            pin1_state = 2 if self.pin_verified else 1
+        data = struct.pack("<HHHH", 0x0000, 0xFFFF, 0xFFFF, 0xFFFF)
+        data += bytes([1])  # cards
+        data += bytes([1, 0, 0, 0, 0])  # present, UPIN state/retries, error code
+        data += bytes([1])  # applications
+        data += bytes([2, app_state, 0, 0, 0, 0, 0])  # USIM, personalization, no AID
+        data += bytes([0, pin1_state, 3, 10, 3, 3, 10])  # UPIN replaces, PIN1, PIN2
+        return data
+
+    # --- qmicli stand-in --------------------------------------------------------
+
+    def qmicli(self, cmd):
+        """Answer a "qmicli -d <device> --<action>" command line with qmicli's
+        text output; drop-in for ModemInterface.run_command."""
+        args = shlex.split(cmd)
+        device = args[args.index("-d") + 1] if "-d" in args else self.qmi_port
+        action, _, value = next((a for a in args if a.startswith("--") and a != "--client-no-release-cid"), "").partition("=")
+        self._delay(self.qmi_latency[None])
+        tag = f"[{device}]"
+        if action == "--dms-get-operating-mode":
+            return f"{tag} Operating mode retrieved:\n\tMode: '{self.mode}'\n\tHW restricted: 'no'\n"
+        if action == "--dms-set-operating-mode":
+            self._delay(self.qmi_latency[(DMS, DMS_SET_OPERATING_MODE)])
+            self.set_mode(value)
+            return f"{tag} Operating mode set successfully\n"
+        if action == "--dms-get-ids":
+            return f"{tag} Device IDs retrieved:\n\t ESN: '0'\n\tIMEI: '{self.imei}'\n\tMEID: 'unknown'\n"
+        if action == "--dms-get-revision":
+            return f"{tag} Device revision retrieved:\n\tRevision: '{self.revision}'\n"
+        if action == "--dms-uim-get-iccid":
+            return f"{tag} UIM ICCID retrieved:\n\tICCID: '{self.iccid}'\n"
+        if action == "--nas-get-serving-system":
+            registered = self.registration in (1, 5)
+            state = "registered" if registered else ("searching" if self.mode == "online" else "not-registered")
+            out = f"{tag} Successfully got serving system:\n\tRegistration state: '{state}'\n"
+            if registered:
+                out += f"\tCurrent PLMN:\n\t\tMCC: '{self.mcc:03d}'\n\t\tMNC: '{self.mnc:02d}'\n\t\tDescription: '{self.operator}'\n"
+            return out
+        if action == "--uim-get-card-status":
+            app = "ready" if self.pin_verified else "pin1-or-upin-pin-required"
+            pin1 = "disabled" if self.pin is None else ("enabled-verified" if self.pin_verified else "enabled-not-verified")
+            return (
+                f"{tag} UIM card status retrieved:\n\tCard state: 'present'\n"
+                f"\t\tApplication state: '{app}'\n\t\tPIN1 state: '{pin1}'\n"
+            )
+        if action == "--uim-verify-pin":
+            self._delay(self.qmi_latency[(UIM, UIM_VERIFY_PIN)])
+            return f"{tag} PIN verified successfully\n" if self.verify_pin(value.split(",", 1)[1]) else ""
+        if action == "--wds-start-network":
+            self._delay(self.qmi_latency[(WDS, WDS_START_NETWORK)])
+            apn = dict(p.split("=", 1) for p in value.strip('"').split(",") if "=" in p).get("apn", "")
+            handle = self.start_network(apn)
+            if handle is None:
+                return ""
+            return f"{tag} Network started\n\tPacket data handle: '{handle}'\n"
+        if action == "--wds-stop-network":
+            self.stop_network()
+            return f"{tag} Network stopped\n"
+        if action == "--wds-get-packet-service-status":
+            return f"{tag} Connection status: '{'connected' if self.handle else 'disconnected'}'\n"
+        if action == "--wds-get-current-settings":
+            if self.handle is None:
+                return ""
+            s = self.settings
+            return (
+                f"{tag} Current settings retrieved:\n\tIP Family: IPv4\n"
+                f"\tIPv4 address: {s['ip']}\n\tIPv4 subnet mask: {s['subnet']}\n"
+                f"\tIPv4 gateway address: {s['gateway']}\n\tIPv4 primary DNS: {s['dns'][0]}\n"
+                f"\tIPv4 secondary DNS: {s['dns'][1]}\n\tMTU: {s['mtu']}\n"
+            )
+        return ""
+
+
+class MQTTBroker:
+    """Local MQTT 3.1.1 broker stand-in for telemetry tests.
+
+    Accepts any client, stores every PUBLISH in messages as (topic,
+    payload) and acknowledges QoS 1 after ack_delay seconds. Set
+    drop_after to close the connection once that many more messages have
+    arrived, without acknowledging the last one.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, ack_delay=0.0):
+        self.ack_delay = ack_delay
+        self.drop_after = None
+        self.messages = []
+        self.connections = 0
+        self._server = socket.create_server((host, port))
+        self.host, self.port = self._server.getsockname()[:2]
+        self._running = threading.Event()
+
+    def start(self):
+        self._running.set()
+        threading.Thread(target=self._accept, name="MQTTBroker", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        self._server.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def records(self, topic=None) -> list:
+        """Decoded telemetry lines of every message, headers dropped."""
+        out = []
+        for message_topic, payload in self.messages:
+            if topic is None or message_topic == topic:
+                out += zlib.decompress(payload).split(b"\n")[1:]
+        return out
+
+    def _accept(self):
+        while self._running.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), name="MQTTBroker", daemon=True).start()
+
+    def _serve(self, conn):
+        def recv_exact(size):
+            data = b""
+            while len(data) < size:
+                chunk = conn.recv(size - len(data))
+                if not chunk:
+                    raise ConnectionError("client closed")
+                data += chunk
+            return data
+
+        with conn:
+            try:
+                while True:
+                    kind, body = read_packet(recv_exact)
+                    if kind & 0xF0 == CONNECT:
+                        conn.sendall(encode_packet(CONNACK, b"\0\0"))
+                    elif kind & 0xF0 == PINGREQ:
+                        conn.sendall(encode_packet(PINGRESP))
+                    elif kind & 0xF0 == DISCONNECT:
+                        return
+                    elif kind & 0xF0 == PUBLISH and not self._publish(conn, (kind >> 1) & 3, body):
+                        return
+            except (ConnectionError, OSError):
+                return
+
+    def _publish(self, conn, qos, body):
+        """Store one message and acknowledge it; False to drop the connection."""
+        (length,) = struct.unpack("!H", body[:2])
+        topic = body[2 : 2 + length].decode()
+        offset = 2 + length
+        packet_id = None
+        if qos:
+            packet_id = body[offset : offset + 2]
+            offset += 2
+        self.messages.append((topic, body[offset:]))
+        if self.drop_after is not None:
+            self.drop_after -= 1
+            if self.drop_after <= 0:
+                self.drop_after = None
+                return False
+        if packet_id is not None:
+            if self.ack_delay:
+                time.sleep(self.ack_delay)
+            conn.sendall(encode_packet(PUBACK, packet_id))
+        return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    with SimulatedModem() as sim:
+        print(f"AT port:   {sim.at_port}\nNMEA port: {sim.nmea_port}\nQMI port:  {sim.qmi_port}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
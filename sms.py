@@ -0,0 +1,462 @@
+import asyncio
+import queue
+import random
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+SMS_TIMEOUT = 60
+RECEIVED = (0, 1)  # +CMGL <stat>: received unread, received read
+
+# GSM 03.38 default alphabet; index is the septet value
+GSM7_BASIC = (
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENDED = {
+    "\f": 0x0A,
+    "^": 0x14,
+    "{": 0x28,
+    "}": 0x29,
+    "\\": 0x2F,
+    "[": 0x3C,
+    "~": 0x3D,
+    "]": 0x3E,
+    "|": 0x40,
+    "€": 0x65,
+}
+GSM7_INDEX = {c: i for i, c in enumerate(GSM7_BASIC) if c != "\x1b"}
+ESCAPE = 0x1B
+
+# Payload sizes per part
+GSM7_SINGLE = 160
+GSM7_MULTI = 153
+UCS2_SINGLE = 70
+UCS2_MULTI = 67
+
+
+def gsm7_septets(char):
+    """Septets for one character, or None if it is not in the GSM alphabet."""
+    if char in GSM7_INDEX:
+        return [GSM7_INDEX[char]]
+    if char in GSM7_EXTENDED:
+        return [ESCAPE, GSM7_EXTENDED[char]]
+    return None
+
+
+def is_gsm7(text) -> bool:
+    return all(gsm7_septets(c) is not None for c in text)
+
+
+def pack_septets(septets, fill_bits=0) -> bytes:
+    """Pack 7-bit values into octets, LSB first, after fill_bits zero bits."""
+    value = 0
+    bits = fill_bits
+    out = bytearray()
+    for septet in septets:
+        value |= (septet & 0x7F) << bits
+        bits += 7
+        while bits >= 8:
+            out.append(value & 0xFF)
+            value >>= 8
+            bits -= 8
+    if bits:
+        out.append(value & 0xFF)
+    return bytes(out)
+
+
+def unpack_septets(data, count, fill_bits=0):
+    value = int.from_bytes(data, "little") >> fill_bits
+    return [(value >> (7 * i)) & 0x7F for i in range(count)]
+
+
+def decode_gsm7(septets) -> str:
+    chars = []
+    escaped = False
+    reverse_ext = {v: k for k, v in GSM7_EXTENDED.items()}
+    for septet in septets:
+        if escaped:
+            chars.append(reverse_ext.get(septet, " "))
+            escaped = False
+        elif septet == ESCAPE:
+            escaped = True
+        else:
+            chars.append(GSM7_BASIC[septet])
+    return "".join(chars)
+
+
+def encode_address(number) -> bytes:
+    """Destination address field: digit count, type of address, BCD digits."""
+    international = number.startswith("+")
+    digits = "".join(c for c in number if c.isdigit())
+    padded = digits + ("F" if len(digits) % 2 else "")
+    bcd = bytes(int(padded[i + 1] + padded[i], 16) for i in range(0, len(padded), 2))
+    return bytes([len(digits), 0x91 if international else 0x81]) + bcd
+
+
+def decode_address(data, offset):
+    """Parse an address field at offset; returns (number, next offset)."""
+    digits, toa = data[offset], data[offset + 1]
+    octets = (digits + 1) // 2
+    raw = data[offset + 2 : offset + 2 + octets]
+    if toa & 0x70 == 0x50:  # alphanumeric sender
+        number = decode_gsm7(unpack_septets(raw, digits * 4 // 7))
+    else:
+        swapped = "".join(f"{b & 0x0F:X}{b >> 4:X}" for b in raw)
+        number = swapped[:digits]
+        if toa & 0x70 == 0x10:
+            number = "+" + number
+    return number, offset + 2 + octets
+
+
+def decode_timestamp(raw):
+    """Service centre timestamp (7 swapped semi-octets) to an aware datetime."""
+    values = [(b & 0x0F) * 10 + (b >> 4) for b in raw[:6]]
+    tz = raw[6]
+    quarters = (tz & 0x07) * 10 + (tz >> 4)
+    offset = timedelta(minutes=15 * quarters) * (-1 if tz & 0x08 else 1)
+    try:
+        return datetime(2000 + values[0], *values[1:6], tzinfo=timezone(offset))
+    except ValueError:
+        return None
+
+
+class SMSMessage:
+    """A received message; indexes are its storage slots (one per part)."""
+
+    def __init__(self, sender, text, timestamp=None, indexes=(), reference=None, parts=1):
+        self.sender = sender
+        self.text = text
+        self.timestamp = timestamp
+        self.indexes = list(indexes)
+        self.reference = reference
+        self.parts = parts
+
+    def __repr__(self):
+        return f"SMSMessage(from={self.sender}, at={self.timestamp}, parts={self.parts}, text={self.text!r})"
+
+
+def decode_deliver(pdu_hex):
+    """Decode an SMS-DELIVER PDU (with leading SMSC field) as listed by
+    AT+CMGL in PDU mode. Returns (SMSMessage, (reference, total, sequence))."""
+    data = bytes.fromhex(pdu_hex)
+    offset = 1 + data[0]  # skip SMSC
+    first_octet = data[offset]
+    if first_octet & 0x03 != 0x00:
+        raise ValueError(f"not an SMS-DELIVER PDU (MTI {first_octet & 0x03})")
+    sender, offset = decode_address(data, offset + 1)
+    dcs = data[offset + 1]
+    timestamp = decode_timestamp(data[offset + 2 : offset + 9])
+    udl = data[offset + 9]
+    ud = data[offset + 10 :]
+
+    concat = (None, 1, 1)
+    header_octets = 0
+    if first_octet & 0x40:
+        udhl = ud[0]
+        header_octets = udhl + 1
+        i = 1
+        while i < header_octets:
+            iei, length = ud[i], ud[i + 1]
+            value = ud[i + 2 : i + 2 + length]
+            if iei == 0x00 and length == 3:
+                concat = (value[0], value[1], value[2])
+            elif iei == 0x08 and length == 4:
+                concat = ((value[0] << 8) | value[1], value[2], value[3])
+            i += 2 + length
+
+    alphabet = dcs & 0x0C
+    if alphabet == 0x08:
+        text = ud[header_octets:udl].decode("utf-16-be", errors="replace")
+    elif alphabet == 0x04:
+        text = ud[header_octets:udl].decode("latin-1")
+    else:
+        header_septets = (header_octets * 8 + 6) // 7
+        text = decode_gsm7(unpack_septets(ud, udl)[header_septets:])
+    return SMSMessage(sender, text, timestamp, reference=concat[0], parts=concat[1]), concat
+
+
+def split_message(text):
+    """Split text into (encoding, parts). Escape sequences and UTF-16
+    surrogate pairs are never split across parts."""
+    if is_gsm7(text):
+        units = [gsm7_septets(c) for c in text]
+        single, multi, encoding = GSM7_SINGLE, GSM7_MULTI, "gsm7"
+    else:
+        units = []
+        for c in text:
+            encoded = c.encode("utf-16-be")
+            units.append([encoded[i : i + 2] for i in range(0, len(encoded), 2)])
+        single, multi, encoding = UCS2_SINGLE, UCS2_MULTI, "ucs2"
+
+    if sum(len(u) for u in units) <= single:
+        return encoding, [units]
+    parts, current, size = [], [], 0
+    for unit in units:
+        if size + len(unit) > multi:
+            parts.append(current)
+            current, size = [], 0
+        current.append(unit)
+        size += len(unit)
+    if current:
+        parts.append(current)
+    return encoding, parts
+
+
+def encode_submit(number, encoding, units, reference=None, total=1, sequence=1):
+    """Build an SMS-SUBMIT TPDU. Returns (hex PDU for AT+CMGS, TPDU length)."""
+    udh = b""
+    if total > 1:
+        udh = bytes([0x05, 0x00, 0x03, reference & 0xFF, total, sequence])
+    first_octet = 0x01 | (0x40 if udh else 0x00)  # SMS-SUBMIT, UDHI
+    if encoding == "gsm7":
+        septets = [s for unit in units for s in unit]
+        fill = (7 - (len(udh) * 8) % 7) % 7 if udh else 0
+        body = pack_septets(septets, fill)
+        udl = len(septets) + ((len(udh) * 8 + fill) // 7 if udh else 0)
+        dcs = 0x00
+    else:
+        body = b"".join(b for unit in units for b in unit)
+        udl = len(udh) + len(body)
+        dcs = 0x08
+    tpdu = (
+        bytes([first_octet, 0x00])  # message reference set by the modem
+        + encode_address(number)
+        + bytes([0x00, dcs, udl])  # PID, DCS, UDL
+        + udh
+        + body
+    )
+    # Leading "00": use the SMSC stored on the SIM
+    return "00" + tpdu.hex().upper(), len(tpdu)
+
+
+class SMSResult:
+    def __init__(self, number, part, parts, reference=None, error=None, elapsed=0.0):
+        self.number = number
+        self.part = part
+        self.parts = parts
+        self.reference = reference
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        status = f"ref={self.reference}" if self.ok else f"error={self.error}"
+        return f"SMSResult({self.number}, part {self.part}/{self.parts}, {status})"
+
+
+class SMSSender:
+    """PDU-mode SMS sender.
+
+    The SMS session (PDU mode) is configured once and cached until
+    invalidate() is called, e.g. after the modem restarts. Long texts are
+    sent as concatenated messages, non-GSM texts as UCS2. submit() queues a
+    message for a background worker; send() and send_many() block.
+    """
+
+    def __init__(self, at, timeout=SMS_TIMEOUT):
+        self.at = at
+        self.timeout = timeout
+        self._configured = False
+        self._reference = random.randrange(256)
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._configured = False
+
+    def setup(self) -> bool:
+        if self._configured:
+            return True
+        response = self.at.command("AT+CMGF=0")  # PDU mode
+        self._configured = response.ok
+        if not response.ok:
+            logger.error(f"Could not switch SMS to PDU mode: {response.final or response.status}")
+        return self._configured
+
+    def _next_reference(self):
+        self._reference = (self._reference + 1) % 256
+        return self._reference
+
+    def send(self, number, text):
+        """Send one (possibly multipart) message; one SMSResult per part."""
+        with self._lock:
+            encoding, parts = split_message(text)
+            if not self.setup():
+                return [SMSResult(number, i + 1, len(parts), error="setup failed") for i in range(len(parts))]
+            reference = self._next_reference()
+            results = []
+            for sequence, units in enumerate(parts, start=1):
+                pdu, length = encode_submit(number, encoding, units, reference, len(parts), sequence)
+                response = self.at.command(f"AT+CMGS={length}", timeout=self.timeout, data=pdu)
+                mr = response.value("+CMGS:")
+                if response.ok and mr is not None:
+                    result = SMSResult(number, sequence, len(parts), int(mr), elapsed=response.elapsed)
+                else:
+                    error = response.final or response.status
+                    if response.status == "TIMEOUT" or "+CMS ERROR: 302" in error:
+                        self._configured = False  # session state no longer trusted
+                    result = SMSResult(number, sequence, len(parts), error=error, elapsed=response.elapsed)
+                results.append(result)
+                logger.info(f"SMS to {number}: {result}")
+                if not result.ok:
+                    break  # the remaining parts would be useless on their own
+            return results
+
+    def send_many(self, messages):
+        """Send [(number, text), ...]; returns a list of per-message results."""
+        return [self.send(number, text) for number, text in messages]
+
+    def submit(self, number, text) -> Future:
+        """Queue a message for background sending; the Future resolves to
+        the list of SMSResult for its parts."""
+        future = Future()
+        self._queue.put((number, text, future))
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="SMSSender", daemon=True)
+            self._worker.start()
+        return future
+
+    def _run(self):
+        while True:
+            number, text, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.send(number, text))
+            except Exception as e:
+                future.set_exception(e)
+
+
+class SMSInbox:
+    """Streaming inbox driven by +CMTI notifications.
+
+    Each drain lists the whole storage with a single AT+CMGL, reassembles
+    concatenated messages and deletes everything it consumed, and any
+    message it cannot decode, in one batch.
+    Parts of incomplete messages stay in storage until the rest arrives or
+    fragment_timeout passes, after which they are delivered as they are.
+    """
+
+    def __init__(self, at, reader=None, poll_interval=30, fragment_timeout=3600):
+        self.at = at
+        self.reader = reader
+        self.poll_interval = poll_interval
+        self.fragment_timeout = fragment_timeout
+        self._fragments = {}  # (sender, reference, total) -> {sequence: (index, msg)}
+        self._first_seen = {}
+        self._arrived = threading.Event()
+        self._lock = threading.Lock()
+        if reader is not None:
+            reader.subscribe("+CMTI:", self._on_cmti)
+
+    def _on_cmti(self, line):
+        logger.info(f"New SMS: {line}")
+        self._arrived.set()
+
+    def _list(self):
+        """(entries, indexes of undecodable messages) of the received
+        messages in storage."""
+        self.at.sms.setup()
+        response = self.at.command("AT+CMGL=4", timeout=30)  # all messages, PDU mode
+        if not response.ok:
+            logger.error(f"Listing SMS storage failed: {response.final or response.status}")
+            return [], []
+        entries = []
+        broken = []
+        lines = iter(response.lines)
+        for line in lines:
+            if not line.startswith("+CMGL:"):
+                continue
+            fields = line[6:].split(",")
+            index = int(fields[0])
+            pdu = next(lines, "")
+            if int(fields[1]) not in RECEIVED:
+                continue  # stored outgoing message (SMS-SUBMIT)
+            try:
+                entries.append((index,) + decode_deliver(pdu))
+            except (ValueError, IndexError) as e:
+                # Logged with the PDU and deleted, or it would fill the
+                # storage and be listed again on every drain
+                logger.warning(f"Could not decode SMS at index {index}, deleting it: {e} (PDU {pdu})")
+                broken.append(index)
+        return entries, broken
+
+    def _delete(self, indexes):
+        responses = self.at.batch([f"AT+CMGD={index}" for index in indexes], timeout=30)
+        for index, response in zip(indexes, responses):
+            if not response.ok:
+                logger.warning(f"Deleting SMS {index} failed: {response.final or response.status}")
+
+    def _assemble(self, key, force=False):
+        reference, total = key[1], key[2]
+        parts = self._fragments[key]
+        if len(parts) < total and not force:
+            return None
+        ordered = [parts[seq] for seq in sorted(parts)]
+        first = ordered[0][1]
+        text = "".join(msg.text for _, msg in ordered)
+        del self._fragments[key]
+        self._first_seen.pop(key, None)
+        return SMSMessage(
+            first.sender,
+            text,
+            first.timestamp,
+            [index for index, _ in ordered],
+            reference=reference,
+            parts=total,
+        )
+
+    def drain(self):
+        """Read, reassemble and delete everything in storage. Returns the
+        complete messages, oldest first."""
+        with self._lock:
+            self._arrived.clear()
+            now = time.monotonic()
+            complete = []
+            entries, broken = self._list()
+            for index, message, (reference, total, sequence) in entries:
+                if total <= 1:
+                    message.indexes = [index]
+                    complete.append(message)
+                    continue
+                key = (message.sender, reference, total)
+                self._fragments.setdefault(key, {})[sequence] = (index, message)
+                self._first_seen.setdefault(key, now)
+            for key in list(self._fragments):
+                expired = now - self._first_seen[key] > self.fragment_timeout
+                message = self._assemble(key, force=expired)
+                if message:
+                    complete.append(message)
+            consumed = broken + [i for m in complete for i in m.indexes]
+            if consumed:
+                self._delete(sorted(consumed))
+            complete.sort(key=lambda m: m.timestamp or datetime.min.replace(tzinfo=timezone.utc))
+            return complete
+
+    def messages(self, timeout=None):
+        """Generator of incoming messages. Blocks on +CMTI (or polls every
+        poll_interval without a reader); stops after timeout seconds
+        without new messages when timeout is given."""
+        while True:
+            yield from self.drain()
+            wait = self.poll_interval if timeout is None else min(self.poll_interval, timeout)
+            if not self._arrived.wait(wait) and timeout is not None:
+                return
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        while True:
+            for message in await asyncio.to_thread(self.drain):
+                yield message
+            await asyncio.to_thread(self._arrived.wait, self.poll_interval)
@@ -0,0 +1,325 @@
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = 12  # connectID 0..11
+MAX_CHUNK = 1460  # largest AT+QISEND payload
+READ_CHUNK = 1500
+DEFAULT_LINGER = 0.005  # seconds to wait for more small writes before sending
+
+
+def activate_context(at, context_id=1, timeout=150) -> bool:
+    """Make sure PDP context context_id is active for the modem's own IP
+    stack (sockets, FTP, HTTP)."""
+    active = at.command("AT+QIACT?")
+    if str(context_id) in [v.split(",")[0] for v in active.values("+QIACT:")]:
+        return True
+    if at.command(f"AT+QIACT={context_id}", timeout=timeout).ok:
+        return True
+    logger.error(f"Could not activate PDP context {context_id}.")
+    return False
+
+
+class SocketError(OSError):
+    def __init__(self, message, code=None):
+        self.code = code
+        super().__init__(message if code is None else f"{message} (error {code})")
+
+
+class ModemSocket:
+    """One AT+QIOPEN connection with a socket-like interface.
+
+    send() only appends to a buffer; the stack's worker coalesces buffered
+    writes into AT+QISEND chunks of up to MAX_CHUNK bytes. Writers block
+    once more than high_water bytes are queued. recv() returns data that
+    the worker fetched with AT+QIRD after a +QIURC "recv" notification.
+    """
+
+    def __init__(self, stack, connect_id, kind, remote, high_water=65536):
+        self.stack = stack
+        self.connect_id = connect_id
+        self.kind = kind
+        self.remote = remote
+        self.high_water = high_water
+        self.timeout = None
+        self._tx = bytearray()
+        self._rx = bytearray()
+        self._cond = threading.Condition()
+        self._readable = False  # +QIURC "recv" seen, data waiting in the modem
+        self._remote_closed = False
+        self._closed = False
+        self.error = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def __repr__(self):
+        return f"ModemSocket({self.kind} {self.remote[0]}:{self.remote[1]}, id={self.connect_id})"
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+        if self._closed:
+            raise SocketError("Socket is closed")
+
+    def send(self, data) -> int:
+        with self._cond:
+            self._check()
+            deadline = None if self.timeout is None else time.monotonic() + self.timeout
+            while len(self._tx) >= self.high_water:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Send buffer full")
+                self._cond.wait(remaining)
+                self._check()
+            self._tx += data
+        self.stack._wake()
+        return len(data)
+
+    sendall = send
+
+    def flush(self, timeout=None):
+        """Block until everything passed to send() has been accepted by the modem."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: not self._tx or self.error or self._closed, timeout):
+                raise TimeoutError("Flush timed out")
+            if self.error is not None:
+                raise self.error
+
+    def recv(self, bufsize=4096) -> bytes:
+        """Up to bufsize bytes; b"" once the peer has closed and all data is read."""
+        with self._cond:
+            ready = self._cond.wait_for(
+                lambda: self._rx or self._remote_closed or self._closed or self.error, self.timeout
+            )
+            if not ready:
+                raise TimeoutError("Receive timed out")
+            if self._rx:
+                data = bytes(self._rx[:bufsize])
+                del self._rx[:bufsize]
+                return data
+            if self.error is not None:
+                raise self.error
+            return b""
+
+    def close(self, timeout=10):
+        """Flush pending writes, then close the connection on the modem."""
+        if self._closed:
+            return
+        try:
+            if self.error is None and not self._remote_closed:
+                self.flush(timeout)
+        except (OSError, TimeoutError) as e:
+            logger.warning(f"{self}: closing with unsent data: {e}")
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.stack._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- called by the stack ------------------------------------------------
+
+    def _take(self, size):
+        with self._cond:
+            return bytes(self._tx[:size])
+
+    def _sent(self, size):
+        with self._cond:
+            del self._tx[:size]
+            self.bytes_sent += size
+            self._cond.notify_all()
+
+    def _received(self, data):
+        with self._cond:
+            self._rx += data
+            self.bytes_received += len(data)
+            self._cond.notify_all()
+
+    def _fail(self, error):
+        with self._cond:
+            if self.error is None:
+                self.error = error
+            self._cond.notify_all()
+
+    def _peer_closed(self):
+        with self._cond:
+            self._remote_closed = True
+            self._readable = True  # the modem may still hold unread data
+            self._cond.notify_all()
+
+
+class SocketStack:
+    """TCP/UDP client sockets on the modem's own IP stack (AT+QIOPEN and
+    friends), independent of wwan0 and DHCP.
+
+    Data is exchanged in hex (AT+QICFG="dataformat",1,1) so payloads never
+    collide with line framing or Ctrl+Z. One worker thread owns all
+    QISEND/QIRD traffic; URC callbacks only flag work for it.
+    """
+
+    def __init__(self, at, reader, context_id=1, linger=DEFAULT_LINGER, max_chunk=MAX_CHUNK):
+        if reader is None:
+            raise ValueError("SocketStack needs an ATReader for +QIURC notifications")
+        self.at = at
+        self.reader = reader
+        self.context_id = context_id
+        self.linger = linger
+        self.max_chunk = max_chunk
+        self.sockets = {}  # connect_id -> ModemSocket
+        self._opened = {}  # connect_id -> queue of +QIOPEN results
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._configured = False
+        self._worker = None
+        reader.subscribe("+QIURC:", self._on_qiurc)
+        reader.subscribe("+QIOPEN:", self._on_qiopen)
+
+    # --- setup --------------------------------------------------------------
+
+    def setup(self, apn=None, timeout=150) -> bool:
+        """Switch to hex data and make sure the PDP context is active."""
+        commands = ['AT+QICFG="dataformat",1,1']
+        if apn:
+            commands.append(f'AT+QICSGP={self.context_id},1,"{apn}","","",0')
+        if not self.at.batch(commands)[0].ok:
+            return False
+        if not activate_context(self.at, self.context_id, timeout):
+            return False
+        self._configured = True
+        return True
+
+    def connect(self, host, port, kind="TCP", timeout=60) -> ModemSocket:
+        if not self._configured and not self.setup():
+            raise SocketError("Socket setup failed")
+        with self._lock:
+            free = [i for i in range(MAX_CONNECTIONS) if i not in self.sockets]
+            if not free:
+                raise SocketError("No free connection IDs")
+            connect_id = free[0]
+            sock = ModemSocket(self, connect_id, kind, (host, port))
+            self.sockets[connect_id] = sock
+            result = self._opened[connect_id] = queue.Queue(1)
+        try:
+            response = self.at.command(
+                f'AT+QIOPEN={self.context_id},{connect_id},"{kind}","{host}",{port},0,0'
+            )
+            if not response.ok:
+                raise SocketError(f"AT+QIOPEN failed: {response.final or response.status}")
+            try:
+                error = result.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No +QIOPEN for {host}:{port} within {timeout}s") from None
+            if error != 0:
+                raise SocketError(f"Connecting to {host}:{port} failed", error)
+        except BaseException:
+            with self._lock:
+                self.sockets.pop(connect_id, None)
+                self._opened.pop(connect_id, None)
+            self.at.command(f"AT+QICLOSE={connect_id}")
+            raise
+        with self._lock:
+            self._opened.pop(connect_id, None)
+        self._start_worker()
+        logger.info(f"Opened {sock}")
+        return sock
+
+    def close(self):
+        for sock in list(self.sockets.values()):
+            sock.close()
+
+    # --- URCs (reader thread: no AT commands here) -----------------------------
+
+    def _on_qiopen(self, line):
+        # +QIOPEN: <connectID>,<err>
+        connect_id, error = (int(v) for v in line.split(":", 1)[1].split(","))
+        result = self._opened.get(connect_id)
+        if result is not None:
+            result.put_nowait(error)
+
+    def _on_qiurc(self, line):
+        # +QIURC: "recv",<id> | "closed",<id> | "pdpdeact",<contextID>
+        fields = [f.strip().strip('"') for f in line.split(":", 1)[1].split(",")]
+        event = fields[0]
+        if event == "pdpdeact":
+            self._configured = False
+            for sock in list(self.sockets.values()):
+                sock._fail(SocketError("PDP context deactivated"))
+        elif len(fields) > 1 and fields[1].isdigit():
+            sock = self.sockets.get(int(fields[1]))
+            if sock is None:
+                return
+            if event == "recv":
+                sock._readable = True
+            elif event == "closed":
+                sock._peer_closed()
+        self._event.set()
+
+    # --- worker -----------------------------------------------------------------
+
+    def _wake(self):
+        self._event.set()
+
+    def _start_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="SocketStack", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            self._event.wait(1.0)
+            self._event.clear()
+            for sock in list(self.sockets.values()):
+                try:
+                    if sock._readable:
+                        self._read(sock)
+                    if sock._tx and sock.error is None:
+                        self._write(sock)
+                except Exception as e:
+                    logger.error(f"{sock}: {e}")
+                    sock._fail(SocketError(str(e)))
+
+    def _read(self, sock):
+        sock._readable = False
+        while True:
+            response = self.at.command(f"AT+QIRD={sock.connect_id},{READ_CHUNK}")
+            if not response.ok:
+                raise SocketError(f"AT+QIRD failed: {response.final or response.status}")
+            length = int((response.value("+QIRD:") or "0").split(",")[0])
+            if length == 0:
+                return
+            data = next((line for line in response.lines if not line.startswith("+QIRD:")), "")
+            sock._received(bytes.fromhex(data))
+            if length < READ_CHUNK:
+                return
+
+    def _write(self, sock):
+        if len(sock._tx) < self.max_chunk and self.linger:
+            time.sleep(self.linger)  # let more small writes accumulate
+        while sock._tx and sock.error is None:
+            chunk = sock._take(self.max_chunk)
+            response = self.at.command(f"AT+QISEND={sock.connect_id}", timeout=30, data=chunk.hex())
+            if response.ok:
+                sock._sent(len(chunk))
+            elif response.final == "SEND FAIL":
+                # The modem's send buffer is full; give it time to drain
+                self._event.set()
+                time.sleep(0.1)
+                return
+            else:
+                raise SocketError(f"AT+QISEND failed: {response.final or response.status}")
+
+    def _release(self, sock):
+        self.at.command(f"AT+QICLOSE={sock.connect_id}", timeout=12)
+        with self._lock:
+            self.sockets.pop(sock.connect_id, None)
+        logger.info(f"Closed {sock}")
@@ -0,0 +1,179 @@
+import threading
+import time
+import logging
+from modem.at import chainable
+
+logger = logging.getLogger(__name__)
+
+REGISTRATION_STATES = {
+    0: "not-registered",
+    1: "registered-home",
+    2: "searching",
+    3: "denied",
+    4: "unknown",
+    5: "registered-roaming",
+}
+
+
+def _parse_imei(response):
+    return next((line for line in response.lines if line.isdigit()), None)
+
+
+def _parse_iccid(response):
+    value = response.value("+QCCID:")
+    return value.rstrip("F") if value else None
+
+
+def _parse_firmware(response):
+    info = {}
+    for line in response.lines:
+        if line.startswith("Revision:"):
+            info["revision"] = line.split(":", 1)[1].strip()
+        elif "manufacturer" not in info:
+            info["manufacturer"] = line
+        elif "model" not in info:
+            info["model"] = line
+    return info or None
+
+
+def _parse_signal(response):
+    value = response.value("+CSQ:")
+    if value is None:
+        return None
+    rssi, ber = (int(v) for v in value.split(","))
+    return {
+        "rssi": rssi,
+        "ber": ber,
+        "dbm": None if rssi == 99 else -113 + 2 * rssi,
+    }
+
+
+def _parse_operator(response):
+    value = response.value("+COPS:")
+    if value is None:
+        return None
+    parts = value.split(",")
+    if len(parts) < 3:
+        return None  # not registered, no operator
+    return parts[2].strip('"')
+
+
+def _parse_registration(response):
+    value = response.value("+CREG:")
+    if value is None:
+        return None
+    stat = int(value.split(",")[1])
+    return REGISTRATION_STATES.get(stat, "unknown")
+
+
+# field -> (TTL in seconds or None for the process lifetime, command, parser)
+FIELDS = {
+    "imei": (None, "AT+GSN", _parse_imei),
+    "iccid": (None, "AT+QCCID", _parse_iccid),
+    "firmware": (None, "ATI", _parse_firmware),
+    "signal": (10, "AT+CSQ", _parse_signal),
+    "operator": (300, "AT+COPS?", _parse_operator),
+    "registration": (300, "AT+CREG?", _parse_registration),
+}
+
+# URC prefix -> fields it invalidates
+INVALIDATED_BY = {
+    "+CREG:": ("registration", "operator"),
+    "+CEREG:": ("registration", "operator"),
+    "+C5GREG:": ("registration", "operator"),
+    "+CPIN:": ("iccid",),
+    "RDY": tuple(FIELDS),
+}
+
+
+class StatusCache:
+    """Cached modem status queries with per-field TTLs.
+
+    Identity fields are fetched once per process; signal, operator and
+    registration expire after their TTL, and registration/operator are
+    dropped as soon as a registration URC arrives. Concurrent callers asking
+    for the same field share one AT round-trip.
+    """
+
+    def __init__(self, at, reader=None, ttls=None):
+        self.at = at
+        self.ttls = {name: ttl for name, (ttl, _, _) in FIELDS.items()}
+        self.ttls.update(ttls or {})
+        self._values = {}  # field -> (value, fetched at)
+        self._locks = {name: threading.Lock() for name in FIELDS}
+        if reader is not None:
+            for prefix in INVALIDATED_BY:
+                reader.subscribe(prefix, self._on_urc)
+
+    def _on_urc(self, line):
+        for prefix, fields in INVALIDATED_BY.items():
+            if line.startswith(prefix):
+                self.invalidate(*fields)
+
+    def invalidate(self, *fields):
+        for field in fields or tuple(FIELDS):
+            self._values.pop(field, None)
+
+    def _fresh(self, field, max_age):
+        cached = self._values.get(field)
+        if cached is None:
+            return False
+        ttl = self.ttls[field] if max_age is None else max_age
+        return ttl is None or time.monotonic() - cached[1] < ttl
+
+    def get(self, field, max_age=None):
+        """Cached value of field, querying the modem if it is missing or
+        older than its TTL (or max_age, if given)."""
+        if self._fresh(field, max_age):
+            return self._values[field][0]
+        with self._locks[field]:
+            if self._fresh(field, max_age):  # fetched while we waited
+                return self._values[field][0]
+            return self._store(field, self.at.command(FIELDS[field][1]))
+
+    def _store(self, field, response):
+        _, cmd, parse = FIELDS[field]
+        if not response.ok:
+            logger.warning(f"{cmd} failed: {response.final or response.status}")
+            return None
+        try:
+            value = parse(response)
+        except (ValueError, IndexError) as e:
+            logger.warning(f"Could not parse {cmd} response {response.lines}: {e}")
+            return None
+        self._values[field] = (value, time.monotonic())
+        return value
+
+    def snapshot(self, max_age=None):
+        """All fields; the stale ones are refreshed together with AT.batch()."""
+        values = {}
+        stale = []
+        for field in FIELDS:
+            cached = self._values.get(field)
+            if cached is not None and self._fresh(field, max_age):
+                values[field] = cached[0]
+            else:
+                stale.append(field)
+        if stale:
+            stale.sort(key=lambda field: not chainable(FIELDS[field][1]))  # chainable ones share a line
+            for field, response in zip(stale, self.at.batch([FIELDS[field][1] for field in stale])):
+                values[field] = self._store(field, response)
+        return {field: values[field] for field in FIELDS}
+
+    def imei(self):
+        return self.get("imei")
+
+    def iccid(self):
+        return self.get("iccid")
+
+    def firmware(self):
+        return self.get("firmware")
+
+    def signal(self):
+        return self.get("signal")
+
+    def operator(self):
+        return self.get("operator")
+
+    def registration(self):
+        return self.get("registration")
@@ -0,0 +1,512 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_BYTES = 1 << 20  # spool segment file size before rotating
+MAX_SPOOL_BYTES = 64 << 20  # oldest segments are dropped beyond this
+SYNC_INTERVAL = 1.0  # seconds between fsyncs of the spool
+BATCH_BYTES = 64 << 10  # uncompressed records per MQTT message
+MAX_DELAY = 300  # seconds a record may wait for a fuller batch
+MAX_INFLIGHT = 4  # unacknowledged QoS 1 messages before sending pauses
+ACK_TIMEOUT = 30
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 300
+
+FRAME = struct.Struct("<II")  # payload length, crc32
+SEGMENT_SUFFIX = ".spool"
+CURSOR_FILE = "cursor"
+
+
+class Spool:
+    """Crash-safe, append-only on-disk record queue.
+
+    Records are framed (length, CRC32) into numbered segment files; a torn
+    write at the end of the last segment is cut off when the spool is
+    reopened. Delivery progress is a (segment, offset) cursor that is only
+    moved by commit(), so records read but never acknowledged are read
+    again after a restart or rewind(). Fully acknowledged segments are
+    deleted; past max_bytes the oldest segments are dropped. Bytes lost to
+    dropped segments or skipped corrupt frames are counted in dropped_bytes.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, max_bytes=MAX_SPOOL_BYTES, sync_interval=SYNC_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self.dropped_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._segments = self._list_segments()
+        self._cursor = self._load_cursor()
+        self._read_pos = self._cursor
+        if not self._segments:
+            self._segments = [self._cursor[0]]
+        self._repair(self._segments[-1])
+        self._file = open(self._path(self._segments[-1]), "ab")
+        self._last_sync = time.monotonic()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:012d}{SEGMENT_SUFFIX}")
+
+    def _list_segments(self):
+        return sorted(int(name[: -len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def _load_cursor(self):
+        first = self._segments[0] if self._segments else 1
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                segment, offset = (int(v) for v in f.read().split())
+        except (OSError, ValueError):
+            return (first, 0)
+        # Segments before the cursor's may have been dropped meanwhile
+        return max((segment, offset), (first, 0))
+
+    def _repair(self, segment):
+        """Truncate a torn or corrupt tail off segment."""
+        path = self._path(segment)
+        if not os.path.exists(path):
+            return
+        good = 0
+        with open(path, "rb") as f:
+            for _, end in self._frames(f, 0):
+                good = end
+            size = f.seek(0, os.SEEK_END)
+        if good < size:
+            logger.warning(f"Spool segment {path}: dropping {size - good} bytes of torn data")
+            os.truncate(path, good)
+
+    @staticmethod
+    def _frames(f, offset):
+        """(payload, end offset) of the intact frames from offset on."""
+        f.seek(offset)
+        while True:
+            header = f.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            length, crc = FRAME.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset += FRAME.size + length
+            yield payload, offset
+
+    # --- writing ------------------------------------------------------------
+
+    def append(self, payload: bytes):
+        with self._lock:
+            self._file.write(FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._file.flush()  # in the page cache: survives a process crash
+            now = time.monotonic()
+            if now - self._last_sync >= self.sync_interval:
+                os.fsync(self._file.fileno())  # on disk: survives power loss
+                self._last_sync = now
+            if self._file.tell() >= self.segment_bytes:
+                self._rotate()
+
+    def _rotate(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._segments.append(self._segments[-1] + 1)
+        self._file = open(self._path(self._segments[-1]), "ab")
+        self._enforce_limit()
+
+    def _enforce_limit(self):
+        sizes = {segment: os.path.getsize(self._path(segment)) for segment in self._segments}
+        total = sum(sizes.values())
+        while total > self.max_bytes and len(self._segments) > 1:
+            oldest = self._segments.pop(0)
+            dropped = sizes[oldest] - (self._cursor[1] if self._cursor[0] == oldest else 0)
+            if self._cursor[0] <= oldest:
+                self.dropped_bytes += max(0, dropped)
+                logger.warning(f"Spool over {self.max_bytes} bytes; dropping undelivered segment {oldest}")
+            os.remove(self._path(oldest))
+            total -= sizes[oldest]
+            self._cursor = max(self._cursor, (self._segments[0], 0))
+            self._read_pos = max(self._read_pos, self._cursor)
+
+    def sync(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    # --- reading ------------------------------------------------------------
+
+    def pending(self) -> int:
+        """Bytes (framing included) not yet read for delivery."""
+        with self._lock:
+            segment, offset = self._read_pos
+            total = self._file.tell()
+            for s in self._segments[:-1]:
+                if s >= segment:
+                    total += os.path.getsize(self._path(s))
+            return total - offset
+
+    def read(self, max_bytes=BATCH_BYTES):
+        """(records, position) of the next unread records up to max_bytes
+        (at least one); pass position to commit() once they are delivered."""
+        with self._lock:
+            self._file.flush()
+            records = []
+            size = 0
+            segment, offset = self._read_pos
+            while size < max_bytes:
+                path = self._path(segment)
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        for payload, end in self._frames(f, offset):
+                            records.append(payload)
+                            size += len(payload)
+                            offset = end
+                            if size >= max_bytes:
+                                break
+                        else:
+                            # Torn tails are cut off on open, so anything left
+                            # unframed is corrupt; skip it, even in the segment
+                            # being written, or reading would stop there for good
+                            end = f.seek(0, os.SEEK_END)
+                            if end > offset:
+                                logger.warning(f"Spool segment {path} is corrupt after offset {offset}; skipping {end - offset} bytes")
+                                self.dropped_bytes += end - offset
+                                offset = end
+                if size >= max_bytes or segment >= self._segments[-1]:
+                    break
+                segment, offset = segment + 1, 0
+            self._read_pos = (segment, offset)
+            return records, self._read_pos
+
+    def rewind(self):
+        """Read again from the last committed position."""
+        with self._lock:
+            self._read_pos = self._cursor
+
+    def commit(self, position):
+        """Mark everything before position as delivered."""
+        with self._lock:
+            if position <= self._cursor:
+                return
+            self._cursor = position
+            tmp = os.path.join(self.directory, CURSOR_FILE + ".tmp")
+            with open(tmp, "w") as f:
+                f.write(f"{position[0]} {position[1]}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, os.path.join(self.directory, CURSOR_FILE))
+            while len(self._segments) > 1 and self._segments[0] < position[0]:
+                os.remove(self._path(self._segments.pop(0)))
+
+
+# --- MQTT 3.1.1 --------------------------------------------------------------
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 0x10, 0x20, 0x30, 0x40
+PINGREQ, PINGRESP, DISCONNECT = 0xC0, 0xD0, 0xE0
+
+
+class MQTTError(OSError):
+    pass
+
+
+def _string(value) -> bytes:
+    data = value.encode() if isinstance(value, str) else value
+    return struct.pack("!H", len(data)) + data
+
+
+def encode_packet(kind, body=b"") -> bytes:
+    """Fixed header (type and remaining length) + body."""
+    length = len(body)
+    header = bytearray([kind])
+    while True:
+        byte, length = length % 128, length // 128
+        header.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(header) + body
+
+
+def read_packet(recv_exact):
+    """(type byte, body) of the next packet; recv_exact(n) returns n bytes."""
+    kind = recv_exact(1)[0]
+    length, shift = 0, 0
+    while True:
+        byte = recv_exact(1)[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+        if shift > 21:
+            raise MQTTError("Malformed remaining length")
+    return kind, recv_exact(length) if length else b""
+
+
+class MQTTClient:
+    """Minimal MQTT 3.1.1 publisher (QoS 0 and 1, no subscriptions).
+
+    connect_socket() returns a connected socket-like object (sendall, recv,
+    settimeout, close): a plain TCP socket over wwan0 or a ModemSocket on
+    the modem's own stack.
+    """
+
+    def __init__(self, connect_socket, client_id, username=None, password=None, keepalive=60):
+        self.connect_socket = connect_socket
+        self.client_id = client_id
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.sock = None
+        self._packet_id = 0
+
+    def connect(self, timeout=30):
+        flags = 0x02  # clean session: the spool, not the broker, keeps state
+        payload = _string(self.client_id)
+        if self.username is not None:
+            flags |= 0x80
+            payload += _string(self.username)
+            if self.password is not None:
+                flags |= 0x40
+                payload += _string(self.password)
+        body = _string("MQTT") + struct.pack("!BBH", 4, flags, self.keepalive) + payload
+        self.sock = self.connect_socket()
+        self.sock.settimeout(timeout)
+        self.sock.sendall(encode_packet(CONNECT, body))
+        kind, body = self.read(timeout)
+        if kind & 0xF0 != CONNACK or len(body) < 2 or body[1] != 0:
+            self.close()
+            raise MQTTError(f"Connection refused (CONNACK {body.hex()})")
+
+    def publish(self, topic, payload, qos=1) -> int:
+        """Send a message; returns its packet id (0 for QoS 0)."""
+        body = _string(topic)
+        packet_id = 0
+        if qos:
+            self._packet_id = self._packet_id % 0xFFFF + 1
+            packet_id = self._packet_id
+            body += struct.pack("!H", packet_id)
+        self.sock.sendall(encode_packet(PUBLISH | qos << 1, body + payload))
+        return packet_id
+
+    def ping(self):
+        self.sock.sendall(encode_packet(PINGREQ))
+
+    def _recv_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise MQTTError("Connection closed by broker")
+            data += chunk
+        return data
+
+    def read(self, timeout):
+        """Next packet as (type byte, body); TimeoutError if none arrives."""
+        self.sock.settimeout(timeout)
+        return read_packet(self._recv_exact)
+
+    def acks(self, timeout) -> list:
+        """Packet ids acknowledged by the next packet(s) within timeout."""
+        kind, body = self.read(timeout)
+        if kind & 0xF0 == PUBACK:
+            return [struct.unpack("!H", body[:2])[0]]
+        return []
+
+    def close(self):
+        if self.sock is None:
+            return
+        try:
+            self.sock.sendall(encode_packet(DISCONNECT))
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        self.sock = None
+
+
+# --- pipeline ----------------------------------------------------------------
+
+
+def fix_record(fix) -> dict:
+    return {
+        "lat": fix.latitude,
+        "lon": fix.longitude,
+        "alt": fix.altitude,
+        "speed": fix.speed,
+        "quality": fix.quality,
+        "fix_time": fix.timestamp,
+    }
+
+
+class Telemetry(threading.Thread):
+    """Store-and-forward telemetry uplink.
+
+    record() appends to the Spool and never waits for the network. While
+    online, the worker sends what has accumulated as zlib-compressed,
+    newline-delimited JSON in MQTT QoS 1 messages: once BATCH_BYTES are
+    waiting or the oldest record is max_delay old, so the radio wakes up
+    for a burst instead of for every record. At most max_inflight messages
+    are unacknowledged at a time; the spool cursor advances only past
+    acknowledged batches, so an outage or crash means resending, never
+    losing. The connection is closed after each burst to let the radio
+    idle. The first line of each message is a header with the batch's
+    spool position, for deduplication by the receiver.
+
+    Sources added with add_source() are polled every interval seconds
+    (GPS fixes, radio statistics, ...).
+    """
+
+    def __init__(
+        self,
+        spool,
+        connect_socket,
+        topic,
+        client_id,
+        batch_bytes=BATCH_BYTES,
+        max_delay=MAX_DELAY,
+        max_inflight=MAX_INFLIGHT,
+        ack_timeout=ACK_TIMEOUT,
+        **mqtt,
+    ):
+        super().__init__(name="Telemetry", daemon=True)
+        self.spool = spool if isinstance(spool, Spool) else Spool(spool)
+        self.client = MQTTClient(connect_socket, client_id, **mqtt)
+        self.topic = topic
+        self.batch_bytes = batch_bytes
+        self.max_delay = max_delay
+        self.max_inflight = max_inflight
+        self.ack_timeout = ack_timeout
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self._sources = []  # [kind, fn, interval, next due]
+        self._retry_at = 0
+        self._online = threading.Event()
+        self._online.set()
+        self._flush = threading.Event()
+        self._wake = threading.Event()
+        self._running = threading.Event()
+        # Data left in the spool from before a restart goes out first thing
+        self._oldest = time.monotonic() - max_delay if self.spool.pending() else None
+
+    def record(self, kind, data, timestamp=None):
+        """Spool one record, e.g. record("sensor", {"temp": 21.5})."""
+        entry = {"t": round(time.time() if timestamp is None else timestamp, 3), "k": kind, "d": data}
+        self.spool.append(json.dumps(entry, separators=(",", ":")).encode())
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+    def add_source(self, kind, fn, interval):
+        """Record fn() as kind every interval seconds (skipped if None)."""
+        self._sources.append([kind, fn, interval, time.monotonic() + interval])
+
+    def set_online(self, online: bool):
+        """Called on link changes (Modem.monitor_connection)."""
+        if online and not self._online.is_set():
+            logger.info("Telemetry: link up, draining spool.")
+            self._online.set()
+            self._retry_at = 0
+            self._flush.set()
+            self._wake.set()
+        elif not online and self._online.is_set():
+            logger.info("Telemetry: link down, spooling.")
+            self._online.clear()
+
+    def flush(self):
+        """Send everything spooled now instead of waiting for a full batch."""
+        self._flush.set()
+        self._wake.set()
+
+    def _poll_sources(self, now):
+        for source in self._sources:
+            kind, fn, interval, due = source
+            if now < due:
+                continue
+            source[3] = now + interval
+            try:
+                data = fn()
+            except Exception as e:
+                logger.warning(f"Telemetry source {kind} failed: {e}")
+                continue
+            if data is not None:
+                self.record(kind, data)
+
+    def _due(self, now) -> bool:
+        if self._oldest is None or not self._online.is_set():
+            return False
+        return self._flush.is_set() or now - self._oldest >= self.max_delay or self.spool.pending() >= self.batch_bytes
+
+    def _payload(self, records, position) -> bytes:
+        header = json.dumps({"client": self.client.client_id, "position": list(position), "records": len(records)})
+        return zlib.compress(b"\n".join([header.encode()] + records), 9)
+
+    def drain(self):
+        """Send every spooled record, keeping max_inflight messages in
+        flight; returns once all are acknowledged. Raises on failure, after
+        rewinding the spool to the last acknowledged batch."""
+        self.client.connect(self.ack_timeout)
+        inflight = []  # (packet id, spool position after the batch), in send order
+        acked = set()
+        try:
+            while True:
+                while len(inflight) < self.max_inflight:
+                    records, position = self.spool.read(self.batch_bytes)
+                    if not records:
+                        break
+                    payload = self._payload(records, position)
+                    inflight.append((self.client.publish(self.topic, payload), position))
+                    self.sent_messages += 1
+                    self.sent_bytes += len(payload)
+                if not inflight:
+                    break
+                try:
+                    acked.update(self.client.acks(self.ack_timeout))
+                except TimeoutError:
+                    raise MQTTError(f"No PUBACK within {self.ack_timeout}s")
+                # Commit the acknowledged batches up to the first one that is not
+                while inflight and inflight[0][0] in acked:
+                    packet_id, position = inflight.pop(0)
+                    acked.discard(packet_id)
+                    self.spool.commit(position)
+        except BaseException:
+            self.spool.rewind()
+            raise
+        finally:
+            self.client.close()
+
+    def run(self):
+        self._running.set()
+        delay = RETRY_DELAY
+        while self._running.is_set():
+            now = time.monotonic()
+            self._poll_sources(now)
+            if self._due(now) and now >= self._retry_at:
+                self._flush.clear()
+                try:
+                    self.drain()
+                    self._oldest = None if not self.spool.pending() else now
+                    delay = RETRY_DELAY
+                except (OSError, MQTTError) as e:
+                    logger.warning(f"Telemetry upload failed, retrying in {delay}s: {e}")
+                    self._retry_at = time.monotonic() + delay
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+            due = min((source[3] for source in self._sources), default=now + 1.0)
+            self._wake.wait(min(1.0, max(0.0, due - time.monotonic())))
+            self._wake.clear()
+        self.spool.close()
+
+    def stop(self, timeout=5):
+        self._running.clear()
+        self._wake.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
@@ -0,0 +1,18 @@
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+# The checkout is the "modem" package but has no __init__.py, and on
+# sys.path its modem.py and serial.py would shadow the package and
+# pyserial. Take it off sys.path and register the directory as the
+# package, so "from modem.x import y" works when pytest runs from the
+# checkout.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != ROOT]
+
+if not hasattr(sys.modules.get("modem"), "__path__"):
+    spec = importlib.machinery.ModuleSpec("modem", None, is_package=True)
+    package = importlib.util.module_from_spec(spec)
+    package.__path__ = [ROOT]
+    sys.modules["modem"] = package
@@ -0,0 +1,43 @@
+import asyncio
+import os
+
+import pytest
+
+from modem.aio import AsyncAT, AsyncSerial
+
+
+def test_commands_fail_when_the_port_goes_away():
+    async def main():
+        master, slave = os.openpty()
+        at = AsyncAT(AsyncSerial(os.ttyname(slave)))
+        os.close(slave)
+        await at.start()
+        first = asyncio.ensure_future(at.command("AT+CSQ", timeout=5))
+        queued = asyncio.ensure_future(at.command("AT+CREG?", timeout=5))
+        await asyncio.sleep(0.05)
+        assert os.read(master, 100) == b"AT+CSQ\r"
+        os.close(master)  # the reader sees EIO, as after a modem reset
+        for future in (first, queued):
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(future, 1)
+        with pytest.raises(ConnectionError):
+            await at.command("AT")
+        await at.close()
+
+    asyncio.run(main())
+
+
+def test_close_fails_pending_commands():
+    async def main():
+        master, slave = os.openpty()
+        at = AsyncAT(AsyncSerial(os.ttyname(slave)))
+        os.close(slave)
+        await at.start()
+        pending = asyncio.ensure_future(at.command("AT+CSQ", timeout=5))
+        await asyncio.sleep(0.05)
+        await at.close()
+        with pytest.raises(ConnectionError):
+            await pending
+        os.close(master)
+
+    asyncio.run(main())
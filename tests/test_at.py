@@ -0,0 +1,88 @@
+import pytest
+import serial
+
+from modem.at import (
+    AT,
+    MAX_LINE,
+    ATResponse,
+    chain_commands,
+    chained_line,
+    split_chained,
+    split_failed,
+)
+from modem.simulator import SimulatedModem
+
+
+def test_chain_commands_groups_in_order():
+    commands = ["AT+CSQ", "AT+CREG?", "AT+CPIN=1234", "AT+QCCID", "ATI", "AT+COPS?"]
+    assert chain_commands(commands) == [["AT+CSQ", "AT+CREG?"], ["AT+CPIN=1234"], ["AT+QCCID"], ["ATI"], ["AT+COPS?"]]
+    assert chained_line(["AT+CSQ", "AT+CREG?"]) == "AT+CSQ;+CREG?"
+
+
+def test_chain_commands_respects_max_line():
+    commands = [f'AT+QNWPREFCFG="k{i:02d}",{"x" * 40}' for i in range(40)]
+    groups = chain_commands(commands)
+    assert [cmd for group in groups for cmd in group] == commands
+    assert len(groups) > 1
+    assert all(len(chained_line(group)) <= MAX_LINE for group in groups)
+    assert all(len(chained_line(group + [commands[0]])) > MAX_LINE for group in groups[:-1])
+    assert chain_commands(["AT+CSQ", "AT+CREG?"], max_line=10) == [["AT+CSQ"], ["AT+CREG?"]]
+
+
+def test_split_chained_by_prefix_and_key():
+    commands = ["AT+CSQ", 'AT+QNWPREFCFG="mode_pref"', 'AT+QNWPREFCFG="lte_band"', "AT+CREG?"]
+    response = ATResponse(
+        chained_line(commands),
+        "OK",
+        ["+CSQ: 20,99", '+QNWPREFCFG: "mode_pref",AUTO', '+QNWPREFCFG: "lte_band",1:3:7', "+CREG: 0,1"],
+        0.01,
+        "OK",
+    )
+    parts = split_chained(commands, response)
+    assert [part.command for part in parts] == commands
+    assert [part.lines for part in parts] == [[line] for line in response.lines]
+    assert all(part.ok for part in parts)
+    assert parts[2].value('+QNWPREFCFG: "lte_band",') == "1:3:7"
+
+
+def test_split_failed_resumes_after_failed_query():
+    commands = ["AT+CSQ", "AT+COPS?", "AT+CREG?"]
+    response = ATResponse(chained_line(commands), "ERROR", ["+CSQ: 20,99"], 0.01, "+CME ERROR: 30")
+    done, resume = split_failed(commands, response)
+    assert [(part.command, part.status) for part in done] == [("AT+CSQ", "OK"), ("AT+COPS?", "ERROR")]
+    assert done[1].final == "+CME ERROR: 30"
+    assert resume == 2
+
+
+def test_split_failed_resends_unconfirmed_setters():
+    commands = ["AT+CSQ", "AT+QCFG=1", "AT+CREG?"]
+    response = ATResponse(chained_line(commands), "ERROR", ["+CSQ: 20,99"], 0.01, "ERROR")
+    done, resume = split_failed(commands, response)
+    assert [part.command for part in done] == ["AT+CSQ"]
+    assert resume == 1
+
+
+@pytest.fixture(scope="module")
+def sim():
+    with SimulatedModem(scale=0.01, seed=1) as sim:
+        yield sim
+
+
+def test_batch_against_simulator(sim, monkeypatch):
+    lines = []
+    handle_at = sim.handle_at
+
+    def traced(line):
+        lines.append(line)
+        return handle_at(line)
+
+    monkeypatch.setattr(sim, "handle_at", traced)
+    with serial.Serial(sim.at_port, timeout=0) as connection:
+        responses = AT(connection).batch(["AT+CSQ", "AT+QCCID", "ATI", "AT+CREG?", "AT+CMGF?"])
+    assert lines == ["AT+CSQ;+QCCID", "ATI", "AT+CREG?;+CMGF?"]
+    assert all(response.ok for response in responses)
+    assert [response.command for response in responses] == ["AT+CSQ", "AT+QCCID", "ATI", "AT+CREG?", "AT+CMGF?"]
+    assert responses[1].value("+QCCID:") == sim.iccid
+    assert "RM520N-GL" in responses[2].lines
+    assert responses[3].value("+CREG:") is not None
+    assert responses[4].lines == [f"+CMGF: {sim.sms_format}"]
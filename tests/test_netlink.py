@@ -0,0 +1,118 @@
+import errno
+import socket
+import struct
+
+import pytest
+
+from modem.netlink import (
+    IFA_ADDRESS,
+    IFA_LOCAL,
+    IFADDRMSG,
+    NLMSG_DONE,
+    NLMSG_ERROR,
+    NLMSG_HEADER,
+    RTA_OIF,
+    RTM_GETADDR,
+    RTM_NEWADDR,
+    RTM_NEWLINK,
+    RTM_NEWROUTE,
+    Netlink,
+    NetlinkError,
+    _attr,
+    _attrs,
+)
+
+
+class FakeSocket:
+    """Records requests and acknowledges them, optionally after replies."""
+
+    def __init__(self, replies=(), error=0):
+        self.sent = []
+        self.replies = list(replies)
+        self.error = error
+
+    def send(self, data):
+        self.sent.append(data)
+        return len(data)
+
+    def recv(self, size):
+        seq = NLMSG_HEADER.unpack_from(self.sent[-1])[3]
+        data = b"".join(
+            NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), kind, 0, seq, 0) + payload
+            for kind, payload in self.replies
+        )
+        if self.replies:
+            return data + NLMSG_HEADER.pack(NLMSG_HEADER.size + 4, NLMSG_DONE, 0, seq, 0) + b"\0" * 4
+        payload = struct.pack("=i", -self.error) + self.sent[-1][: NLMSG_HEADER.size]
+        return NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), NLMSG_ERROR, 0, seq, 0) + payload
+
+    def close(self):
+        pass
+
+
+def netlink(sock):
+    nl = Netlink()
+    nl.sock.close()
+    nl.sock = sock
+    return nl
+
+
+def test_attr_is_padded():
+    assert _attr(IFA_LOCAL, b"\x0a\x00\x00\x01") == bytes.fromhex("0800 0200 0a000001")
+    assert _attr(RTA_OIF, b"\x07") == bytes.fromhex("0500 0400 07000000")
+    assert _attr(1, b"") == bytes.fromhex("0400 0100")
+
+
+def test_attrs_round_trip():
+    data = b"\xff" * 3 + _attr(1, b"ab") + _attr(2, b"") + _attr(3, b"12345678")
+    assert _attrs(data, 3) == {1: b"ab", 2: b"", 3: b"12345678"}
+    # a truncated or zero-length attribute ends the walk
+    assert _attrs(data + b"\0\0\0\0", 3) == {1: b"ab", 2: b"", 3: b"12345678"}
+
+
+def test_set_link_message():
+    sock = FakeSocket()
+    netlink(sock).set_link(7, mtu=1500)
+    (sent,) = sock.sent
+    assert sent == bytes.fromhex(
+        "28000000 1000 0500 01000000 00000000"  # len 40, RTM_NEWLINK, REQUEST|ACK, seq 1
+        "00 00 0000 07000000 01000000 01000000"  # AF_UNSPEC, index 7, IFF_UP / IFF_UP
+        "0800 0400 dc050000"  # IFLA_MTU 1500
+    )
+    assert NLMSG_HEADER.unpack_from(sent)[1] == RTM_NEWLINK
+
+
+def test_add_address_message():
+    sock = FakeSocket()
+    netlink(sock).add_address(3, "10.0.0.1", 30)
+    (sent,) = sock.sent
+    length, kind, flags, seq, _ = NLMSG_HEADER.unpack_from(sent)
+    assert (length, kind, seq) == (len(sent), RTM_NEWADDR, 1)
+    assert flags == 0x505  # REQUEST | ACK | REPLACE | CREATE
+    body = sent[NLMSG_HEADER.size :]
+    assert IFADDRMSG.unpack_from(body) == (socket.AF_INET, 30, 0, 0, 3)
+    assert _attrs(body, IFADDRMSG.size) == {IFA_LOCAL: b"\x0a\0\0\x01", IFA_ADDRESS: b"\x0a\0\0\x01"}
+
+
+def test_add_route_message():
+    sock = FakeSocket()
+    netlink(sock).add_route(3, gateway="10.0.0.2", metric=703)
+    body = sock.sent[0][NLMSG_HEADER.size :]
+    assert NLMSG_HEADER.unpack_from(sock.sent[0])[1] == RTM_NEWROUTE
+    assert body[:12] == bytes.fromhex("02 00 00 00 fe 03 00 01 00000000")  # default route, main table
+    assert _attrs(body, 12) == {4: struct.pack("=i", 3), 5: b"\x0a\0\0\x02", 6: struct.pack("=I", 703)}
+
+
+def test_addresses_parses_dump():
+    def reply(index, address, prefix):
+        return RTM_NEWADDR, IFADDRMSG.pack(socket.AF_INET, prefix, 0, 0, index) + _attr(IFA_LOCAL, socket.inet_aton(address))
+
+    sock = FakeSocket(replies=[reply(2, "192.168.1.5", 24), reply(3, "10.0.0.1", 30)])
+    assert netlink(sock).addresses(3) == [("10.0.0.1", 30)]
+    assert NLMSG_HEADER.unpack_from(sock.sent[0])[1] == RTM_GETADDR
+
+
+def test_kernel_error_raises():
+    with pytest.raises(NetlinkError) as e:
+        netlink(FakeSocket(error=errno.EEXIST)).add_address(3, "10.0.0.1", 30)
+    assert e.value.errno == errno.EEXIST
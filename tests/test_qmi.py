@@ -0,0 +1,139 @@
+import os
+import struct
+import threading
+import time
+
+import pytest
+
+from modem.qmi import (
+    CTL,
+    CTL_ALLOCATE_CID,
+    DMS,
+    DMS_GET_IDS,
+    WDS,
+    QMIClient,
+    QMIError,
+    check_result,
+    decode_message,
+    decode_tlvs,
+    encode_message,
+    encode_tlvs,
+)
+from modem.simulator import SimulatedModem
+
+
+@pytest.fixture(scope="module")
+def sim():
+    with SimulatedModem(scale=0.01, register_delay=0.01, seed=1) as sim:
+        yield sim
+
+
+@pytest.fixture
+def client(sim):
+    with QMIClient(sim.qmi_port, timeout=2) as client:
+        yield client
+
+
+def test_tlvs_round_trip():
+    tlvs = {0x01: b"\x01\x02", 0x10: b"", 0x14: b"internet"}
+    data = encode_tlvs(tlvs)
+    assert data[:5] == b"\x01\x02\x00\x01\x02"
+    assert decode_tlvs(data) == tlvs
+
+
+def test_ctl_frame_layout():
+    frame = encode_message(CTL, 0, 7, CTL_ALLOCATE_CID, {0x01: bytes([WDS])})
+    # QMUX header, CTL SDU (1-byte transaction), one TLV
+    assert frame == bytes.fromhex("01 0f00 00 00 00" "00 07 2200 0400" "01 0100 01".replace(" ", ""))
+    assert decode_message(frame) == (CTL, 0, 0, 7, CTL_ALLOCATE_CID, {0x01: bytes([WDS])})
+
+
+def test_service_frame_round_trip():
+    frame = encode_message(DMS, 3, 0x1234, DMS_GET_IDS, {0x10: b"abc"})
+    assert struct.unpack_from("<H", frame, 1)[0] + 1 == len(frame)
+    assert decode_message(frame) == (DMS, 3, 0, 0x1234, DMS_GET_IDS, {0x10: b"abc"})
+
+
+def test_read_frame_joins_split_reads():
+    first = encode_message(DMS, 1, 1, DMS_GET_IDS, {0x11: b"869710030002905"})
+    second = encode_message(DMS, 1, 2, DMS_GET_IDS)
+    r, w = os.pipe()
+    os.set_blocking(r, False)
+    client = QMIClient("pipe")
+    client.fd = r
+    os.write(w, first[:5])
+    threading.Timer(0.05, os.write, (w, first[5:] + second)).start()
+    try:
+        assert client._read_frame(time.monotonic() + 2) == first
+        assert client._read_frame(time.monotonic() + 2) == second
+        assert client._read_frame(time.monotonic() + 0.05) is None
+    finally:
+        os.close(r)
+        os.close(w)
+
+
+def test_check_result():
+    check_result({0x02: struct.pack("<HH", 0, 0)}, "ok")
+    with pytest.raises(QMIError) as error:
+        check_result({0x02: struct.pack("<HH", 1, 0x0E)}, "Start network")
+    assert error.value.code == 0x0E
+    with pytest.raises(QMIError):
+        check_result({}, "no result")
+    with pytest.raises(QMIError):
+        check_result({0x02: b"\0"}, "short result")
+    with pytest.raises(QMIError):
+        decode_message(bytes.fromhex("01 0f00 00"))
+
+
+@pytest.mark.parametrize(
+    "method, reply",
+    [
+        ("get_operating_mode", {}),
+        ("get_serving_system", {0x01: b"\x01"}),
+        ("get_packet_service_status", {0x01: b""}),
+        ("get_card_status", {0x10: b"\0\0"}),
+    ],
+)
+def test_malformed_replies_raise_qmi_error(method, reply):
+    client = QMIClient("/dev/null")
+    client.request = lambda *args, **kwargs: {0x02: struct.pack("<HH", 0, 0), **reply}
+    with pytest.raises(QMIError, match="Malformed reply"):
+        getattr(client, method)()
+
+
+@pytest.mark.parametrize("ip_type, family", [("4,6", None), ("4", b"\x04"), ("6", b"\x06")])
+def test_start_network_ip_family(ip_type, family):
+    client = QMIClient("/dev/null")
+    sent = []
+
+    def request(service, message, tlvs=None, **kwargs):
+        sent.append(tlvs)
+        return {0x02: struct.pack("<HH", 0, 0), 0x01: struct.pack("<I", 7)}
+
+    client.request = request
+    assert client.start_network("internet", ip_type) == 7
+    assert sent[0].get(0x19) == family
+
+
+def test_client_against_simulator(sim, client):
+    assert client.get_ids()["imei"] == sim.imei
+    assert client.get_iccid() == sim.iccid
+    assert client.get_operating_mode() == "online"
+    card = client.get_card_status()
+    assert card.ready
+    handle = client.start_network("internet")
+    assert client.get_packet_service_status() == "connected"
+    settings = client.get_current_settings()
+    assert (settings.ip, settings.gateway, settings.mtu) == ("10.64.12.34", "10.64.12.33", 1500)
+    assert settings.prefix_length == 30
+    assert list(settings.dns) == ["10.64.0.1", "10.64.0.2"]
+    client.stop_network(handle)
+    assert client.get_packet_service_status() == "disconnected"
+
+
+def test_client_ids_are_released(sim):
+    client = QMIClient(sim.qmi_port, timeout=2).open()
+    allocated = {client.client_id(WDS), client.client_id(DMS)}
+    assert allocated <= set(sim.client_ids)
+    client.close(keep=())
+    assert not allocated & set(sim.client_ids)
@@ -0,0 +1,54 @@
+import threading
+import time
+from modem.at import ATResponse
+from modem.radio import RadioSampler
+
+SERVING = '+QENG: "servingcell","NOCONN","LTE","FDD",262,03,1A2D003,310,1300,3,5,5,1A2B,-95,-10,-65,12,0,-,-'
+
+
+class FakeAT:
+    def __init__(self):
+        self.commands = []
+        self.lock = threading.Lock()
+
+    def command(self, cmd, timeout=5):
+        with self.lock:
+            self.commands.append(cmd)
+        return ATResponse(cmd, "OK", [SERVING], 0.001, final="OK")
+
+
+def test_sampler_polls_at_interval():
+    at = FakeAT()
+    sampler = RadioSampler(at, interval=0.2)
+    sampler.start()
+    time.sleep(1.0)
+    sampler.stop()
+    assert not sampler.is_alive()
+    # one poll at start, then one per interval
+    assert 4 <= len(at.commands) <= 7
+    assert sampler.buffer.latest()["rsrp"] == -95
+
+
+def test_sampler_respects_max_duty():
+    class SlowAT(FakeAT):
+        def command(self, cmd, timeout=5):
+            time.sleep(0.05)
+            return super().command(cmd, timeout)
+
+    at = SlowAT()
+    sampler = RadioSampler(at, interval=0.01, max_duty=0.25)
+    sampler.start()
+    time.sleep(1.0)
+    sampler.stop()
+    # 50 ms per poll at a 25% duty cycle allows at most ~5 polls per second
+    assert len(at.commands) <= 6
+
+
+def test_stop_before_start_does_not_spin():
+    at = FakeAT()
+    sampler = RadioSampler(at, interval=0.2)
+    sampler.stop()
+    sampler.start()
+    sampler.join(1)
+    assert not sampler.is_alive()
+    assert len(at.commands) <= 1
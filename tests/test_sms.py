@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import serial
+
+from modem.at import AT
+from modem.simulator import SimulatedModem, encode_deliver
+from modem.sms import (
+    SMSInbox,
+    decode_address,
+    decode_deliver,
+    encode_address,
+    encode_submit,
+    pack_septets,
+    split_message,
+    unpack_septets,
+)
+
+# SMS-DELIVER from 27838890001 (national), "hellohello", 99-03-29 15:16:59 GMT+2
+DELIVER = "07917283010010F5040BC87238880900F10000993092516195800AE8329BFD4697D9EC37"
+
+
+def test_septets_round_trip():
+    septets = [0x68, 0x65, 0x6C, 0x6C, 0x6F] * 2  # "hellohello"
+    packed = pack_septets(septets)
+    assert packed.hex().upper() == "E8329BFD4697D9EC37"
+    assert unpack_septets(packed, len(septets)) == septets
+
+
+def test_address_round_trip():
+    encoded = encode_address("+4915100000")
+    assert encoded.hex().upper() == "0A919451010000"
+    assert decode_address(encoded, 0) == ("+4915100000", len(encoded))
+    assert decode_address(encode_address("12345"), 0)[0] == "12345"
+
+
+def test_decode_deliver_fixture():
+    message, concat = decode_deliver(DELIVER)
+    assert message.text == "hellohello"
+    assert message.sender == "27838890001"
+    # two-digit years are read as 20xx
+    assert message.timestamp == datetime(2099, 3, 29, 15, 16, 59, tzinfo=timezone(timedelta(hours=2)))
+    assert concat == (None, 1, 1)
+
+
+@pytest.mark.parametrize("text", ["hello", "Grüße 😀 from the modem", "price: 5€ [net] {x}"])
+def test_single_part_round_trip(text):
+    (pdu,) = encode_deliver("+4915100000", text, timestamp=1700000000)
+    message, concat = decode_deliver(pdu)
+    assert (message.sender, message.text) == ("+4915100000", text)
+    assert message.timestamp == datetime.fromtimestamp(1700000000, timezone.utc)
+    assert concat == (None, 1, 1)
+
+
+@pytest.mark.parametrize("text", ["x" * 400, "€" * 200, "ü😀" * 100])
+def test_concatenated_round_trip(text):
+    pdus = encode_deliver("+4915100000", text, reference=42)
+    assert len(pdus) > 1
+    decoded = [decode_deliver(pdu) for pdu in pdus]
+    assert [concat for _, concat in decoded] == [(42, len(pdus), i) for i in range(1, len(pdus) + 1)]
+    assert "".join(message.text for message, _ in decoded) == text
+
+
+def test_split_message_limits():
+    assert split_message("a" * 160)[0] == "gsm7" and len(split_message("a" * 160)[1]) == 1
+    assert len(split_message("a" * 161)[1]) == 2
+    assert len(split_message("ü" * 70)[1]) == 1  # ü is in the GSM alphabet
+    assert split_message("😀" * 35)[0] == "ucs2" and len(split_message("😀" * 35)[1]) == 1
+    # escape sequences and surrogate pairs are never split
+    for encoding, parts in (split_message("€" * 100), split_message("😀" * 40)):
+        assert all(len(unit) in (1, 2) for part in parts for unit in part)
+
+
+def test_submit_pdu_layout():
+    encoding, parts = split_message("hi")
+    pdu, length = encode_submit("+4915100000", encoding, parts[0])
+    data = bytes.fromhex(pdu)
+    assert data[0] == 0x00  # SMSC from the SIM
+    assert data[1] & 0x03 == 0x01  # SMS-SUBMIT
+    assert data[3:10] == encode_address("+4915100000")
+    assert length == len(data) - 1
+
+
+def test_submit_is_not_decoded_as_deliver():
+    encoding, parts = split_message("draft")
+    pdu, _ = encode_submit("+4915100000", encoding, parts[0])
+    with pytest.raises(ValueError):
+        decode_deliver(pdu)
+
+
+def test_inbox_deletes_undecodable_messages():
+    with SimulatedModem(scale=0.01, seed=1) as sim, serial.Serial(sim.at_port, timeout=0) as connection:
+        inbox = SMSInbox(AT(connection))
+        sim.deliver_sms("+4915100000", "hello")
+        sim.store_outgoing("+4915100000", "draft")
+        sim.sms_storage[7] = "0004"  # truncated SMS-DELIVER
+        messages = inbox.drain()
+        assert [(m.sender, m.text) for m in messages] == [("+4915100000", "hello")]
+        # the draft (SMS-SUBMIT) stays, the broken PDU is gone
+        assert [sim.sms_status.get(index) for index in sim.sms_storage] == [2]
+        assert inbox.drain() == []
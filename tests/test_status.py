@@ -0,0 +1,116 @@
+import pytest
+
+from modem import status
+from modem.at import ATResponse
+from modem.status import StatusCache
+
+REPLIES = {
+    "AT+GSN": ["861234567890123"],
+    "AT+QCCID": ["+QCCID: 8949020000012345678F"],
+    "ATI": ["Quectel", "RM520N-GL", "Revision: RM520NGLAAR03A03M4G"],
+    "AT+CSQ": ["+CSQ: 20,99"],
+    "AT+COPS?": ['+COPS: 0,0,"Telekom.de",7'],
+    "AT+CREG?": ["+CREG: 0,1"],
+}
+
+
+class FakeAT:
+    def __init__(self):
+        self.commands = []
+
+    def command(self, cmd, timeout=5):
+        self.commands.append(cmd)
+        return ATResponse(cmd, "OK", list(REPLIES[cmd]), 0.001, final="OK")
+
+    def batch(self, commands, timeout=5):
+        return [self.command(cmd) for cmd in commands]
+
+
+class FakeReader:
+    def __init__(self):
+        self.subscribers = {}
+
+    def subscribe(self, prefix, callback):
+        self.subscribers[prefix] = callback
+
+    def urc(self, line):
+        for prefix, callback in self.subscribers.items():
+            if line.startswith(prefix):
+                callback(line)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(status, "time", clock)
+    return clock
+
+
+def test_values_are_parsed(clock):
+    cache = StatusCache(FakeAT())
+    assert cache.imei() == "861234567890123"
+    assert cache.iccid() == "8949020000012345678"
+    assert cache.firmware() == {"manufacturer": "Quectel", "model": "RM520N-GL", "revision": "RM520NGLAAR03A03M4G"}
+    assert cache.signal() == {"rssi": 20, "ber": 99, "dbm": -73}
+    assert cache.operator() == "Telekom.de"
+    assert cache.registration() == "registered-home"
+
+
+def test_ttl(clock):
+    at = FakeAT()
+    cache = StatusCache(at)
+    cache.signal()
+    cache.imei()
+    clock.now += 9.9
+    cache.signal()
+    assert at.commands == ["AT+CSQ", "AT+GSN"]
+    clock.now += 0.2
+    cache.signal()
+    cache.get("signal", max_age=60)
+    assert at.commands == ["AT+CSQ", "AT+GSN", "AT+CSQ"]
+    clock.now += 86400
+    cache.imei()  # identity fields never expire
+    assert at.commands.count("AT+GSN") == 1
+
+
+def test_ttl_override(clock):
+    at = FakeAT()
+    cache = StatusCache(at, ttls={"operator": 1})
+    cache.operator()
+    clock.now += 1
+    cache.operator()
+    assert at.commands == ["AT+COPS?", "AT+COPS?"]
+
+
+def test_urc_invalidates(clock):
+    at = FakeAT()
+    reader = FakeReader()
+    cache = StatusCache(at, reader)
+    cache.snapshot()
+    assert len(at.commands) == 6
+    reader.urc("+CEREG: 5")
+    assert cache.snapshot()["registration"] == "registered-home"
+    assert sorted(at.commands[6:]) == ["AT+COPS?", "AT+CREG?"]
+    reader.urc("+CPIN: READY")
+    cache.snapshot()
+    assert at.commands[8:] == ["AT+QCCID"]
+    reader.urc("RDY")
+    cache.snapshot()
+    assert sorted(at.commands[9:]) == sorted(REPLIES)
+
+
+def test_failed_query_is_not_cached(clock):
+    at = FakeAT()
+    cache = StatusCache(at)
+    at.command = lambda cmd, timeout=5: ATResponse(cmd, "ERROR", [], 0.001, final="+CME ERROR: 10")
+    assert cache.iccid() is None
+    del at.command
+    assert cache.iccid() == "8949020000012345678"
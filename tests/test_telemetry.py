@@ -0,0 +1,78 @@
+import json
+import socket
+
+import pytest
+
+from modem.simulator import MQTTBroker
+from modem.telemetry import FRAME, MQTTError, Spool, Telemetry
+
+
+def telemetry(spool, broker, **kwargs):
+    return Telemetry(
+        spool,
+        lambda: socket.create_connection((broker.host, broker.port)),
+        "devices/test",
+        "test",
+        batch_bytes=200,
+        ack_timeout=2,
+        **kwargs,
+    )
+
+
+def test_drain_survives_dropped_connection(tmp_path):
+    directory = str(tmp_path / "spool")
+    with MQTTBroker() as broker:
+        uplink = telemetry(Spool(directory, segment_bytes=512), broker, max_inflight=1)
+        for i in range(40):
+            uplink.record("sensor", {"seq": i}, timestamp=1700000000 + i)
+        sent, _ = uplink.spool.read(1 << 20)
+        uplink.spool.rewind()
+        assert len(sent) == 40
+
+        broker.drop_after = 3
+        with pytest.raises((MQTTError, OSError)):
+            uplink.drain()
+        assert len(broker.messages) == 3
+        delivered = broker.records()
+        uplink.spool.close()
+
+        # the cursor stops after the two acknowledged messages
+        spool = Spool(directory, segment_bytes=512)
+        unsent, _ = spool.read(1 << 20)
+        assert unsent == sent[len(sent) - len(unsent) :]
+        assert sent[: len(sent) - len(unsent)] == broker.records()[: len(sent) - len(unsent)]
+        assert len(sent) - len(unsent) < len(delivered)  # the dropped message is resent
+        spool.rewind()
+
+        uplink = telemetry(spool, broker, max_inflight=4)
+        uplink.drain()
+        assert broker.connections == 2
+        assert set(broker.records()) == set(sent)
+        assert [json.loads(line)["d"]["seq"] for line in dict.fromkeys(broker.records())] == list(range(40))
+        spool.close()
+
+    spool = Spool(directory, segment_bytes=512)
+    assert spool.pending() == 0
+    assert spool.read()[0] == []
+    spool.close()
+
+
+def test_corrupt_frame_in_last_segment_is_skipped(tmp_path):
+    directory = str(tmp_path / "spool")
+    spool = Spool(directory)
+    spool.append(b"one")
+    spool.append(b"two")
+    with open(spool._file.name, "ab") as f:
+        f.write(FRAME.pack(5, 0) + b"bogus")
+    spool.append(b"three")
+    assert spool.read()[0] == [b"one", b"two"]
+    assert spool.dropped_bytes == 2 * FRAME.size + len(b"bogus") + len(b"three")
+    spool.append(b"four")
+    records, position = spool.read()
+    assert records == [b"four"]
+    spool.commit(position)
+    spool.close()
+
+    spool = Spool(directory)
+    assert spool.read()[0] == []
+    spool.close()
@@ -0,0 +1,50 @@
+import pytest
+
+from modem.at import AT
+from modem.tracing import RX, TX, TraceBuffer, redact
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        (b'AT+CPIN="1234"\r', b"AT+CPIN=***\r"),
+        (b'AT+CPWD="SC","1234","4321"\r', b"AT+CPWD=***\r"),
+        (b'at+clck="SC",1,"1234"\r', b"at+clck=***\r"),
+        (b'AT+QFTPCFG="account","user","secret"\r', b'AT+QFTPCFG="account",***\r'),
+        (b'AT+QICFG="x",1;+QICSGP=1,1,"internet","user","secret",1;+CSQ\r', b'AT+QICFG="x",1;+QICSGP=1,1,"internet",***;+CSQ\r'),
+        (b'+CPIN: READY\r\n', b'+CPIN: READY\r\n'),
+        (b'AT+QFTPCFG="contextid",1\r', b'AT+QFTPCFG="contextid",1\r'),
+    ],
+)
+def test_redact(line, expected):
+    assert redact(line) == expected
+
+
+class Port:
+    port = "/dev/ttyTEST"
+    in_waiting = 0
+
+    def write(self, data):
+        pass
+
+
+def test_at_payloads_are_recorded_by_size(monkeypatch):
+    trace = TraceBuffer()
+    monkeypatch.setattr("modem.at.TRACE", trace)
+    at = AT(Port())
+    command = b'AT+CPIN="1234"\r'
+    connect = b"101c00044d5154540402003c0004746573740004757365720006736563726574\x1a"  # MQTT CONNECT, as hex
+    echo = b'\r\nAT+CPIN="1234"\r\nOK\r\n'
+    at._write(command)
+    at._write(connect, payload=True)
+    trace.channel("/dev/ttyTEST").rx(echo)
+    entries = [(direction, size, data) for _, _, direction, _, size, data in trace.entries()]
+    assert entries == [
+        (TX, len(command), b"AT+CPIN=***\r"),
+        (TX, len(connect), b""),
+        (RX, len(echo), b"\r\nAT+CPIN=***\r\nOK\r\n"),
+    ]
+
+    trace.redact = False
+    at._write(b'AT+CPIN="1234"\r')
+    assert list(trace.entries())[-1][5] == b'AT+CPIN="1234"\r'
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from modem.gps import GPSFix
+from modem.track import GROW_RECORDS, HEADER, MAGIC, RECORD, VERSION, TrackBuffer, TrackLog
+
+# float32 columns round-trip values that are exact in binary
+FIXES = [GPSFix(1700000000.0 + i, 52.5 + i * 1e-4, 13.25 - i * 1e-4, 34.5 + i, 12.25, 1 + i % 2) for i in range(10)]
+
+
+def as_tuples(fixes):
+    return [(f.timestamp, f.latitude, f.longitude, f.altitude, f.speed, f.quality) for f in fixes]
+
+
+def test_header_layout(tmp_path):
+    path = str(tmp_path / "track.log")
+    log = TrackLog(path)
+    with open(path, "rb") as f:
+        assert HEADER.unpack(f.read(HEADER.size)) == (MAGIC, VERSION, RECORD.size, 0)
+    for fix in FIXES[:3]:
+        log.append(fix)
+    log.flush()
+    with open(path, "rb") as f:
+        assert HEADER.unpack(f.read(HEADER.size))[3] == 3
+        assert RECORD.unpack(f.read(RECORD.size)) == as_tuples(FIXES[:1])[0]
+    # grown in chunks while open, trimmed to the records on close
+    assert os.path.getsize(path) >= HEADER.size + GROW_RECORDS * RECORD.size
+    log.close()
+    assert os.path.getsize(path) == HEADER.size + 3 * RECORD.size
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / "track.log")
+    log = TrackLog(path)
+    for fix in FIXES[:6]:
+        log.append(fix)
+    log.close()
+    log = TrackLog(path)
+    assert len(log) == 6
+    for fix in FIXES[6:]:
+        log.append(fix)
+    assert as_tuples(log.read()) == as_tuples(FIXES)
+    assert as_tuples(log.read(FIXES[2].timestamp, FIXES[4].timestamp)) == as_tuples(FIXES[2:5])
+    assert len(log.read(FIXES[-1].timestamp + 1)) == 0
+    log.close()
+
+
+def test_buffer_writes_through_to_log(tmp_path):
+    log = TrackLog(str(tmp_path / "track.log"))
+    buffer = TrackBuffer(capacity=4, log=log)
+    for fix in FIXES:
+        buffer.append(fix)
+    assert as_tuples(buffer) == as_tuples(FIXES[-4:])
+    assert as_tuples(log.read()) == as_tuples(FIXES)
+    log.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "track.log"
+    path.write_bytes(HEADER.pack(b"XXXX", VERSION, RECORD.size, 0))
+    with pytest.raises(ValueError):
+        TrackLog(str(path))
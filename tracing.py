@@ -0,0 +1,304 @@
+import argparse
+import re
+import struct
+import sys
+import threading
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TX, RX = 0, 1
+DIRECTIONS = (">", "<")
+
+# timestamp, latency (s since the last TX on the port), size, stored bytes, port id, direction
+HEADER = struct.Struct("<dfIHHB")
+MAGIC = b"MODEMTRACE1\n"
+NAME = struct.Struct("<H")
+
+_PRINTABLE = frozenset(range(0x20, 0x7F)) | {0x09, 0x0A, 0x0D, 0x1A}
+
+# Arguments that carry credentials: PINs and PUKs, facility and FTP
+# passwords, PDP context user name and password. The part matched by the
+# group is kept, the rest of the command is replaced with REDACTED.
+_SECRETS = re.compile(
+    rb'(\+(?:CPIN|CPWD|CLCK)=|\+QFTPCFG="account",|\+QICSGP=\d+,\d+,"[^"\r;]*",)[^\r\n;]*',
+    re.IGNORECASE,
+)
+REDACTED = b"***"
+
+
+def redact(data) -> bytes:
+    """data with the credentials in AT command lines masked."""
+    if _SECRETS.search(data) is None:
+        return data
+    return _SECRETS.sub(rb"\1" + REDACTED, data)
+
+
+class TraceChannel:
+    """Records the traffic of one port; latency of an RX record is the time
+    since the last TX on the same port."""
+
+    __slots__ = ("buffer", "port", "_last_tx")
+
+    def __init__(self, buffer, port):
+        self.buffer = buffer
+        self.port = port
+        self._last_tx = None
+
+    def tx(self, data, payload=False):
+        """Record data sent on the port. A payload (text after a ">" prompt,
+        data-mode upload) may hold anything, MQTT credentials included, and
+        is recorded by size only while the buffer redacts."""
+        if self.buffer.enabled:
+            self._last_tx = time.monotonic()
+            if payload and self.buffer.redact:
+                self.buffer.record(self.port, TX, b"", size=len(data))
+            else:
+                self.buffer.record(self.port, TX, data)
+
+    def rx(self, data, suffix=b""):
+        if self.buffer.enabled:
+            last = self._last_tx
+            latency = time.monotonic() - last if last is not None else 0.0
+            self.buffer.record(self.port, RX, data, latency, suffix)
+
+
+class TraceBuffer:
+    """In-memory ring of port exchanges as packed binary records.
+
+    Recording copies at most max_data bytes per exchange behind a small
+    header; nothing is decoded or formatted until entries(), dump() or
+    save() is called, so tracing can stay on in the serial and QMI hot
+    paths. The oldest records are overwritten once capacity bytes are used.
+    While redact is set, credentials in the stored bytes are masked (see
+    redact()) and payloads are recorded by size only.
+    """
+
+    def __init__(self, capacity=2 << 20, max_data=1024):
+        self.capacity = capacity
+        self.max_data = max_data
+        self.enabled = True
+        self.redact = True
+        self.count = 0
+        self.dropped = 0
+        self._buf = bytearray(capacity)
+        self._head = 0  # offset of the next record
+        self._tail = 0  # offset of the oldest record
+        self._end = None  # end of the records before the wrap point, while wrapped
+        self._ports = []  # port id -> name
+        self._channels = {}  # name -> TraceChannel
+        self._lock = threading.Lock()
+
+    def channel(self, port) -> TraceChannel:
+        """The channel for port; every reader and writer of a port shares it."""
+        with self._lock:
+            if port not in self._channels:
+                self._ports.append(port)
+                self._channels[port] = TraceChannel(self, len(self._ports) - 1)
+            return self._channels[port]
+
+    def record(self, port, direction, data, latency=0.0, suffix=b"", timestamp=None, size=None):
+        """Store an exchange; size is its original length, if more than
+        data + suffix."""
+        if size is None:
+            size = len(data) + len(suffix)
+        data = data[: self.max_data]
+        if self.redact:
+            data = redact(data)
+        stored = min(len(data) + len(suffix), self.max_data)
+        n = HEADER.size + stored
+        if n > self.capacity:
+            return
+        with self._lock:
+            offset = self._head
+            if self._end is None and offset + n <= self.capacity:
+                self._head = offset + n
+                self.count += 1
+            else:
+                offset = self._reserve(n)
+            HEADER.pack_into(self._buf, offset, timestamp or time.time(), latency, size, stored, port, direction)
+            offset += HEADER.size
+            head = min(stored, len(data))
+            self._buf[offset : offset + head] = data[:head]
+            if stored > head:
+                self._buf[offset + head : offset + stored] = suffix[: stored - head]
+
+    def _reserve(self, n) -> int:
+        """Offset of n free bytes at the head, evicting the oldest records."""
+        if not self.count:
+            self._head = self._tail = 0
+            self._end = None
+        elif self._end is None and self._head + n > self.capacity:
+            self._end, self._head = self._head, 0
+        while self._end is not None and self._head + n > self._tail:
+            self._tail += HEADER.size + HEADER.unpack_from(self._buf, self._tail)[3]
+            self.count -= 1
+            self.dropped += 1
+            if self._tail >= self._end:
+                self._end, self._tail = None, 0
+                if self._head + n > self.capacity:
+                    return self._reserve(n)
+        offset = self._head
+        self._head += n
+        self.count += 1
+        return offset
+
+    def clear(self):
+        with self._lock:
+            self._head = self._tail = self.count = 0
+            self._end = None
+
+    def _snapshot(self):
+        """(record bytes oldest first, port names)."""
+        with self._lock:
+            if self._end is None:
+                data = bytes(self._buf[self._tail : self._head])
+            else:
+                data = bytes(self._buf[self._tail : self._end]) + bytes(self._buf[: self._head])
+            return data, list(self._ports)
+
+    def entries(self, port=None):
+        """Yield (timestamp, port, direction, latency, size, data), oldest
+        first; size is the original length, data may be truncated."""
+        data, ports = self._snapshot()
+        offset = 0
+        while offset < len(data):
+            timestamp, latency, size, stored, port_id, direction = HEADER.unpack_from(data, offset)
+            offset += HEADER.size
+            name = ports[port_id]
+            if port is None or name == port:
+                yield timestamp, name, direction, latency, size, data[offset : offset + stored]
+            offset += stored
+
+    def dump(self, file=None, port=None):
+        """Write the trace as text, one line per exchange."""
+        file = file or sys.stdout
+        for entry in self.entries(port):
+            print(format_entry(*entry), file=file)
+
+    def save(self, path):
+        """Write the raw records to path; read them back with load()."""
+        data, ports = self._snapshot()
+        with open(path, "wb") as f:
+            f.write(MAGIC + NAME.pack(len(ports)))
+            for name in ports:
+                encoded = name.encode()
+                f.write(NAME.pack(len(encoded)) + encoded)
+            f.write(data)
+        return len(data)
+
+    @classmethod
+    def load(cls, path) -> "TraceBuffer":
+        with open(path, "rb") as f:
+            content = f.read()
+        if not content.startswith(MAGIC):
+            raise ValueError(f"{path} is not a modem trace")
+        offset = len(MAGIC)
+        (count,) = NAME.unpack_from(content, offset)
+        offset += NAME.size
+        ports = []
+        for _ in range(count):
+            (length,) = NAME.unpack_from(content, offset)
+            offset += NAME.size
+            ports.append(content[offset : offset + length].decode())
+            offset += length
+        records = content[offset:]
+        trace = cls(capacity=max(len(records), HEADER.size), max_data=0xFFFF)
+        trace._buf[: len(records)] = records
+        trace._head = len(records)
+        for name in ports:
+            trace.channel(name)
+        while offset < len(content):
+            offset += HEADER.size + HEADER.unpack_from(content, offset)[3]
+            trace.count += 1
+        return trace
+
+
+def format_entry(timestamp, port, direction, latency, size, data) -> str:
+    when = datetime.fromtimestamp(timestamp).strftime("%H:%M:%S.%f")
+    timing = f"+{latency * 1000:.1f}ms" if direction == RX and latency else ""
+    if _PRINTABLE.issuperset(data):
+        text = repr(data.decode("ascii"))[1:-1]
+    else:
+        text = data.hex(" ")
+    if size > len(data):
+        text += f" ... ({size - len(data)} more bytes)"
+    return f"{when} {port} {DIRECTIONS[direction]} {size:5d} {timing:>10} {text}"
+
+
+def replay(entries, port=None):
+    """Feed the RX side of a captured AT trace through ATReader, starting
+    a command at each TX that begins with AT. Ports that never send an AT
+    command (QMI, NMEA, shell) are skipped. Returns [(kind, line)] in
+    dispatch order, kind being "response" or "urc". Data-mode payloads are
+    split into lines like any other text."""
+    from modem.reader import ANY, ATReader
+
+    readers = {}
+    out = []
+
+    def take_responses():
+        for reader in readers.values():
+            out.extend(("response", line) for line in reader.take_responses())
+
+    def on_urc(line):
+        take_responses()
+        out.append(("urc", line))
+
+    for _, name, direction, _, _, data in entries:
+        if port is not None and name != port:
+            continue
+        reader = readers.get(name)
+        if direction == RX:
+            if reader is not None:
+                reader.feed(data)
+            continue
+        cmd = data.split(b"\r", 1)[0].decode("ascii", "ignore").strip()
+        if cmd[:2].upper() != "AT":
+            continue
+        if reader is None:
+            reader = readers[name] = ATReader(None)
+            reader.subscribe(ANY, on_urc)
+        take_responses()
+        reader.begin(cmd, prompt=True)
+    take_responses()
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and replay a saved modem trace.")
+    parser.add_argument("action", choices=("dump", "replay"))
+    parser.add_argument("path", help="file written by TraceBuffer.save()")
+    parser.add_argument("--port", help="only this port, e.g. /dev/ttyUSB2")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the trace this many times (benchmark)")
+    parser.add_argument("--quiet", action="store_true", help="only print the replay summary")
+    args = parser.parse_args(argv)
+
+    trace = TraceBuffer.load(args.path)
+    if args.action == "dump":
+        trace.dump(port=args.port)
+        return
+    entries = list(trace.entries(args.port))
+    received = sum(len(e[5]) for e in entries if e[2] == RX)
+    lines = replay(entries)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        replay(entries)
+    elapsed = time.perf_counter() - start
+    if not args.quiet:
+        for kind, line in lines:
+            print(f"{kind:8} {line}")
+    total = len(lines) * args.repeat
+    print(
+        f"{len(entries)} entries, {len(lines)} lines ({sum(k == 'urc' for k, _ in lines)} URCs) x {args.repeat}: "
+        f"{elapsed * 1000:.1f} ms, {total / elapsed:.0f} lines/s, {received * args.repeat / elapsed / 1e6:.1f} MB/s",
+        file=sys.stderr,
+    )
+
+
+TRACE = TraceBuffer()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import math
+import mmap
+import os
+import struct
+import threading
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from modem.gps import GPSFix
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the array module covers everything
+    np = None
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371008.8  # metres
+
+# Column layout shared by the in-memory buffer and the on-disk log
+COLUMNS = (
+    ("timestamp", "d"),
+    ("latitude", "d"),
+    ("longitude", "d"),
+    ("altitude", "f"),
+    ("speed", "f"),
+    ("quality", "B"),
+)
+RECORD = struct.Struct("<dddffB")
+HEADER = struct.Struct("<4sHHQ")  # magic, version, record size, record count
+MAGIC = b"MTRK"
+VERSION = 1
+GROW_RECORDS = 65536
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class TrackBuffer:
+    """Columnar track of fixes held in typed arrays (33 bytes per fix).
+
+    Fixes must be appended in time order. With a log attached every fix is
+    also appended to the memory-mapped file, and the in-memory columns keep
+    at most capacity fixes; older ones are only on disk (see TrackLog.read).
+    """
+
+    def __init__(self, capacity=None, log=None):
+        self.capacity = capacity
+        self.log = log
+        self._lock = threading.Lock()
+        for name, code in COLUMNS:
+            setattr(self, name, array(code))
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def append(self, fix: GPSFix):
+        with self._lock:
+            self.timestamp.append(fix.timestamp or 0.0)
+            self.latitude.append(fix.latitude)
+            self.longitude.append(fix.longitude)
+            self.altitude.append(fix.altitude or 0.0)
+            self.speed.append(fix.speed or 0.0)
+            self.quality.append(fix.quality)
+            if self.log is not None:
+                self.log.append(fix)
+            if self.capacity and len(self.timestamp) > self.capacity:
+                # Drop the oldest half at once to keep appends amortized O(1)
+                drop = len(self.timestamp) - self.capacity // 2
+                for name, _ in COLUMNS:
+                    del getattr(self, name)[:drop]
+
+    def extend(self, fixes):
+        for fix in fixes:
+            self.append(fix)
+
+    def fix(self, index) -> GPSFix:
+        return GPSFix(*(getattr(self, name)[index] for name, _ in COLUMNS))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.fix(i)
+
+    def _take(self, indexes):
+        """Fixes at indexes (a list, or an index array with numpy)."""
+        out = TrackBuffer()
+        for name, _ in COLUMNS:
+            column = getattr(self, name)
+            taken = array(column.typecode)
+            if np is not None:
+                taken.frombytes(self._np(name)[indexes].tobytes())
+            else:
+                taken.extend(column[i] for i in indexes)
+            setattr(out, name, taken)
+        return out
+
+    def _slice(self, start, stop):
+        out = TrackBuffer()
+        for name, _ in COLUMNS:
+            setattr(out, name, getattr(self, name)[start:stop])
+        return out
+
+    def _np(self, name):
+        column = getattr(self, name)
+        return np.frombuffer(column, dtype=column.typecode) if len(column) else np.empty(0)
+
+    # --- queries ------------------------------------------------------------
+
+    def between(self, start, end) -> "TrackBuffer":
+        """Fixes with start <= timestamp <= end (binary search)."""
+        lo = bisect_left(self.timestamp, start)
+        hi = bisect_right(self.timestamp, end)
+        return self._slice(lo, hi)
+
+    def within(self, min_lat, min_lon, max_lat, max_lon) -> "TrackBuffer":
+        """Fixes inside a latitude/longitude bounding box."""
+        if np is not None:
+            lat, lon = self._np("latitude"), self._np("longitude")
+            mask = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+            return self._take(np.flatnonzero(mask))
+        return self._take(
+            [
+                i
+                for i, (lat, lon) in enumerate(zip(self.latitude, self.longitude))
+                if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+            ]
+        )
+
+    def distance(self) -> float:
+        """Distance travelled in metres (great-circle, sum over segments)."""
+        if len(self) < 2:
+            return 0.0
+        if np is not None:
+            lat = np.radians(self._np("latitude"))
+            lon = np.radians(self._np("longitude"))
+            a = (
+                np.sin(np.diff(lat) / 2) ** 2
+                + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+            )
+            return float(np.sum(2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))))
+        lat, lon = self.latitude, self.longitude
+        return sum(
+            _haversine(lat[i - 1], lon[i - 1], lat[i], lon[i]) for i in range(1, len(lat))
+        )
+
+    def _projected(self):
+        """Equirectangular projection to metres around the track's mean latitude."""
+        if np is not None:
+            lat, lon = self._np("latitude"), self._np("longitude")
+            k = math.cos(math.radians(float(lat.mean())))
+            return np.radians(lon) * EARTH_RADIUS * k, np.radians(lat) * EARTH_RADIUS
+        k = math.cos(math.radians(sum(self.latitude) / len(self)))
+        xs = [math.radians(v) * EARTH_RADIUS * k for v in self.longitude]
+        ys = [math.radians(v) * EARTH_RADIUS for v in self.latitude]
+        return xs, ys
+
+    def simplify(self, tolerance) -> "TrackBuffer":
+        """Douglas-Peucker simplification with tolerance in metres."""
+        n = len(self)
+        if n < 3:
+            return self._slice(0, n)
+        xs, ys = self._projected()
+        keep = [False] * n
+        keep[0] = keep[-1] = True
+        stack = [(0, n - 1)]
+        while stack:
+            first, last = stack.pop()
+            if last - first < 2:
+                continue
+            x1, y1, x2, y2 = xs[first], ys[first], xs[last], ys[last]
+            dx, dy = x2 - x1, y2 - y1
+            norm = math.hypot(dx, dy)
+            if np is not None:
+                px, py = xs[first + 1 : last], ys[first + 1 : last]
+                if norm == 0:
+                    d = np.hypot(px - x1, py - y1)
+                else:
+                    d = np.abs(dy * px - dx * py + x2 * y1 - y2 * x1) / norm
+                offset = int(np.argmax(d))
+                dmax = float(d[offset])
+            else:
+                dmax, offset = -1.0, 0
+                for j in range(first + 1, last):
+                    if norm == 0:
+                        d = math.hypot(xs[j] - x1, ys[j] - y1)
+                    else:
+                        d = abs(dy * xs[j] - dx * ys[j] + x2 * y1 - y2 * x1) / norm
+                    if d > dmax:
+                        dmax, offset = d, j - first - 1
+            if dmax > tolerance:
+                index = first + 1 + offset
+                keep[index] = True
+                stack.append((first, index))
+                stack.append((index, last))
+        if np is not None:
+            return self._take(np.flatnonzero(keep))
+        return self._take([i for i, k in enumerate(keep) if k])
+
+
+class TrackLog:
+    """Append-only, memory-mapped binary log of fixes.
+
+    The file starts with a small header holding the record count, which is
+    updated after each record is written, so a crash loses at most the fix
+    being written. The file grows in chunks and is trimmed on close.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if exists:
+            magic, version, size, self.count = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+            if magic != MAGIC or size != RECORD.size:
+                os.close(self._fd)
+                raise ValueError(f"{path} is not a version {VERSION} track log")
+        else:
+            self.count = 0
+            os.ftruncate(self._fd, HEADER.size)
+            os.pwrite(self._fd, HEADER.pack(MAGIC, VERSION, RECORD.size, 0), 0)
+        self._map = None
+        self._remap(max(self.count, 1))
+
+    def _remap(self, records):
+        size = HEADER.size + records * RECORD.size
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+
+    def append(self, fix: GPSFix):
+        with self._lock:
+            offset = HEADER.size + self.count * RECORD.size
+            if offset + RECORD.size > len(self._map):
+                self._remap(self.count + GROW_RECORDS)
+            RECORD.pack_into(
+                self._map,
+                offset,
+                fix.timestamp or 0.0,
+                fix.latitude,
+                fix.longitude,
+                fix.altitude or 0.0,
+                fix.speed or 0.0,
+                fix.quality,
+            )
+            self.count += 1
+            struct.pack_into("<Q", self._map, 8, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def _timestamp(self, index):
+        return struct.unpack_from("<d", self._map, HEADER.size + index * RECORD.size)[0]
+
+    def _bisect(self, value, right=False):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = self._timestamp(mid)
+            if t < value or (right and t == value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def read(self, start=None, end=None) -> TrackBuffer:
+        """Load fixes with start <= timestamp <= end into a TrackBuffer."""
+        with self._lock:
+            lo = 0 if start is None else self._bisect(start)
+            hi = self.count if end is None else self._bisect(end, right=True)
+            view = memoryview(self._map)[
+                HEADER.size + lo * RECORD.size : HEADER.size + hi * RECORD.size
+            ]
+            out = TrackBuffer()
+            columns = [getattr(out, name) for name, _ in COLUMNS]
+            for record in RECORD.iter_unpack(view):
+                for column, value in zip(columns, record):
+                    column.append(value)
+            view.release()
+            return out
+
+    def flush(self):
+        with self._lock:
+            self._map.flush()
+
+    def close(self):
+        with self._lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map.close()
+            self._map = None
+            os.ftruncate(self._fd, HEADER.size + self.count * RECORD.size)
+            os.close(self._fd)
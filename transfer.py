@@ -0,0 +1,521 @@
+import hashlib
+import os
+import posixpath
+import queue
+import time
+import logging
+from urllib.parse import urlsplit
+from modem.sockets import activate_context
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SIZE = 4 * 1024 * 1024  # bytes per AT+QFTPGET/QFTPPUT or HTTP range request
+READ_CHUNK = 65536  # bytes per local file read
+DEFAULT_ALGORITHM = "sha256"
+PARTIAL_SUFFIX = ".part"
+
+
+class TransferError(Exception):
+    def __init__(self, message, code=None, retry=True):
+        self.code = code
+        self.retry = retry  # False when repeating the request cannot help
+        super().__init__(message if code is None else f"{message} (error {code})")
+
+
+class TransferResult:
+    def __init__(self, path, remote, size, digest, resumed_from, elapsed, retries):
+        self.path = path
+        self.remote = remote
+        self.size = size
+        self.digest = digest
+        self.resumed_from = resumed_from
+        self.elapsed = elapsed
+        self.retries = retries
+
+    @property
+    def rate(self) -> float:
+        """Bytes per second moved in this call (excluding resumed data)."""
+        moved = self.size - self.resumed_from
+        return moved / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (
+            f"TransferResult({self.remote} <-> {self.path}, {self.size} bytes, "
+            f"resumed_from={self.resumed_from}, retries={self.retries}, "
+            f"{self.rate / 1e6:.2f} MB/s)"
+        )
+
+
+def _hash_file(hasher, f, length):
+    """Feed the first length bytes of f to hasher."""
+    f.seek(0)
+    remaining = length
+    while remaining:
+        chunk = f.read(min(READ_CHUNK, remaining))
+        if not chunk:
+            break
+        hasher.update(chunk)
+        remaining -= len(chunk)
+
+
+def _urc_fields(line):
+    """'+QFTPGET: 0,1024' -> ['0', '1024']"""
+    return [f.strip().strip('"') for f in line.split(":", 1)[1].split(",")]
+
+
+class _Sink:
+    """Receives one downloaded segment: writes it to the file and the
+    segment's hasher. Data arriving after the segment was abandoned (late
+    bytes after a timeout) is ignored."""
+
+    def __init__(self, f, hasher, done, total, progress):
+        self.f = f
+        self.hasher = hasher
+        self.done = done
+        self.total = total
+        self.progress = progress
+        self.active = True
+
+    def __call__(self, data):
+        if not self.active:
+            return
+        self.f.write(data)
+        self.hasher.update(data)
+        self.done += len(data)
+        if self.progress is not None:
+            self.progress(self.done, self.total)
+
+
+class _Source:
+    """File reader handed to AT.upload(): hashes what it reads and reports
+    progress. prefix (e.g. HTTP request headers) is sent before the file
+    data and not hashed."""
+
+    def __init__(self, f, hasher, done, total, progress, prefix=b""):
+        self.f = f
+        self.hasher = hasher
+        self.done = done
+        self.total = total
+        self.progress = progress
+        self.prefix = prefix
+
+    def read(self, size):
+        if self.prefix:
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+            return data
+        data = self.f.read(size)
+        self.hasher.update(data)
+        self.done += len(data)
+        if self.progress is not None:
+            self.progress(self.done, self.total)
+        return data
+
+
+class _Transfer:
+    """Segmented, resumable transfers over one of the modem's file clients.
+
+    Payloads go through the AT port in data mode and are streamed between
+    the port and the local file in small pieces; nothing larger than a
+    receive buffer is held in memory. Each segment is one request, so a
+    dropped connection costs at most one segment: the partial segment is
+    cut off, the session is re-established and the transfer resumes.
+    """
+
+    def __init__(
+        self,
+        at,
+        reader,
+        context_id=1,
+        segment_size=SEGMENT_SIZE,
+        retries=5,
+        retry_delay=2,
+        timeout=120,
+        algorithm=DEFAULT_ALGORITHM,
+    ):
+        if reader is None:
+            raise ValueError(f"{type(self).__name__} needs an ATReader for result URCs")
+        self.at = at
+        self.reader = reader
+        self.context_id = context_id
+        self.segment_size = segment_size
+        self.retries = retries  # consecutive failures tolerated per transfer
+        self.retry_delay = retry_delay
+        self.timeout = timeout  # per request; a segment must finish within it
+        self.algorithm = algorithm
+        self._opened = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        if not activate_context(self.at, self.context_id):
+            raise TransferError(f"PDP context {self.context_id} is not active")
+        self._configure()
+        self._opened = True
+
+    def close(self):
+        self._opened = False
+
+    def _ensure_open(self):
+        if not self._opened:
+            self.open()
+
+    def _recover(self):
+        """Re-establish the session after a failed segment."""
+        self.close()
+        self.open()
+
+    def _request(self, prefix, run, timeout=None):
+        """run() issues an AT command whose outcome arrives later as a URC
+        starting with prefix; returns that URC's fields."""
+        timeout = self.timeout if timeout is None else timeout
+        results = self.reader.queue(prefix)
+        try:
+            response = run()
+            if not response.ok:
+                raise TransferError(f"{response.command} failed: {response.final or response.status}")
+            try:
+                return _urc_fields(results.get(timeout=timeout))
+            except queue.Empty:
+                raise TransferError(f"No {prefix} result within {timeout}s") from None
+        finally:
+            self.reader.unsubscribe(prefix, results)
+
+    def _failed(self, remote, offset, error, failures):
+        if not error.retry or failures > self.retries:
+            raise error
+        logger.warning(f"{remote}: segment at {offset} failed ({error}), retry {failures}/{self.retries}")
+        time.sleep(self.retry_delay)
+        try:
+            self._recover()
+        except TransferError as e:
+            logger.warning(f"{remote}: could not re-open session: {e}")
+
+    def download(self, remote, path, expected=None, progress=None) -> TransferResult:
+        """Fetch remote into path.
+
+        Data is written to path + ".part" as it arrives and moved to path
+        once complete and, if expected (a hex digest) is given, verified. An
+        existing .part file is resumed from its size, so a download cut off
+        by a dropped connection or a restart continues where it stopped.
+        progress(done, total) runs on the AT reader thread as data arrives;
+        total is None while the size is unknown.
+        """
+        self._ensure_open()
+        partial = path + PARTIAL_SUFFIX
+        start = time.monotonic()
+        retries = failures = 0
+        hasher = hashlib.new(self.algorithm)
+        with open(partial, "ab+") as f:
+            offset = f.tell()
+            total = self._remote_size(remote)
+            if total is not None and offset > total:
+                logger.warning(f"{partial} is larger than {remote}; starting over.")
+                f.truncate(0)
+                offset = 0
+            _hash_file(hasher, f, offset)
+            resumed_from = offset
+            if offset:
+                logger.info(f"Resuming {remote} at {offset} bytes.")
+            while total is None or offset < total:
+                length = self.segment_size if total is None else min(self.segment_size, total - offset)
+                sink = _Sink(f, hasher.copy(), offset, total, progress)
+                try:
+                    received, eof = self._get(remote, offset, length, sink)
+                except TransferError as e:
+                    sink.active = False
+                    f.truncate(offset)
+                    failures += 1
+                    retries += 1
+                    self._failed(remote, offset, e, failures)
+                    continue
+                sink.active = False
+                failures = 0
+                hasher = sink.hasher
+                offset += received
+                if eof:
+                    total = offset
+            f.flush()
+            os.fsync(f.fileno())
+        digest = hasher.hexdigest()
+        if expected is not None and digest != expected.lower():
+            os.remove(partial)
+            raise TransferError(f"Checksum mismatch for {remote}: expected {expected}, got {digest}", retry=False)
+        os.replace(partial, path)
+        result = TransferResult(path, remote, total, digest, resumed_from, time.monotonic() - start, retries)
+        logger.info(f"Downloaded {result}")
+        return result
+
+    def upload(self, path, remote, expected=None, progress=None, offset=None) -> TransferResult:
+        """Send path to remote.
+
+        The upload starts at offset, or where the server's copy ends when
+        the protocol can tell (FTP), and resumes the same way after a
+        failed segment. The digest of the local file is computed while it
+        is sent and checked against expected, if given.
+        progress(done, total) runs on the calling thread.
+        """
+        self._ensure_open()
+        start = time.monotonic()
+        total = os.path.getsize(path)
+        retries = failures = 0
+        with open(path, "rb") as f:
+            if offset is None:
+                offset = self._resume_offset(remote, total)
+            resumed_from = offset
+            hasher = hashlib.new(self.algorithm)
+            _hash_file(hasher, f, offset)
+            while True:
+                length = min(self.segment_size, total - offset)
+                last = offset + length >= total
+                f.seek(offset)
+                source = _Source(f, hasher.copy(), offset, total, progress)
+                try:
+                    self._put(remote, offset, length, source, total, last)
+                except TransferError as e:
+                    failures += 1
+                    retries += 1
+                    self._failed(remote, offset, e, failures)
+                    try:
+                        resume = self._resume_offset(remote, total, offset)
+                    except TransferError:
+                        resume = offset
+                    if resume != offset:
+                        offset = resume
+                        hasher = hashlib.new(self.algorithm)
+                        _hash_file(hasher, f, offset)
+                    continue
+                failures = 0
+                hasher = source.hasher
+                offset += length
+                if last:
+                    break
+        self._verify_upload(remote, total)
+        digest = hasher.hexdigest()
+        if expected is not None and digest != expected.lower():
+            raise TransferError(f"Checksum mismatch for {path}: expected {expected}, got {digest}", retry=False)
+        result = TransferResult(path, remote, total, digest, resumed_from, time.monotonic() - start, retries)
+        logger.info(f"Uploaded {result}")
+        return result
+
+    # --- protocol hooks ---------------------------------------------------------
+
+    def _configure(self):
+        pass
+
+    def _remote_size(self, remote):
+        """Size of remote in bytes, or None when it is only known at the end."""
+        return None
+
+    def _resume_offset(self, remote, total, offset=0):
+        """Where an upload of total bytes should (re)start."""
+        return offset
+
+    def _verify_upload(self, remote, total):
+        pass
+
+    def _get(self, remote, offset, length, sink):
+        """Stream length bytes of remote from offset into sink; returns
+        (bytes received, whether the end of the file was reached)."""
+        raise NotImplementedError
+
+    def _put(self, remote, offset, length, source, total, last):
+        raise NotImplementedError
+
+
+class FTPClient(_Transfer):
+    """Files on an FTP server through the modem's FTP client (AT+QFTP*).
+
+    Segments are AT+QFTPGET/AT+QFTPPUT requests with a start position and
+    length to "COM:", i.e. the data itself crosses the AT port. Uploads
+    resume from the size the server reports for the file.
+    """
+
+    def __init__(self, at, reader, host, port=21, user="anonymous", password="", passive=True, **kwargs):
+        super().__init__(at, reader, **kwargs)
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.passive = passive
+        self._cwd = None
+
+    def _configure(self):
+        self.at.batch(
+            [
+                f"AT+QFTPCFG={setting}"
+                for setting in (
+                    f'"contextid",{self.context_id}',
+                    f'"account","{self.user}","{self.password}"',
+                    '"filetype",0',  # binary
+                    f'"transmode",{1 if self.passive else 0}',
+                    f'"rsptimeout",{min(180, int(self.timeout))}',
+                )
+            ]
+        )
+        fields = self._request(
+            "+QFTPOPEN:", lambda: self.at.command(f'AT+QFTPOPEN="{self.host}",{self.port}')
+        )
+        if fields[0] != "0":
+            raise TransferError(f"Could not log in to {self.host}:{self.port}", fields[-1])
+        self._cwd = None
+
+    def close(self):
+        if self._opened:
+            try:
+                self._request("+QFTPCLOSE:", lambda: self.at.command("AT+QFTPCLOSE"), 30)
+            except TransferError as e:
+                logger.debug(f"AT+QFTPCLOSE: {e}")
+        super().close()
+
+    def _name(self, remote):
+        """Change into remote's directory if needed; returns the file name."""
+        directory, name = posixpath.split(remote)
+        if directory and directory != self._cwd:
+            fields = self._request("+QFTPCWD:", lambda: self.at.command(f'AT+QFTPCWD="{directory}"'))
+            if fields[0] != "0":
+                raise TransferError(f"Cannot change to {directory}", fields[-1], retry=False)
+            self._cwd = directory
+        return name
+
+    def size(self, remote):
+        """Size of remote on the server, or None if it does not exist."""
+        self._ensure_open()
+        name = self._name(remote)
+        fields = self._request("+QFTPSIZE:", lambda: self.at.command(f'AT+QFTPSIZE="{name}"'))
+        return int(fields[1]) if fields[0] == "0" else None
+
+    def _remote_size(self, remote):
+        size = self.size(remote)
+        if size is None:
+            raise TransferError(f"{remote} not found on {self.host}", retry=False)
+        return size
+
+    def _resume_offset(self, remote, total, offset=0):
+        size = self.size(remote) or 0
+        return size if size <= total else 0
+
+    def _verify_upload(self, remote, total):
+        size = self.size(remote)
+        if size != total:
+            raise TransferError(f"{remote} is {size} bytes on the server, expected {total}", retry=False)
+
+    def _get(self, remote, offset, length, sink):
+        name = self._name(remote)
+        cmd = f'AT+QFTPGET="{name}","COM:",{offset},{length}'
+        fields = self._request("+QFTPGET:", lambda: self.at.download(cmd, sink, length, self.timeout))
+        if fields[0] != "0":
+            raise TransferError(f"Download of {remote} failed", fields[-1])
+        received = int(fields[1])
+        if received != length:
+            raise TransferError(f"Short segment from {remote}: {received} of {length} bytes")
+        return received, False
+
+    def _put(self, remote, offset, length, source, total, last):
+        name = self._name(remote)
+        cmd = f'AT+QFTPPUT="{name}","COM:",{offset},{length},{int(last)}'
+        fields = self._request("+QFTPPUT:", lambda: self.at.upload(cmd, source, length, self.timeout))
+        if fields[0] != "0":
+            raise TransferError(f"Upload of {remote} failed", fields[-1])
+        if int(fields[1]) != length:
+            raise TransferError(f"Server took {fields[1]} of {length} bytes for {remote}")
+
+
+class HTTPClient(_Transfer):
+    """Downloads and uploads through the modem's HTTP(S) client (AT+QHTTP*).
+
+    Requests are written in full (AT+QHTTPCFG="requestheader",1) so every
+    segment can carry its own header: downloads are Range GETs, uploads
+    are POSTs with Content-Range. Resuming needs a server that honours
+    these headers; remote is the full URL.
+    """
+
+    def __init__(self, at, reader, headers=None, ssl_context_id=1, **kwargs):
+        super().__init__(at, reader, **kwargs)
+        self.headers = dict(headers or {})
+        self.ssl_context_id = ssl_context_id
+        self._url = None
+
+    def _configure(self):
+        self.at.batch(
+            [
+                f"AT+QHTTPCFG={setting}"
+                for setting in (
+                    f'"contextid",{self.context_id}',
+                    '"requestheader",1',
+                    '"responseheader",0',
+                    f'"sslctxid",{self.ssl_context_id}',
+                )
+            ]
+        )
+        self._url = None
+
+    def _recover(self):
+        self._url = None
+        super()._recover()
+
+    def _set_url(self, url):
+        if url == self._url:
+            return
+        data = url.encode()
+        response = self.at.upload(f"AT+QHTTPURL={len(data)},{min(65535, int(self.timeout))}", data, len(data))
+        if not response.ok:
+            raise TransferError(f"AT+QHTTPURL failed: {response.final or response.status}")
+        self._url = url
+
+    def _head(self, method, url, headers, length=None) -> bytes:
+        parts = urlsplit(url)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {parts.netloc}", "Accept: */*"]
+        lines += [f"{k}: {v}" for k, v in {**self.headers, **headers}.items()]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    def _get(self, url, offset, length, sink):
+        self._set_url(url)
+        seconds = min(65535, int(self.timeout))
+        request = self._head("GET", url, {"Range": f"bytes={offset}-{offset + length - 1}"})
+        cmd = f"AT+QHTTPGET={seconds},{len(request)},{seconds}"
+        fields = self._request("+QHTTPGET:", lambda: self.at.upload(cmd, request, len(request), self.timeout))
+        if fields[0] != "0":
+            raise TransferError(f"GET {url} failed", fields[0])
+        status = int(fields[1])
+        if status == 416:  # offset is at or past the end
+            return 0, True
+        if status == 200 and offset:
+            raise TransferError(f"{url} ignored the Range header; cannot resume", retry=False)
+        if status not in (200, 206):
+            raise TransferError(f"GET {url} returned HTTP {status}", retry=status >= 500)
+        if len(fields) < 3 or not fields[2]:
+            raise TransferError(f"GET {url} returned no Content-Length", retry=False)
+        content_length = int(fields[2])
+        # A 200 carries the whole file in one response; allow time for it
+        timeout = self.timeout * max(1, content_length / self.segment_size)
+        cmd = f"AT+QHTTPREAD={seconds}"
+        fields = self._request(
+            "+QHTTPREAD:", lambda: self.at.download(cmd, sink, content_length, timeout), timeout
+        )
+        if fields[0] != "0":
+            raise TransferError(f"Reading {url} failed", fields[0])
+        return content_length, status == 200 or content_length < length
+
+    def _put(self, url, offset, length, source, total, last):
+        self._set_url(url)
+        seconds = min(65535, int(self.timeout))
+        headers = {"Content-Type": "application/octet-stream"}
+        if offset or not last:
+            headers["Content-Range"] = f"bytes {offset}-{offset + length - 1}/{total}"
+        source.prefix = self._head("POST", url, headers, length)
+        size = len(source.prefix) + length
+        cmd = f"AT+QHTTPPOST={size},{seconds},{seconds}"
+        fields = self._request("+QHTTPPOST:", lambda: self.at.upload(cmd, source, size, self.timeout))
+        if fields[0] != "0":
+            raise TransferError(f"POST {url} failed", fields[0])
+        status = int(fields[1])
+        if status not in (200, 201, 204, 206, 308):
+            raise TransferError(f"POST {url} returned HTTP {status}", retry=status >= 500)
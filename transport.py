@@ -0,0 +1,244 @@
+import errno
+import fcntl
+import os
+import select
+import termios
+import time
+import tty
+import logging
+
+logger = logging.getLogger(__name__)
+
+BAUDRATES = {
+    9600: termios.B9600,
+    19200: termios.B19200,
+    38400: termios.B38400,
+    57600: termios.B57600,
+    115200: termios.B115200,
+    230400: termios.B230400,
+    460800: getattr(termios, "B460800", None),
+    921600: getattr(termios, "B921600", None),
+}
+
+
+class ReceiveBuffer:
+    """Preallocated receive buffer.
+
+    Data is read straight into the free tail with readv (no intermediate
+    bytes objects), lines and prompts are located with bytearray.find on
+    index ranges, and consumers get memoryview slices. Unconsumed bytes are
+    moved to the front only when the tail runs out, which keeps the copy
+    cost proportional to partial lines rather than to throughput. Views
+    handed out are valid until the next fill().
+    """
+
+    def __init__(self, size=65536):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _compact(self):
+        pending = self.end - self.start
+        if self.start:
+            self._buf[:pending] = bytes(self._view[self.start : self.end])
+            self.start, self.end = 0, pending
+        if self.end == len(self._buf):
+            # One line longer than the whole buffer: grow it
+            self._view.release()
+            self._buf.extend(bytes(len(self._buf)))
+            self._view = memoryview(self._buf)
+
+    def fill(self, fd) -> int:
+        """Read what the fd has into the buffer; returns the byte count."""
+        if self.end == len(self._buf):
+            self._compact()
+        try:
+            n = os.readv(fd, [self._view[self.end :]])
+        except BlockingIOError:
+            return 0
+        self.end += n
+        return n
+
+    def find(self, sep=b"\n"):
+        return self._buf.find(sep, self.start, self.end)
+
+    def lines(self):
+        """Yield each complete line (without the newline) as a memoryview."""
+        while True:
+            idx = self._buf.find(b"\n", self.start, self.end)
+            if idx < 0:
+                break
+            line = self._view[self.start : idx]
+            self.start = idx + 1
+            yield line
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def peek(self):
+        return self._view[self.start : self.end]
+
+    def consume(self, n):
+        self.start = min(self.end, self.start + n)
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def take(self, n) -> bytes:
+        data = bytes(self._view[self.start : self.start + n])
+        self.consume(len(data))
+        return data
+
+
+class RawTransport:
+    """Serial transport on a raw termios fd driven by epoll.
+
+    Exposes the subset of the pyserial API used in this package (read,
+    write, in_waiting, readline, fileno, timeout, close) plus read_lines()
+    for zero-copy line framing.
+    """
+
+    def __init__(self, port, baudrate=115200, timeout=5, exclusive=True, buffer_size=65536):
+        speed = BAUDRATES.get(baudrate)
+        if speed is None:
+            raise ValueError(f"Unsupported baudrate {baudrate}")
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.buffer = ReceiveBuffer(buffer_size)
+        self.fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            if exclusive:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                try:
+                    fcntl.ioctl(self.fd, termios.TIOCEXCL)
+                except OSError:
+                    pass
+            self._configure(speed)
+            self._epoll = select.epoll()
+            self._epoll.register(self.fd, select.EPOLLIN)
+        except Exception:
+            os.close(self.fd)
+            self.fd = None
+            raise
+
+    def _configure(self, speed):
+        tty.setraw(self.fd)
+        attrs = termios.tcgetattr(self.fd)
+        attrs[2] |= termios.CLOCAL | termios.CREAD
+        attrs[2] &= ~termios.CRTSCTS
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+
+    @property
+    def is_open(self) -> bool:
+        return self.fd is not None
+
+    def fileno(self):
+        return self.fd
+
+    def wait(self, timeout) -> bool:
+        """Block until the fd is readable or timeout passes."""
+        try:
+            return bool(self._epoll.poll(timeout if timeout is not None else -1))
+        except InterruptedError:
+            return False
+
+    def fill(self, timeout):
+        """Wait up to timeout and read whatever arrived into the buffer."""
+        if self.wait(timeout):
+            if self.buffer.fill(self.fd) == 0:
+                # Readable but nothing read: the device went away (hangup)
+                raise OSError(errno.EIO, f"{self.port} closed")
+
+    # --- line-oriented API ----------------------------------------------------
+
+    def read_lines(self, timeout):
+        """Yield complete lines as memoryviews; waits up to timeout for data
+        when no complete line is buffered yet. Lines are consumed as they are
+        yielded, so a caller that stops early leaves the rest in the buffer."""
+        if self.buffer.find() < 0:
+            self.fill(timeout)
+        return self.buffer.lines()
+
+    def peek(self):
+        return self.buffer.peek()
+
+    def consume(self, n):
+        self.buffer.consume(n)
+
+    # --- pyserial-compatible API --------------------------------------------
+
+    @property
+    def in_waiting(self) -> int:
+        if not len(self.buffer) and self.wait(0):
+            self.buffer.fill(self.fd)
+        return len(self.buffer)
+
+    def read(self, size=1) -> bytes:
+        deadline = time.monotonic() + (self.timeout or 0)
+        while len(self.buffer) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.fill(remaining)
+        return self.buffer.take(size)
+
+    def read_all(self) -> bytes:
+        self.in_waiting
+        return self.buffer.take(len(self.buffer))
+
+    def readline(self) -> bytes:
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            idx = self.buffer.find()
+            if idx >= 0:
+                return self.buffer.take(idx - self.buffer.start + 1)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return self.buffer.take(len(self.buffer))
+            self.fill(remaining)
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        total = len(view)
+        while view:
+            try:
+                n = os.write(self.fd, view)
+                view = view[n:]
+            except BlockingIOError:
+                select.select([], [self.fd], [], self.timeout)
+        return total
+
+    def reset_input_buffer(self):
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+        self.buffer.consume(len(self.buffer))
+
+    def close(self):
+        if self.fd is None:
+            return
+        self._epoll.close()
+        try:
+            fcntl.ioctl(self.fd, termios.TIOCNXCL)
+        except OSError:
+            pass
+        os.close(self.fd)
+        self.fd = None
+
+
+def open_port(port, baudrate=115200, timeout=5, transport="auto", exclusive=False):
+    """Open port with RawTransport, falling back to pyserial when transport
+    is "auto" and the raw path is not usable."""
+    if transport in ("auto", "raw"):
+        try:
+            return RawTransport(port, baudrate, timeout, exclusive=exclusive)
+        except (OSError, ValueError, termios.error) as e:
+            if transport == "raw":
+                raise
+            logger.info(f"Raw transport unavailable for {port} ({e}); using pyserial.")
+    import serial
+
+    return serial.Serial(port=port, baudrate=baudrate, timeout=timeout, exclusive=exclusive or None)